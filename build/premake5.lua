@@ -52,6 +52,7 @@ workspace "Investickgator"
     files {root_dir.."src/**.h",
            root_dir.."src/**.c",
            root_dir.."src/config/ivconfig.h",
+           root_dir.."src/config/ivbuildinfo_volatile.c",
 
     }
 
@@ -96,6 +97,9 @@ workspace "Investickgator"
       links {'SDL2'}
     filter "system:linux"
       links {"dl", "pthread"}
+      -- make_dist bundles non-system shared libs next to the exe.
+      -- $$ is make's escape for $
+      linkoptions {"-Wl,-rpath,'$$ORIGIN'", "-Wl,--enable-new-dtags"}
     filter "system:windows"
       links {"SDL2main"}
     filter "system:macosx"
@@ -0,0 +1,28 @@
+/*
+ * InveSTICKgator Copyright (C) 2016 Frogtoss Games, Inc
+ * 
+ */
+
+// This file contains the build-specific values that change on every
+// build, when tools/tag_tree.py --volatile-c-file splits them out of
+// ivbuildinfo.h.  Only one small object then recompiles per build.
+//
+// The checked-in ivbuildinfo.h defines them itself, and this file
+// compiles to nothing.
+// 
+// This file should be regenerated by a build server.
+
+#include "ivbuildinfo.h"
+
+#ifdef IVBUILDINFO_VOLATILE
+
+// name of the machine that compiled the build.
+const char BUILDERNAME[] = "(local build)";
+
+// unique build event number from builder.  
+const unsigned int BUILDNUMBER = 0;
+
+// Build timestamp string
+const char BUILD_TIMESTAMP[] = "Tue 01/01/1900  00:00:00.00";
+
+#endif
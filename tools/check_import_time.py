@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2016 Frogtoss Games, Inc.
+#
+
+"""Check that the tools/ entry points import quickly.
+
+Each entry point is imported in a fresh interpreter under
+python -X importtime, a few times, keeping the fastest run.  It fails
+if an entry point goes over its budget or loads a module it is
+supposed to defer until a code path needs it.
+
+Exits non-zero on any failure, so it can gate a build.
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+from os.path import join as path_join
+
+TOOLS_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# (module, dir it is imported from, budget in ms, modules it must not
+# load at import time)
+ENTRY_POINTS = (
+    ('lazyicon',     TOOLS_DIR,                     40,
+     ('PIL', 'concurrent.futures')),
+    ('dist_tool',    TOOLS_DIR,                     30,
+     ('dist_delta', 'dist_manifest', 'apple_bundle', 'lzma', 'tarfile')),
+    ('tag_tree',     TOOLS_DIR,                     40,
+     ('subprocess',)),
+    ('ivbuild',      TOOLS_DIR,                     40,
+     ('task_graph', 'file_watch', 'subprocess', 'concurrent.futures')),
+    ('make_dist',    path_join(TOOLS_DIR, 'pylib'), 40,
+     ('tempfile', 'apple_bundle', 'dist_manifest', 'dist_delta',
+      'elf_deps', 'concurrent.futures')),
+    ('vendor_build', path_join(TOOLS_DIR, 'pylib'), 40,
+     ('optparse', 'tempfile')),
+)
+
+def do_args():
+    parser = argparse.ArgumentParser(description="check tools/ import times")
+    parser.add_argument('-n', '--runs', type=int, default=5,
+                        help='imports per entry point; the fastest counts '
+                        '(default 5)')
+    parser.add_argument('-v', '--verbose', action='store_true', default=False,
+                        help='list the slowest modules each entry point loads')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiply every budget, for slow machines')
+    args = parser.parse_args()
+    if args.runs < 1:
+        parser.error("-n/--runs must be at least 1")
+    return args
+
+def measure_import(module, import_dir):
+    """
+    Import module from import_dir in a new interpreter.
+
+    returns a dict of every module loaded while importing it, to
+    (self us, cumulative us).
+    """
+    # -c with cwd first on sys.path, as when the tool is run from there
+    cmd = [sys.executable, '-X', 'importtime', '-c',
+           'import sys; sys.path.insert(0, %r); import %s' % \
+           (import_dir, module)]
+
+    env = dict(os.environ)
+    # without cached bytecode every run would time the compiler
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+    po = subprocess.run(cmd, cwd=import_dir, env=env,
+                        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if po.returncode != 0:
+        print(po.stderr.decode('utf-8', 'replace'), file=sys.stderr)
+        print("importing %s failed" % module, file=sys.stderr)
+        sys.exit(1)
+
+    # import time: self [us] | cumulative | imported package
+    #
+    # A module's line follows the lines of everything it imported,
+    # indented two spaces per level.  Interpreter startup imports are
+    # separate top level entries before the entry point's.
+    loaded = {}
+    for line in po.stderr.decode('utf-8', 'replace').splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        loaded[name] = (int(fields[0]), int(fields[1]))
+
+        top_level = fields[2].startswith(' ') and fields[2][1] != ' '
+        if top_level:
+            if name == module:
+                return loaded
+            loaded = {}
+
+    print("%s not found in -X importtime output" % module, file=sys.stderr)
+    sys.exit(1)
+
+def check_entry_point(module, import_dir, budget_ms, deferred, args):
+    """returns a list of failure strings"""
+    best = None
+    for i in range(args.runs):
+        loaded = measure_import(module, import_dir)
+        if best == None or loaded[module][1] < best[module][1]:
+            best = loaded
+
+    budget_ms *= args.scale
+    total_ms = best[module][1] / 1000.0
+    print("%-14s %7.1fms  (budget %.1fms)" % (module, total_ms, budget_ms))
+
+    if args.verbose:
+        slowest = sorted(best.items(), key=lambda item: -item[1][0])[:8]
+        for name, (self_us, cumulative_us) in slowest:
+            print("\t%7.1fms  %s" % (self_us / 1000.0, name))
+
+    failures = []
+    if total_ms > budget_ms:
+        failures.append("%s: import took %.1fms, budget is %.1fms" % \
+                        (module, total_ms, budget_ms))
+    for name in deferred:
+        if name in best:
+            failures.append("%s: imports %s at load time" % (module, name))
+    return failures
+
+
+if __name__ == '__main__':
+    args = do_args()
+
+    failures = []
+    for module, import_dir, budget_ms, deferred in ENTRY_POINTS:
+        # one untimed import writes any stale bytecode
+        measure_import(module, import_dir)
+        failures += check_entry_point(module, import_dir, budget_ms,
+                                      deferred, args)
+
+    for failure in failures:
+        print("FAIL " + failure, file=sys.stderr)
+    sys.exit(1 if len(failures) != 0 else 0)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2016 Frogtoss Games, Inc.
+#
+
+"""Build twice in reproducible mode and compare the results.
+
+Each run copies what the build reads into its own dir, generates the
+buildinfo files there, rebuilds the app from scratch with source paths
+remapped (unless --skip-app, which packages the existing exe), and
+packages it with build_dist.py --reproducible.  The real tree is only
+read.  Runs are spaced more than a second apart and built at different
+paths, so wall clock and path leaks show up.  Every output must hash
+the same in both runs.
+
+SOURCE_DATE_EPOCH defaults to the time of the HEAD commit.
+
+Linux only; the win32 and darwin installers are not reproducible yet.
+Exits non-zero if any output differs.
+"""
+
+import os
+import sys
+import time
+import hashlib
+import argparse
+import tempfile
+import subprocess
+
+from os.path import join as path_join
+
+TOOLS_DIR = os.path.dirname(os.path.realpath(__file__))
+PROJECT_ROOT = os.path.abspath(path_join(TOOLS_DIR, '..'))
+
+def do_args():
+    parser = argparse.ArgumentParser(description="check that two builds match")
+    parser.add_argument('--skip-app', action='store_true', default=False,
+                        help='package the existing exe instead of rebuilding it')
+    parser.add_argument('--config', default='release_x64',
+                        help='gmake_linux config to build (default release_x64)')
+    parser.add_argument('--split-debug', action='store_true', default=False,
+                        help='also check the symbol archive')
+    parser.add_argument('-k', '--keep', action='store_true', default=False,
+                        help='keep the output of both runs')
+    args = parser.parse_args()
+
+    if sys.platform != 'linux':
+        parser.error("reproducible dist builds are linux only")
+    return args
+
+def get_source_date_epoch():
+    if 'SOURCE_DATE_EPOCH' in os.environ:
+        return os.environ['SOURCE_DATE_EPOCH']
+    try:
+        out = subprocess.check_output(['git', 'log', '-1', '--format=%ct'],
+                                      cwd=PROJECT_ROOT)
+    except (OSError, subprocess.CalledProcessError):
+        print("set SOURCE_DATE_EPOCH; git could not date HEAD", file=sys.stderr)
+        sys.exit(1)
+    return out.decode('utf-8').strip()
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(1024 * 1024)
+            if not buf:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+def _run(cmd, cwd, env):
+    print(' '.join(cmd))
+    po = subprocess.run(cmd, cwd=cwd, env=env,
+                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    if po.returncode != 0:
+        print(po.stdout.decode('utf-8', 'replace'), file=sys.stderr)
+        print("failed: %s" % ' '.join(cmd), file=sys.stderr)
+        sys.exit(1)
+
+# what a build reads, relative to the project root
+TREE_PATHS = ('VERSION', 'src', 'tools', 'vendors/include', 'vendors/lib',
+              path_join('build', 'dist'), path_join('build', 'gmake_linux'))
+
+def copy_tree(tree_dir, skip_app):
+    """
+    copy TREE_PATHS into tree_dir, leaving out build products; the
+    exe too unless skip_app, so it is rebuilt
+    """
+    import shutil
+
+    def ignore(dirpath, names):
+        skip = shutil.ignore_patterns('__pycache__', '*.pyc', '*.tar.gz*',
+                                      'obj')(dirpath, names)
+        if not skip_app and os.path.basename(dirpath) == 'gmake_linux':
+            skip.add('bin')
+        return skip
+
+    for rel in TREE_PATHS:
+        src = path_join(PROJECT_ROOT, rel)
+        dst = path_join(tree_dir, rel)
+        if os.path.isdir(src):
+            shutil.copytree(src, dst, ignore=ignore)
+        else:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(src, dst)
+
+def build_once(run_dir, args, env):
+    """
+    Run every reproducible step in a copy of the tree under run_dir.
+    Returns a dict of output name to sha256.
+    """
+    hashes = {}
+    tree_dir = path_join(run_dir, 'tree')
+    copy_tree(tree_dir, args.skip_app)
+    tools_dir = path_join(tree_dir, 'tools')
+
+    # tag_tree.py reads .git, which isn't copied
+    config_dir = path_join(tree_dir, 'src', 'config')
+    header_path = path_join(config_dir, 'ivbuildinfo.h')
+    volatile_path = path_join(config_dir, 'ivbuildinfo_volatile.c')
+    _run([sys.executable, 'tag_tree.py',
+          '--buildername', 'reproducible', '--buildnumber', '0',
+          '--output-filename', header_path,
+          '--volatile-c-file', volatile_path], TOOLS_DIR, env)
+    hashes['ivbuildinfo.h'] = hash_file(header_path)
+    hashes['ivbuildinfo_volatile.c'] = hash_file(volatile_path)
+
+    if not args.skip_app:
+        make_dir = path_join(tree_dir, 'build', 'gmake_linux')
+        make_env = dict(env)
+        make_env['CFLAGS'] = (env.get('CFLAGS', '') + \
+                              ' -ffile-prefix-map=%s=.' % tree_dir).strip()
+        _run(['make', 'config=' + args.config], make_dir, make_env)
+
+    dist_dir = path_join(run_dir, 'dist')
+    cmd = [sys.executable, 'build_dist.py', '--reproducible', '--force',
+           '-o', dist_dir]
+    if args.split_debug:
+        cmd.append('--split-debug')
+    _run(cmd, tools_dir, env)
+
+    for filename in sorted(os.listdir(dist_dir)):
+        hashes['dist/' + filename] = hash_file(path_join(dist_dir, filename))
+    return hashes
+
+def explain_archive_diff(run_dirs, name):
+    """print the members that differ, from the two manifests"""
+    import json
+
+    manifests = []
+    for run_dir in run_dirs:
+        manifest_path = path_join(run_dir, name + '.manifest.json')
+        if not os.path.isfile(manifest_path):
+            return
+        with open(manifest_path, 'rt') as f:
+            members = json.load(f)['members']
+        manifests.append({m['path']: m['sha256'] for m in members})
+
+    for path in sorted(set(manifests[0]) | set(manifests[1])):
+        if manifests[0].get(path) != manifests[1].get(path):
+            print("\t\tmember differs: %s" % path)
+
+
+if __name__ == '__main__':
+    args = do_args()
+
+    env = dict(os.environ)
+    env['SOURCE_DATE_EPOCH'] = get_source_date_epoch()
+    print("SOURCE_DATE_EPOCH=%s" % env['SOURCE_DATE_EPOCH'])
+
+    work_dir = tempfile.mkdtemp(suffix='_reproducible')
+    run_dirs = [path_join(work_dir, 'run1'), path_join(work_dir, 'run2')]
+
+    results = []
+    for i, run_dir in enumerate(run_dirs):
+        if i != 0:
+            time.sleep(1.1)
+        results.append(build_once(run_dir, args, env))
+
+    different = 0
+    print()
+    for name in sorted(set(results[0]) | set(results[1])):
+        a = results[0].get(name)
+        b = results[1].get(name)
+        if a == b:
+            print("\tsame       %s  %s" % (a[:16], name))
+            continue
+        different += 1
+        print("\tDIFFERENT  %s" % name)
+        if name.endswith('.tar.gz'):
+            explain_archive_diff([path_join(d, 'dist') for d in run_dirs],
+                                 os.path.basename(name))
+
+    if args.keep:
+        print("outputs kept in %s" % work_dir)
+    else:
+        import shutil
+        shutil.rmtree(work_dir)
+
+    if different != 0:
+        print("%d of %d outputs differ" % (different, len(results[0])),
+              file=sys.stderr)
+        sys.exit(1)
+    print("all %d outputs match" % len(results[0]))
+    sys.exit(0)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2016 Frogtoss Games, Inc.
+#
+
+"""Work with distributed archives made by build_dist.py.
+
+  apply:  rebuild a new release archive from an old one and a delta.
+          Its tar stream is verified; the gzip bytes are not the
+          released archive's, so check it with verify, not by sha256
+  verify-delta:  check that a delta turns an old archive into a new one
+  verify:  check an archive or installed tree against its manifest
+  bundle:  write or update a macOS .app bundle, on any platform
+"""
+
+import sys
+import os.path
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                             'pylib'))
+
+# keep in sync with dist_manifest.MANIFEST_SUFFIX; not imported so
+# that --help stays fast
+MANIFEST_SUFFIX = '.manifest.json'
+
+def do_args():
+    parser = argparse.ArgumentParser(description="work with dist archives")
+    sub = parser.add_subparsers(dest='action')
+
+    p = sub.add_parser('apply', help='apply a delta to an old release '
+                       'archive.  The rebuilt tar stream is checked '
+                       'against the delta; the .tar.gz is recompressed, so '
+                       'its sha256 differs from the released one and the '
+                       'manifest (verify checks its members instead)')
+    p.add_argument('old_archive', help='previous release .tar.gz')
+    p.add_argument('delta', help='.ivdelta file')
+    p.add_argument('-o', '--output-file', required=True,
+                   help='rebuilt .tar.gz to write')
+
+    p = sub.add_parser('verify-delta',
+                       help='check a delta against both release archives')
+    p.add_argument('old_archive', help='previous release .tar.gz')
+    p.add_argument('delta', help='.ivdelta file')
+    p.add_argument('new_archive', help='new release .tar.gz')
+
+    p = sub.add_parser('verify',
+                       help='check an archive or installed tree against '
+                       'its manifest, stopping at the first mismatch')
+    p.add_argument('target', help='archive file or installed directory')
+    p.add_argument('-m', '--manifest',
+                   help='manifest file (default <archive>%s)' % \
+                   MANIFEST_SUFFIX)
+
+    # keep in sync with apple_bundle.LINK_MODES and PLIST_FORMATS
+    p = sub.add_parser('bundle',
+                       help='write or update a macOS .app bundle, copying '
+                       'only members that changed')
+    p.add_argument('app_name', help='user-visible app name')
+    p.add_argument('exe', help='executable to bundle')
+    p.add_argument('icon', help='.icns file')
+    p.add_argument('-o', '--output-dir', required=True,
+                   help='dir the .app is written into')
+    p.add_argument('--version', dest='version_str', default=None,
+                   help='bundle version (default: contents of ../VERSION)')
+    p.add_argument('--link', dest='link_mode', default='copy',
+                   choices=('copy', 'hardlink', 'reflink'),
+                   help='how members are put in the bundle (default copy)')
+    p.add_argument('--plist', dest='plist_format', default='xml',
+                   choices=('xml', 'binary'),
+                   help='Info.plist format (default xml)')
+
+    args = parser.parse_args()
+    if args.action is None:
+        parser.error("an action is required")
+
+    if args.action == 'bundle':
+        for path in (args.exe, args.icon):
+            if not os.path.isfile(path):
+                parser.error("%s does not exist" % path)
+        if args.version_str is None:
+            version_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                        '..', 'VERSION')
+            with open(version_path, 'rt') as f:
+                args.version_str = f.read().strip()
+        return args
+
+    if args.action == 'verify':
+        if not os.path.exists(args.target):
+            parser.error("%s does not exist" % args.target)
+        if args.manifest is None:
+            if os.path.isdir(args.target):
+                parser.error("-m/--manifest is required to verify a directory")
+            args.manifest = args.target + MANIFEST_SUFFIX
+        if not os.path.isfile(args.manifest):
+            parser.error("%s does not exist" % args.manifest)
+        return args
+
+    for path in (args.old_archive, args.delta):
+        if not os.path.isfile(path):
+            parser.error("%s does not exist" % path)
+
+    return args
+
+def action_apply(args):
+    import dist_delta
+
+    try:
+        dist_delta.apply_delta(args.old_archive, args.delta, args.output_file)
+    except dist_delta.DeltaError as e:
+        print("apply failed: %s" % e.message, file=sys.stderr)
+        return 1
+
+    print("wrote %s (tar stream verified; recompressed, so check it "
+          "with verify, not by sha256)" % args.output_file)
+    return 0
+
+def action_verify_delta(args):
+    import dist_delta
+
+    try:
+        ok = dist_delta.verify_delta(args.old_archive, args.delta,
+                                     args.new_archive)
+    except dist_delta.DeltaError as e:
+        print("verify failed: %s" % e.message, file=sys.stderr)
+        return 1
+
+    if not ok:
+        print("%s does not turn %s into %s" % \
+              (args.delta, args.old_archive, args.new_archive), file=sys.stderr)
+        return 1
+
+    print("ok")
+    return 0
+
+def action_verify(args):
+    import dist_manifest
+
+    manifest = dist_manifest.read_manifest(args.manifest)
+    if os.path.isdir(args.target):
+        error = dist_manifest.verify_tree(manifest, args.target)
+    else:
+        error = dist_manifest.verify_archive(manifest, args.target)
+
+    if error is not None:
+        print("verify failed: %s" % error, file=sys.stderr)
+        return 1
+
+    print("ok: %d members" % len(manifest['members']))
+    return 0
+
+def action_bundle(args):
+    from apple_bundle import AppleBundle
+
+    ab = AppleBundle(args.app_name, args.exe, args.icon, args.version_str)
+    try:
+        changed = ab.write(args.output_dir, link_mode=args.link_mode,
+                           plist_format=args.plist_format)
+    except OSError as e:
+        print("bundle failed: %s" % e, file=sys.stderr)
+        return 1
+
+    for path in changed:
+        print("\tupdated " + path)
+    print("%s.app: %d members updated" % (args.app_name, len(changed)))
+    return 0
+
+
+if __name__ == '__main__':
+    args = do_args()
+
+    if args.action == 'apply':
+        sys.exit(action_apply(args))
+    elif args.action == 'verify-delta':
+        sys.exit(action_verify_delta(args))
+    elif args.action == 'verify':
+        sys.exit(action_verify(args))
+    elif args.action == 'bundle':
+        sys.exit(action_bundle(args))
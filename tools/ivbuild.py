@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2016 Frogtoss Games, Inc.
+#
+
+"""Build everything from one place.
+
+Runs the release pipeline as a graph of tasks:
+
+  vendor:SDL2, vendor:glew  vendors/compile_all_vendors.py, per vendor
+  buildinfo                 tag_tree.py, writing src/config/ivbuildinfo.h
+                            and ivbuildinfo_volatile.c
+  app                       make in build/gmake_<os>
+  icon                      lazyicon.py, into the cache build_dist.py uses
+  dist                      build_dist.py
+
+Independent tasks run in parallel.  A task whose inputs have the same
+stat() fingerprint as after its last successful run, and whose outputs
+exist, is skipped, so a run with nothing to do only walks the tree.
+
+--watch builds, then rebuilds whenever a source changes, running only
+the tasks the changed paths feed, and reports the time from the change
+to a ready binary.
+
+Linux and macOS only; on Windows use the vs2015 solution.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from os.path import join as path_join
+
+TOOLS_DIR = os.path.dirname(os.path.realpath(__file__))
+PROJECT_ROOT = os.path.abspath(path_join(TOOLS_DIR, '..'))
+
+sys.path.append(path_join(TOOLS_DIR, 'pylib'))
+
+# keep in sync with vendors/compile_all_vendors.py
+VENDORS = ('SDL2', 'glew')
+
+# what each vendorcompile.py copies into vendors/lib/<arch>
+VENDOR_LIBS = {
+    'SDL2': ('libSDL2.a', 'libSDL2main.a'),
+    'glew': ('libGLEW.a',),
+}
+
+DEFAULT_TARGET = 'dist'
+DEFAULT_WATCH_TARGET = 'app'
+
+# loaded once by --watch; edits to them need a restart
+WATCH_SELF = ('tools/ivbuild.py', 'tools/pylib/task_graph.py',
+              'tools/pylib/file_watch.py')
+
+# never watched: editor droppings and build byproducts
+WATCH_EXCLUDES = ('.git', '__pycache__', '*.pyc', '*~', '.#*', '*.swp',
+                  '*.swx', '4913', '*.o', '*.lo', '*.d', '.libs', '.deps')
+
+def do_args():
+    parser = argparse.ArgumentParser(description="build the app and its dist")
+    parser.add_argument('targets', nargs='*', metavar='TASK',
+                        help='tasks to bring up to date, with everything they '
+                        'depend on (default %s, or %s with --watch)' % \
+                        (DEFAULT_TARGET, DEFAULT_WATCH_TARGET))
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='tasks to run at once, also passed to make '
+                        '(default %d)' % os.cpu_count())
+    parser.add_argument('--config', default='release_x64',
+                        help='gmake config to build (default release_x64)')
+    parser.add_argument('-o', '--output-dir', default=TOOLS_DIR,
+                        help='dir for the dist archive (default %s, as '
+                        'build_dist.py)' % TOOLS_DIR)
+    parser.add_argument('--skip-vendors', action='store_true', default=False,
+                        help='link against the vendor libs already built')
+    parser.add_argument('-f', '--force', action='append', default=[],
+                        metavar='TASK',
+                        help='run TASK even if it is up to date; "all" runs '
+                        'every task.  May be repeated')
+    parser.add_argument('-n', '--dry-run', action='store_true', default=False,
+                        help='show what would run')
+    parser.add_argument('-l', '--list', action='store_true', default=False,
+                        help='list the tasks and their dependencies')
+    parser.add_argument('-v', '--verbose', action='store_true', default=False,
+                        help='show the output of every task, not just '
+                        'failed ones')
+    parser.add_argument('--buildername', default=None,
+                        help='for buildinfo (default: this host\'s name)')
+    parser.add_argument('--buildnumber', type=int, default=0,
+                        help='for buildinfo (default 0)')
+    parser.add_argument('--reproducible', action='store_true', default=False,
+                        help='build vendors and dist in reproducible mode; '
+                        'needs SOURCE_DATE_EPOCH')
+    parser.add_argument('--split-debug', action='store_true', default=False,
+                        help='passed to build_dist.py')
+    parser.add_argument('-w', '--watch', action='store_true', default=False,
+                        help='rebuild whenever a source changes')
+    parser.add_argument('--poll', action='store_true', default=False,
+                        help='with --watch: poll instead of using inotify')
+    parser.add_argument('--debounce', type=int, default=100, metavar='MS',
+                        help='with --watch: wait for MS of quiet after a '
+                        'change before building (default 100)')
+    args = parser.parse_args()
+
+    if sys.platform not in ('linux', 'darwin'):
+        parser.error("ivbuild.py builds with gmake; linux and macOS only")
+    if args.jobs < 1:
+        parser.error("-j/--jobs must be at least 1")
+    if '_' not in args.config:
+        parser.error("--config is <debug|release>_<arch>, e.g. release_x64")
+    if args.reproducible and 'SOURCE_DATE_EPOCH' not in os.environ:
+        parser.error("--reproducible needs SOURCE_DATE_EPOCH")
+    if args.buildername is None:
+        import socket
+        args.buildername = socket.gethostname()
+    if len(args.targets) == 0:
+        args.targets = [DEFAULT_WATCH_TARGET if args.watch else DEFAULT_TARGET]
+    args.output_dir = os.path.abspath(args.output_dir)
+    return args
+
+def get_state_path():
+    """per checkout, under the dist tooling cache"""
+    import hashlib
+    from ivcache import get_cache_dir
+
+    root_digest = hashlib.sha256(PROJECT_ROOT.encode('utf-8')).hexdigest()
+    return path_join(get_cache_dir(), 'ivbuild', root_digest[:16] + '.json')
+
+def run_tool(cmd, cwd, verbose, env=None):
+    """run cmd, raising TaskError with its output if it fails"""
+    import subprocess
+    from task_graph import TaskError
+
+    if env is None:
+        env = dict(os.environ)
+    po = subprocess.run(cmd, cwd=cwd, env=env,
+                        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = po.stdout.decode('utf-8', 'replace')
+    if verbose or po.returncode != 0:
+        print(output)
+    if po.returncode != 0:
+        raise TaskError("%s exited with %d" % (' '.join(cmd), po.returncode))
+
+def gmake_dir():
+    return path_join(PROJECT_ROOT, 'build',
+                     'gmake_macosx' if sys.platform == 'darwin' else 'gmake_linux')
+
+def app_exe_path(config):
+    """the exe iv.make links for config, e.g. release_x64"""
+    build_type, arch = config.split('_', 1)
+    suffix = '_d' if build_type == 'debug' else ''
+    return path_join(gmake_dir(), 'bin', build_type.capitalize(), arch,
+                     'iv' + suffix)
+
+def _git_inputs():
+    """the files tag_tree.py reads to find HEAD"""
+    git_path = path_join(PROJECT_ROOT, '.git')
+    if not os.path.isdir(git_path):
+        # worktree or submodule: the gitdir file at least
+        return [git_path]
+    return [path_join(git_path, name) for name in
+            ('HEAD', 'packed-refs', path_join('refs', 'heads'))]
+
+def make_graph(args):
+    from task_graph import Task, TaskGraph
+
+    graph = TaskGraph(get_state_path())
+    arch = args.config.split('_', 1)[1]
+    vendor_lib_dir = path_join(PROJECT_ROOT, 'vendors', 'lib', arch)
+    vendor_tasks = []
+
+    if not args.skip_vendors:
+        for vendor in VENDORS:
+            def build_vendor(task, vendor=vendor):
+                cmd = [sys.executable, 'vendorcompile.py',
+                       '--platform', 'Darwin' if sys.platform == 'darwin' else 'Linux',
+                       '--action', 'build', '--arch', arch]
+                if args.reproducible:
+                    cmd.append('--reproducible')
+                env = dict(os.environ)
+                env['IVROOT'] = PROJECT_ROOT
+                run_tool(cmd, path_join(PROJECT_ROOT, 'vendors', vendor),
+                         args.verbose, env)
+
+            # configure and make run in the vendor's tree
+            name = 'vendor:' + vendor
+            graph.add(Task(name, build_vendor,
+                           inputs=[path_join(PROJECT_ROOT, 'vendors', vendor),
+                                   path_join(TOOLS_DIR, 'pylib', 'vendor_build.py')],
+                           outputs=[path_join(vendor_lib_dir, lib)
+                                    for lib in VENDOR_LIBS[vendor]],
+                           key='%s %s' % (arch, args.reproducible),
+                           writes_inputs=True))
+            vendor_tasks.append(name)
+
+    header_path = path_join(PROJECT_ROOT, 'src', 'config', 'ivbuildinfo.h')
+    volatile_path = path_join(PROJECT_ROOT, 'src', 'config',
+                              'ivbuildinfo_volatile.c')
+    def build_buildinfo(task):
+        run_tool([sys.executable, 'tag_tree.py',
+                  '--buildername', args.buildername,
+                  '--buildnumber', str(args.buildnumber),
+                  '--output-filename', header_path,
+                  '--volatile-c-file', volatile_path], TOOLS_DIR, args.verbose)
+
+    # the timestamp alone doesn't make the header stale.  The build
+    # number, name and time go in the .c, so a new build number
+    # recompiles one small file instead of everything including the header
+    graph.add(Task('buildinfo', build_buildinfo,
+                   inputs=[path_join(PROJECT_ROOT, 'VERSION'),
+                           path_join(TOOLS_DIR, 'tag_tree.py')] + _git_inputs(),
+                   outputs=[header_path, volatile_path],
+                   key='%s %d %s' % (args.buildername, args.buildnumber,
+                                     os.environ.get('SOURCE_DATE_EPOCH'))))
+
+    exe_path = app_exe_path(args.config)
+    def build_app(task):
+        run_tool(['make', 'config=' + args.config, '-j%d' % args.jobs],
+                 gmake_dir(), args.verbose)
+
+    graph.add(Task('app', build_app,
+                   inputs=[path_join(PROJECT_ROOT, 'src'),
+                           path_join(gmake_dir(), 'Makefile'),
+                           path_join(gmake_dir(), 'iv.make'),
+                           vendor_lib_dir,
+                           path_join(PROJECT_ROOT, 'vendors', 'include')],
+                   outputs=[exe_path],
+                   deps=vendor_tasks + ['buildinfo'],
+                   key=args.config))
+
+    # the same icon generate_icon() would make for the platform's
+    # dist, built ahead so build_dist.py finds it in the icon cache.
+    # Only the mac dist has an icon
+    icon_path = path_join(os.path.dirname(get_state_path()), 'icon',
+                          'investickgator.icns')
+    icon_src = path_join(PROJECT_ROOT, 'build', 'dist', 'icon_src')
+    def build_icon(task):
+        from make_dist import generate_icon
+
+        os.makedirs(os.path.dirname(icon_path), exist_ok=True)
+        generate_icon(icon_src, 'darwin', icon_path, args.jobs)
+
+    graph.add(Task('icon', build_icon,
+                   inputs=[icon_src, path_join(TOOLS_DIR, 'lazyicon.py')],
+                   outputs=[icon_path]))
+
+    def build_dist(task):
+        cmd = [sys.executable, 'build_dist.py', '-o', args.output_dir,
+               '-A', arch, '-j', str(args.jobs)]
+        if args.reproducible:
+            cmd.append('--reproducible')
+        if args.split_debug:
+            cmd.append('--split-debug')
+        run_tool(cmd, TOOLS_DIR, args.verbose)
+
+    # only the sources: the output dir defaults to tools/ itself, which
+    # would put all of tools/ in the fingerprint.  build_dist.py names
+    # its archives after the version, so a deleted archive isn't seen
+    # here; -f dist rebuilds it
+    graph.add(Task('dist', build_dist,
+                   inputs=[exe_path,
+                           path_join(PROJECT_ROOT, 'VERSION'),
+                           path_join(PROJECT_ROOT, 'build', 'dist'),
+                           path_join(TOOLS_DIR, 'build_dist.py'),
+                           path_join(TOOLS_DIR, 'lazyicon.py'),
+                           path_join(TOOLS_DIR, 'pylib')],
+                   outputs=[args.output_dir],
+                   deps=['app'] + (['icon'] if sys.platform == 'darwin' else []),
+                   key='%s %s %s' % (arch, args.reproducible, args.split_debug),
+                   writes_inputs=True))
+    return graph
+
+def tasks_for_path(path, graph):
+    """the tasks whose inputs path is in, by where it lives"""
+    rel = os.path.relpath(path, PROJECT_ROOT).replace(os.sep, '/')
+    parts = rel.split('/')
+
+    if parts[0] == 'src':
+        names = ['app']
+    elif parts[0] == 'vendors' and len(parts) > 1:
+        if parts[1] in ('lib', 'include'):
+            names = ['app']
+        else:
+            names = ['vendor:' + parts[1]]
+    elif rel.startswith('build/dist/icon_src/') or rel == 'build/dist/icon_src':
+        names = ['icon']
+    elif parts[0] == 'build' and len(parts) > 1 and parts[1] == 'dist':
+        names = ['dist']
+    elif parts[0] == 'build' and len(parts) == 3 and \
+         parts[1].startswith('gmake_'):
+        names = ['app']
+    elif rel == 'VERSION':
+        names = ['buildinfo', 'dist']
+    elif rel == 'tools/tag_tree.py':
+        names = ['buildinfo']
+    elif rel == 'tools/lazyicon.py':
+        names = ['icon', 'dist']
+    elif rel == 'tools/pylib/vendor_build.py':
+        names = [name for name in graph.tasks if name.startswith('vendor:')]
+    elif parts[0] == 'tools':
+        names = ['dist']
+    elif parts[0] == '.git':
+        names = ['buildinfo']
+    else:
+        names = []
+    return set(name for name in names if name in graph.tasks)
+
+def watch_roots(graph):
+    """every input of every task, except outputs of other tasks"""
+    outputs = set()
+    for task in graph.tasks.values():
+        outputs.update(task.outputs)
+    roots = set()
+    for task in graph.tasks.values():
+        for path in task.inputs:
+            if path not in outputs and os.path.exists(path):
+                roots.add(path)
+    return sorted(roots)
+
+def affected_targets(graph, changed_tasks, targets):
+    """
+    the targets that depend on a changed task, plus changed tasks that
+    no target depends on, like the icon on linux
+    """
+    affected = []
+    covered = set()
+    for target in targets:
+        closure = set(graph.closure([target]))
+        if closure & changed_tasks:
+            affected.append(target)
+            covered |= closure
+    affected += sorted(changed_tasks - covered)
+    return affected
+
+def watch(graph, args):
+    import file_watch
+
+    roots = watch_roots(graph) + [path_join(PROJECT_ROOT, rel)
+                                  for rel in WATCH_SELF]
+    watcher = file_watch.make_watcher(roots, WATCH_EXCLUDES, polling=args.poll)
+    print("watching with %s; Ctrl-C to stop" % watcher.name)
+
+    start = time.perf_counter()
+    results = graph.run(args.targets, jobs=args.jobs)
+    print_summary(results, graph.closure(args.targets),
+                  time.perf_counter() - start)
+
+    while True:
+        paths, changed_at = file_watch.wait_for_changes(
+            watcher, debounce=args.debounce / 1000.0)
+        changed_tasks = set()
+        for path in paths:
+            rel = os.path.relpath(path, PROJECT_ROOT).replace(os.sep, '/')
+            if rel in WATCH_SELF:
+                print("%s changed: restart ivbuild.py to pick it up" % rel)
+                continue
+            changed_tasks |= tasks_for_path(path, graph)
+        if len(changed_tasks) == 0:
+            continue
+
+        targets = affected_targets(graph, changed_tasks, args.targets)
+        start = time.time()
+        results = graph.run(targets, jobs=args.jobs)
+        ready = time.time()
+
+        ran = [name for name, (status, seconds) in sorted(results.items())
+               if status == 'ran']
+        failed = [name for name, (status, seconds) in sorted(results.items())
+                  if status == 'failed']
+        # our own builds write into vendor trees; those changes fingerprint
+        # the same as after the build and run nothing
+        if len(ran) == 0 and len(failed) == 0:
+            continue
+
+        shown = [os.path.relpath(path, PROJECT_ROOT) for path in paths[:3]]
+        if len(paths) > 3:
+            shown.append('and %d more' % (len(paths) - 3))
+        if len(failed) != 0:
+            print("%s changed: %s FAILED" % (', '.join(shown), ', '.join(failed)))
+        else:
+            print("%s changed: %s ready in %.2fs (built %s in %.2fs)" % \
+                  (', '.join(shown), ', '.join(targets), ready - changed_at,
+                   ', '.join(ran), ready - start))
+
+def print_summary(results, order, elapsed):
+    print()
+    for name in order:
+        status, seconds = results.get(name, ('not run', 0.0))
+        print("\t%-10s %-14s %7.2fs" % (status, name, seconds))
+    counts = {}
+    for status, seconds in results.values():
+        counts[status] = counts.get(status, 0) + 1
+    print("%s in %.2fs" % (', '.join('%d %s' % (n, s) for s, n in
+                                     sorted(counts.items())), elapsed))
+
+
+if __name__ == '__main__':
+    args = do_args()
+
+    from task_graph import TaskError
+
+    start = time.perf_counter()
+    graph = make_graph(args)
+    try:
+        order = graph.closure(args.targets)
+    except TaskError as e:
+        print(e.message, file=sys.stderr)
+        sys.exit(1)
+
+    if args.list:
+        for name in order:
+            deps = graph.tasks[name].deps
+            print("%-14s %s" % (name, ', '.join(deps) if deps else '-'))
+        sys.exit(0)
+
+    if args.watch:
+        try:
+            watch(graph, args)
+        except KeyboardInterrupt:
+            print()
+        sys.exit(0)
+
+    force = set('*' if name == 'all' else name for name in args.force)
+    results = graph.run(args.targets, jobs=args.jobs, force=force,
+                        dry_run=args.dry_run)
+    print_summary(results, order, time.perf_counter() - start)
+
+    failed = [name for name, (status, seconds) in results.items()
+              if status == 'failed']
+    sys.exit(1 if len(failed) != 0 else 0)
@@ -14,25 +14,61 @@ You can get away with one image or include more than one if you want
 to hand-manage the visuals at various resolutions.
 """
 
+import io
 import sys
 import glob
+import time
+import zlib
+import shutil
+import struct
+import hashlib
 import os.path
-import tempfile
 import argparse
-import subprocess
-from PIL import Image, ImageFont, ImageDraw
+import functools
 from os.path import join as path_join
 
-RESAMPLE_FILTER = Image.LANCZOS
+# PIL and concurrent.futures are imported where they are used, so
+# --help, argument errors and icon cache hits don't pay for them.
+
+RESAMPLE_FILTER_NAME = 'LANCZOS'
+
+# bump when icon output changes for the same inputs; invalidates
+# build_icon_cached() results
+ICON_FORMAT_VERSION = 1
+
+# A size is only resized from a smaller, already-resized level if that
+# level is at least this many times larger.  Closer than that, a second
+# LANCZOS pass visibly softens the result, so the source is used.
+PYRAMID_MIN_RATIO = 2
 
 def do_args():
     parser = argparse.ArgumentParser(description="generate icons and icon art")
     parser.add_argument('-o', '--output-file',
                         action='store',
-                        help='.icns file to create')
+                        help='.icns, .ico or .iconset dir to create.  '
+                        'with -g and any other extension, master pngs '
+                        'named <output-file>_<size>.png are written')
     parser.add_argument('-i', '--input-dir',
                         action='store',
                         help='directory of .pngs')
+    parser.add_argument('-b', '--batch',
+                        action='store',
+                        help='file of "input_dir output_path [format]" '
+                        'lines to build in one run')
+    
+    parser.add_argument('--optimize-dir',
+                        action='store',
+                        help='losslessly optimize every png in a directory, '
+                        'in place')
+    parser.add_argument('-O', '--optimize',
+                        action='store_true', default=False,
+                        help='losslessly optimize pngs inside built icons '
+                        '(cached under $IVCACHE/pngopt)')
+
+    parser.add_argument('-j', '--jobs', type=int,
+                        default=os.cpu_count(),
+                        help='threads for resizing and encoding (default %d)' % \
+                        os.cpu_count())
     
     parser.add_argument('-g', '--generate-icon',
                         action='store_true', default=False,
@@ -52,9 +88,19 @@ def do_args():
     if args.input_dir and not os.path.isdir(args.input_dir):
         parser.error("%s does not exist" % args.input_dir)
 
-    if (not args.generate_icon and not args.input_dir) or \
-       (args.generate_icon and args.input_dir):
-        parser.error("either -g/--generate-icon or -i/--input-dir must be used")
+    if args.batch and not os.path.isfile(args.batch):
+        parser.error("%s does not exist" % args.batch)
+    if args.optimize_dir and not os.path.isdir(args.optimize_dir):
+        parser.error("%s does not exist" % args.optimize_dir)
+
+    action_count = [bool(args.generate_icon), bool(args.input_dir),
+                    bool(args.batch), bool(args.optimize_dir)].count(True)
+    if action_count != 1:
+        parser.error("one of -g/--generate-icon, -i/--input-dir, "
+                     "-b/--batch or --optimize-dir must be used")
+
+    if args.jobs < 1:
+        parser.error("-j/--jobs must be at least 1")
 
     if args.generate_icon:
         if not os.path.exists(args.gen_font):
@@ -65,20 +111,45 @@ def do_args():
         
     return args
 
-def _validate_square(im):
-    if im.size[0] != im.size[1]:
+def _validate_square(size, src_img):
+    if size[0] != size[1]:
         print("%s is not a square image (%dx%d)" % \
-              (src_img, im.size[0], im.size[1]))
+              (src_img, size[0], size[1]))
         sys.exit(1)
     
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def probe_png(path):
+    """
+    Read only the signature and IHDR chunk of a png.
+
+    returns (width, height, bit_depth, color_type), or None if path
+    is not a png.
+    """
+    with open(path, 'rb') as f:
+        return probe_png_bytes(f.read(33))
+
+def probe_png_bytes(head):
+    """probe_png() for png data already in memory"""
+    # signature, then IHDR must be the first chunk
+    if len(head) < 33 or head[:8] != PNG_SIGNATURE or head[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>IIBB', head[16:26])
 
 def map_src_images_to_sizes(img_dir, size_map, verbose):
-    for src_img in glob.iglob(path_join(img_dir, '*.png')):
+    """
+    Choose a source png for every size in size_map.  Only png headers
+    are read here; sources are decoded later, and only if chosen.
+    """
+    for src_img in sorted(glob.iglob(path_join(img_dir, '*.png'))):
         print(src_img)
-        im = Image.open(src_img)
-        dim = im.size[0]
+        probe = probe_png(src_img)
+        if probe == None:
+            print("%s is not a png file" % src_img, file=sys.stderr)
+            sys.exit(1)
+        dim = probe[0]
 
-        _validate_square(im)
+        _validate_square(probe[:2], src_img)
 
         for size in size_map:
             if size <= dim:
@@ -105,87 +176,555 @@ def map_src_images_to_sizes(img_dir, size_map, verbose):
 
     return size_map
 
-def generate_images(size_map, tmp_dir):
+class ImagePyramid:
+    """
+    A source image, decoded and converted to RGBA once, plus every size
+    resized from it so far.
+
+    Each size is resized from the smallest level already held that is
+    at least PYRAMID_MIN_RATIO times larger, or from the source.
+    Request sizes largest first to get the most reuse, or use plan()
+    and resize_level() to resize many sizes in parallel.
+    """
+    def __init__(self, src_image_path):
+        self.src_image_path = src_image_path
+
+        from PIL import Image
+
+        start = time.perf_counter()
+        with Image.open(src_image_path) as im:
+            src = im.convert("RGBA")
+        self.decode_time = time.perf_counter() - start
+
+        _validate_square(src.size, src_image_path)
+        self.dim = src.size[0]
+        self.levels = {self.dim: src}
+
+        # size -> (resized from, seconds)
+        self.resize_times = {}
+
+    def get(self, size):
+        """return the RGBA image at size x size"""
+        if size in self.levels:
+            return self.levels[size]
+
+        return self.resize_level(size, self._nearest_parent(size, self.levels))
+
+    def plan(self, sizes):
+        """
+        return a list of (size, parent size, depth) to produce every
+        size in sizes not yet held.  All steps of one depth only depend
+        on earlier depths, so they can run concurrently.
+        """
+        depth_of = dict.fromkeys(self.levels, 0)
+        steps = []
+        for size in sorted(sizes, reverse=True):
+            if size in depth_of:
+                continue
+            parent = self._nearest_parent(size, depth_of)
+            depth_of[size] = depth_of[parent] + 1
+            steps.append((size, parent, depth_of[size]))
+        return steps
+
+    def resize_level(self, size, parent):
+        """resize the held parent level to size, and hold the result"""
+        from PIL import Image
+
+        start = time.perf_counter()
+        im = self.levels[parent].resize((size, size),
+                                        getattr(Image, RESAMPLE_FILTER_NAME))
+        self.resize_times[size] = (parent, time.perf_counter() - start)
+
+        self.levels[size] = im
+        return im
+
+    def _nearest_parent(self, size, dims):
+        candidates = [dim for dim in dims \
+                      if dim >= size * PYRAMID_MIN_RATIO]
+        if len(candidates) != 0:
+            return min(candidates)
+        return self.dim
+
+def get_pyramid(pyramids, src_image_path):
+    """return the ImagePyramid for src_image_path, decoding it on first use"""
+    if src_image_path not in pyramids:
+        pyramids[src_image_path] = ImagePyramid(src_image_path)
+    return pyramids[src_image_path]
+
+def print_pyramid_times(pyramids):
+    for path in sorted(pyramids):
+        pyramid = pyramids[path]
+        print("%s: decode %.1fms" % (os.path.basename(path),
+                                     pyramid.decode_time * 1000.0))
+        for size in sorted(pyramid.resize_times, reverse=True):
+            parent, seconds = pyramid.resize_times[size]
+            print("\t%4d from %4d: resize %.1fms" % \
+                  (size, parent, seconds * 1000.0))
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return (result, time.perf_counter() - start)
+
+def resize_all(pyramids, requests, pool):
+    """
+    Decode and resize everything in requests, a list of
+    (src image path, size), on pool.  Results are held in pyramids.
+
+    returns the summed seconds spent in the tasks.
+    """
+    work = 0.0
+
+    new_paths = sorted(set(path for path, size in requests) - set(pyramids))
+    for path, (pyramid, seconds) in \
+        zip(new_paths, pool.map(_timed, [ImagePyramid] * len(new_paths),
+                                new_paths)):
+        pyramids[path] = pyramid
+        work += seconds
+
+    sizes_by_src = {}
+    for path, size in requests:
+        sizes_by_src.setdefault(path, set()).add(size)
+
+    steps = []
+    for path in sorted(sizes_by_src):
+        pyramid = pyramids[path]
+        for size, parent, depth in pyramid.plan(sizes_by_src[path]):
+            steps.append((depth, pyramid, size, parent))
+
+    # one depth at a time, so every parent level exists before it is used
+    depth = 1
+    while True:
+        batch = [step for step in steps if step[0] == depth]
+        if len(batch) == 0:
+            break
+        for im, seconds in pool.map(lambda step: _timed(step[1].resize_level,
+                                                        step[2], step[3]),
+                                    batch):
+            work += seconds
+        depth += 1
+
+    return work
+
+def encode_png(im):
+    """return im encoded as png bytes"""
+    buf = io.BytesIO()
+    im.save(buf, "png")
+    return buf.getvalue()
+
+def render_pngs(images, pyramids, jobs):
+    """
+    Resize and encode images, a list of (name, pixel size, src image
+    path), across jobs threads.  Pillow releases the GIL while resizing
+    and encoding.
+
+    returns a dict of name to png bytes.
+    """
+    import concurrent.futures
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        work = resize_all(pyramids,
+                          [(src, size) for name, size, src in images], pool)
+
+        level_ims = [pyramids[src].get(size) for name, size, src in images]
+        pngs = {}
+        for (name, size, src), (png, seconds) in \
+            zip(images, pool.map(_timed, [encode_png] * len(images),
+                                 level_ims)):
+            pngs[name] = png
+            work += seconds
+
+    wall = time.perf_counter() - start
+    print("decode+resize+encode: %.1fms of work in %.1fms (%.1fx on %d threads)" % \
+          (work * 1000.0, wall * 1000.0, work / wall, jobs))
+    return pngs
+
+def icns_image_list(size_map):
+    """
+    return a list of (iconset filename, pixel size, src image path) for
+    every image in a macOS .iconset, largest first.
+    """
+    images = []
     for size in size_map:
-        dim            = size_map[size][0]
         src_image_path = size_map[size][1]
 
-        # save full size
+        # full size
         if size != 1024:
-            im = Image.open(src_image_path)                
-            if size != dim:
-                im.thumbnail((size,size), RESAMPLE_FILTER)
-            filename = "icon_%dx%d.png" % (size, size)
-            out_path = path_join(tmp_dir, filename)
-            print("saving " + filename)
-            im = im.convert("RGBA")
-            im.save(out_path, "png")
-                
+            images.append(("icon_%dx%d.png" % (size, size),
+                           size, src_image_path))
 
-        # save @2x size
+        # @2x size
         if size == 16 or size == 128: continue
-        im = Image.open(src_image_path)
         hsize = int(size/2)
-        im.thumbnail((size,size), RESAMPLE_FILTER)            
-        filename = "icon_%dx%d@2x.png" % (hsize, hsize)
-        out_path = path_join(tmp_dir, filename)
-        print("saving " + filename)
-        im = im.convert("RGBA")
-        im.save(out_path, "png")
-        
+        images.append(("icon_%dx%d@2x.png" % (hsize, hsize),
+                       size, src_image_path))
 
     # edge case: save out 32x32@2x from 128x128 icon
-    dim            = size_map[128][0]
-    src_image_path = size_map[128][1]
-
-    im = Image.open(src_image_path)
-    if 64 != dim:
-        im.thumbnail((64,64), RESAMPLE_FILTER)
-    filename = "icon_32x32@2x.png"
-    out_path = path_join(tmp_dir, filename)
-    print("saving " + filename)
-    im = im.convert("RGBA")
-    im.save(out_path, "png")
-
-def create_icns(in_dir, out_path):
-    cmd = ['iconutil', '-c', 'icns', '-o', out_path, in_dir]
-    print(' '.join(cmd))
-    po = subprocess.Popen(cmd)
-    po.wait()
-    if po.returncode != 0:
-        print("error running iconutil", file=sys.stderr)
-        input("temp")
-        sys.exit(1)
+    images.append(("icon_32x32@2x.png", 64, size_map[128][1]))
 
-def create_ico(in_dir, size_map, out_path):
-    # sadly, Pillow's .ico support doesn't support multiple src
-    # images to produce a multi-size ico output file.
-    # just take the largest one.
-    CHOSEN_SZ = 256
-    dim            = size_map[CHOSEN_SZ][0]
-    src_image_path = size_map[CHOSEN_SZ][1]
-    
-    im = Image.open(src_image_path)
-    _validate_square(im)
-    if im.size[0] != CHOSEN_SZ:
-        im.thumbnail((CHOSEN_SZ, CHOSEN_SZ), RESAMPLE_FILTER)
-
-    # PIL has a bug wherein the max size is 255 instead of 256.
-    # This creates a stride issue when viewing the image.
-    # If set to 256, PIL just fails.
-    # Workaround is to just not generate 256x256 icon.
-    ico_sizes = []
-    for size in size_map:
-        if size == 256: continue
-        ico_sizes.append((size,size))
+    images.sort(key=lambda image: (-image[1], image[0]))
+    return images
+
+def generate_images(size_map, tmp_dir, pyramids=None, jobs=1):
+    """
+    Write the .iconset pngs for size_map to tmp_dir.  Each source image
+    is decoded once; see ImagePyramid.  Work is spread over jobs
+    threads, but files are always written in the same order.
+
+    pyramids: dict of src image path to ImagePyramid, shared between
+    calls to reuse decoded sources.
+    """
+    if pyramids == None:
+        pyramids = {}
+
+    pngs = render_pngs(icns_image_list(size_map), pyramids, jobs)
+    write_iconset(pngs, tmp_dir)
+    print_pyramid_times(pyramids)
+
+def write_iconset(pngs, out_dir):
+    """write pngs, a dict of .iconset filename to png bytes, to out_dir"""
+    for filename, icns_type in ICNS_TYPES:
+        if filename not in pngs:
+            continue
+        print("saving " + filename)
+        with open(path_join(out_dir, filename), 'wb') as f:
+            f.write(pngs[filename])
+
+# .iconset filename to .icns element type, in the order iconutil
+# writes them.  Every element holds png data, which macOS reads for
+# all of these types since 10.7.
+ICNS_TYPES = (('icon_16x16.png',      b'icp4'),
+              ('icon_16x16@2x.png',   b'ic11'),
+              ('icon_32x32.png',      b'icp5'),
+              ('icon_32x32@2x.png',   b'ic12'),
+              ('icon_128x128.png',    b'ic07'),
+              ('icon_128x128@2x.png', b'ic13'),
+              ('icon_256x256.png',    b'ic08'),
+              ('icon_256x256@2x.png', b'ic14'),
+              ('icon_512x512.png',    b'ic09'),
+              ('icon_512x512@2x.png', b'ic10'))
+
+def create_icns(pngs, out_path):
+    """
+    Write an .icns file in one pass, without iconutil.
+
+    pngs: dict of .iconset filename to png bytes, as returned by
+    render_pngs(icns_image_list(...)).
+    """
+    elements = []
+    for filename, icns_type in ICNS_TYPES:
+        if filename not in pngs:
+            continue
+        png = pngs[filename]
+        elements.append(icns_type + struct.pack('>I', 8 + len(png)) + png)
+
+    body = b''.join(elements)
+    with open(out_path, 'wb') as f:
+        f.write(b'icns' + struct.pack('>I', 8 + len(body)))
+        f.write(body)
+
+def ico_image_list(size_map):
+    """
+    return a list of (name, pixel size, src image path) for every size
+    in an .ico, largest first.
+    """
+    images = []
+    for size in sorted(size_map, reverse=True):
+        images.append(("%dx%d" % (size, size), size, size_map[size][1]))
+    return images
+
+def create_ico(pngs, out_path):
+    """
+    Write a multi-resolution .ico file in one pass.
+
+    pngs: dict of name to png bytes, as returned by
+    render_pngs(ico_image_list(...)).
 
-    im.save(out_path, "ico", sizes=ico_sizes)
+    Every entry, 256x256 included, holds png data.  Pillow also writes
+    png entries, so this matches what it produced, minus the 256 entry
+    it could not write.
+    """
+    entries = [(probe_png_bytes(png)[0], png) for png in pngs.values()]
+    entries.sort(key=lambda entry: -entry[0])
+
+    header_size = 6 + 16 * len(entries)
+    directory = [struct.pack('<HHH', 0, 1, len(entries))]
+    offset = header_size
+    for size, png in entries:
+        # a width/height byte of 0 means 256
+        dim_byte = size if size < 256 else 0
+        directory.append(struct.pack('<BBBBHHII',
+                                     dim_byte, dim_byte, 0, 0, 1, 32,
+                                     len(png), offset))
+        offset += len(png)
+
+    with open(out_path, 'wb') as f:
+        f.write(b''.join(directory))
+        for size, png in entries:
+            f.write(png)
     
-def action_build_icon(args):
-    print("creating %s from %s" % (args.output_file, args.input_dir))
-    output_file_ext = os.path.splitext(args.output_file)[1].lower()
+#
+# lossless png optimization
+#
+
+# bump when optimize_pngs() output changes for the same input png;
+# invalidates its cache
+PNGOPT_VERSION = 1
+
+# every filtering of the image is compressed with each of these
+# (level, strategy) pairs
+PNGOPT_ZLIB_SETTINGS = ((9, zlib.Z_DEFAULT_STRATEGY, 'default'),
+                        (9, zlib.Z_FILTERED, 'filtered'),
+                        (9, zlib.Z_RLE, 'rle'),
+                        (6, zlib.Z_DEFAULT_STRATEGY, 'default'))
+
+# channels per pixel for 8-bit png color types
+_PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+# |signed byte|, used to estimate how well a filtered row compresses
+_ABS_TABLE = bytes(min(b, 256 - b) for b in range(256))
+
+def _png_chunks(png):
+    """return a list of (chunk type, data) for every chunk in png"""
+    chunks = []
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(png):
+        length, chunk_type = struct.unpack_from('>I4s', png, pos)
+        chunks.append((chunk_type, png[pos+8:pos+8+length]))
+        pos += 12 + length
+    return chunks
+
+def _png_chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + \
+        struct.pack('>I', zlib.crc32(chunk_type + data))
+
+def _sub_bytes(a, b):
+    """
+    bytewise (a - b) mod 256 of two equal length byte strings.
+
+    Both are treated as one big int with a guard bit per byte, so the
+    whole image is filtered in a few big int operations instead of a
+    python loop per byte.
+    """
+    n = len(a)
+    high = int.from_bytes(b'\x80' * n, 'big')
+    x = int.from_bytes(a, 'big')
+    y = int.from_bytes(b, 'big')
+    d = ((x | high) - (y & ~high)) ^ ((x ^ y ^ high) & high)
+    return d.to_bytes(n, 'big')
+
+def _filter_streams(raw, height, stride, bpp):
+    """
+    return a dict of name to filtered scanline data for raw, the
+    unfiltered pixel bytes.  Filters are none, sub, up, and mixed,
+    which picks one of the three per row.
+    """
+    rows = [raw[y*stride:(y+1)*stride] for y in range(height)]
+    left = b''.join(b'\0' * bpp + row[:-bpp] for row in rows)
+    up = b'\0' * stride + raw[:-stride]
+
+    filtered = {0: rows}
+    for filter_type, prev in ((1, left), (2, up)):
+        d = _sub_bytes(raw, prev)
+        filtered[filter_type] = [d[y*stride:(y+1)*stride] for y in range(height)]
+
+    streams = {}
+    for name, filter_type in (('none', 0), ('sub', 1), ('up', 2)):
+        prefix = bytes([filter_type])
+        streams[name] = b''.join(prefix + row for row in filtered[filter_type])
+
+    mixed = []
+    for y in range(height):
+        best = min((sum(filtered[t][y].translate(_ABS_TABLE)), t) \
+                   for t in (0, 1, 2))
+        mixed.append(bytes([best[1]]) + filtered[best[1]][y])
+    streams['mixed'] = b''.join(mixed)
+    return streams
+
+def _compress(stream, level, strategy):
+    c = zlib.compressobj(level, zlib.DEFLATED, 15, 9, strategy)
+    return c.compress(stream) + c.flush()
+
+def _pngopt_candidates(png):
+    """
+    return a dict of name to scanline data to try compressing for png,
+    or None if png is a layout this does not handle.  Only 8-bit,
+    non-interlaced pngs are re-filtered; Pillow's own filtering is
+    always a candidate.
+    """
+    chunks = _png_chunks(png)
+    if len(chunks) == 0 or chunks[0][0] != b'IHDR':
+        return None
+    width, height, bit_depth, color_type, _, _, interlace = \
+        struct.unpack('>IIBBBBB', chunks[0][1])
+
+    idat = b''.join(data for chunk_type, data in chunks if chunk_type == b'IDAT')
+    try:
+        candidates = {'pillow': zlib.decompress(idat)}
+    except zlib.error:
+        return None
 
-    if output_file_ext == '.icns':
+    if bit_depth != 8 or interlace != 0 or color_type not in _PNG_CHANNELS:
+        return candidates
+
+    from PIL import Image
+
+    raw = Image.open(io.BytesIO(png)).tobytes()
+    bpp = _PNG_CHANNELS[color_type]
+    stride = width * bpp
+    if len(raw) != stride * height:
+        return candidates
+
+    candidates.update(_filter_streams(raw, height, stride, bpp))
+    return candidates
+
+def _png_with_idat(png, idat):
+    """png with all its IDAT chunks replaced by one holding idat"""
+    out = [PNG_SIGNATURE]
+    for chunk_type, data in _png_chunks(png):
+        if chunk_type == b'IDAT':
+            if idat != None:
+                out.append(_png_chunk(b'IDAT', idat))
+                idat = None
+            continue
+        out.append(_png_chunk(chunk_type, data))
+    return b''.join(out)
+
+def _same_pixels(png_a, png_b):
+    from PIL import Image
+
+    im_a = Image.open(io.BytesIO(png_a))
+    im_b = Image.open(io.BytesIO(png_b))
+    return im_a.mode == im_b.mode and im_a.size == im_b.size and \
+        im_a.tobytes() == im_b.tobytes()
+
+def _add_pylib_path():
+    # the shared helpers live in tools/pylib, beside make_dist
+    pylib_dir = path_join(os.path.dirname(os.path.realpath(__file__)), 'pylib')
+    if pylib_dir not in sys.path:
+        sys.path.append(pylib_dir)
+
+def _default_cache_dir():
+    _add_pylib_path()
+    from ivcache import get_cache_dir
+    return get_cache_dir()
+
+def _metrics_stage(stage, output_path):
+    """a build_metrics.Stage for the job writing output_path"""
+    _add_pylib_path()
+    import build_metrics
+    return build_metrics.Stage('lazyicon', stage,
+                               output=os.path.basename(output_path))
+
+def optimize_pngs(pngs, jobs, cache_dir):
+    """
+    Losslessly shrink pngs, a dict of name to png bytes.  Every
+    filtering and zlib setting is tried on a pool of jobs threads, and
+    the smallest result is kept if it decodes to the same pixels.
+
+    Results are cached in cache_dir by the sha256 of the input png, so
+    only new images pay for the search.
+
+    returns a dict of name to optimized png bytes.
+    """
+    import concurrent.futures
+
+    start = time.perf_counter()
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # identical pngs under different names are optimized once
+    keys = {}
+    for name, png in pngs.items():
+        keys[name] = hashlib.sha256(b'%d:' % PNGOPT_VERSION + png).hexdigest()
+
+    results = {}
+    misses = {}
+    for name, png in pngs.items():
+        key = keys[name]
+        if key in results or key in misses:
+            continue
+        cached_path = path_join(cache_dir, key + '.png')
+        if os.path.isfile(cached_path):
+            with open(cached_path, 'rb') as f:
+                results[key] = (f.read(), 'cached')
+        else:
+            misses[key] = png
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        candidates = dict(zip(misses, pool.map(_pngopt_candidates,
+                                               misses.values())))
+        futures = []
+        for key, streams in candidates.items():
+            if streams == None:
+                continue
+            for stream_name, stream in streams.items():
+                for level, strategy, strategy_name in PNGOPT_ZLIB_SETTINGS:
+                    label = '%s/%d/%s' % (stream_name, level, strategy_name)
+                    futures.append((key, label,
+                                    pool.submit(_compress, stream,
+                                                level, strategy)))
+
+        best = {}
+        for key, label, future in futures:
+            idat = future.result()
+            if key not in best or len(idat) < len(best[key][0]):
+                best[key] = (idat, label)
+
+    for key, png in misses.items():
+        result = (png, 'unchanged')
+        if key in best:
+            optimized = _png_with_idat(png, best[key][0])
+            if len(optimized) < len(png) and _same_pixels(png, optimized):
+                result = (optimized, best[key][1])
+        results[key] = result
+
+        cached_path = path_join(cache_dir, key + '.png')
+        tmp_path = '%s.%d.tmp' % (cached_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(result[0])
+        os.replace(tmp_path, cached_path)
+
+    out = {}
+    total_before = total_after = 0
+    for name, png in pngs.items():
+        optimized, how = results[keys[name]]
+        out[name] = optimized
+        total_before += len(png)
+        total_after += len(optimized)
+        print("\t%-22s %8d -> %8d bytes  %s" % \
+              (name, len(png), len(optimized), how))
+
+    print("png optimize: saved %d of %d bytes (%.1f%%) in %.1fms" % \
+          (total_before - total_after, total_before,
+           100.0 * (total_before - total_after) / max(total_before, 1),
+           (time.perf_counter() - start) * 1000.0))
+    return out
+
+def action_optimize_dir(args):
+    """optimize every png in args.optimize_dir in place"""
+    pngs = {}
+    for src_img in sorted(glob.iglob(path_join(args.optimize_dir, '*.png'))):
+        with open(src_img, 'rb') as f:
+            pngs[os.path.basename(src_img)] = f.read()
+
+    optimized = optimize_pngs(pngs, args.jobs,
+                              path_join(_default_cache_dir(), 'pngopt'))
+    for name, png in optimized.items():
+        if png != pngs[name]:
+            with open(path_join(args.optimize_dir, name), 'wb') as f:
+                f.write(png)
+
+ICON_FORMATS = ('.icns', '.ico', '.iconset')
+
+def icon_images(input_dir, output_format):
+    """
+    Choose source pngs in input_dir for every image output_format
+    needs.  Only png headers are read.
+
+    returns a list of (name, pixel size, src image path).
+    """
+    if output_format in ('.icns', '.iconset'):
         # all image sizes are square
         # size_map is all sizes to tuple (pixels, img_path)
         size_map = {1024:None,
@@ -194,13 +733,11 @@ def action_build_icon(args):
                     128:None,
                     32:None,
                     16:None}
-        size_map = map_src_images_to_sizes(args.input_dir, size_map,
+        size_map = map_src_images_to_sizes(input_dir, size_map,
                                            verbose=True)
-        with tempfile.TemporaryDirectory(suffix=".iconset") as tmp_dir:
-            generate_images(size_map, tmp_dir)
-            create_icns(tmp_dir, args.output_file)
-            
-    elif output_file_ext == '.ico':
+        return icns_image_list(size_map)
+
+    elif output_format == '.ico':
         size_map = {256:None,
                     128:None,
                     64:None,
@@ -208,14 +745,213 @@ def action_build_icon(args):
                     32:None,
                     24:None,
                     16:None}
-        size_map = map_src_images_to_sizes(args.input_dir, size_map,
+        size_map = map_src_images_to_sizes(input_dir, size_map,
                                            verbose=False)
-        create_ico(args.input_dir, size_map, args.output_file)
+        return ico_image_list(size_map)
+
+    print("unknown extension " + output_format, file=sys.stderr)
+    sys.exit(1)
+
+def write_icon(images, output_file, output_format, pyramids, jobs,
+               optimize_dir=None):
+    """
+    resize, encode and write images in output_format.  If optimize_dir
+    is set, pngs are run through optimize_pngs() with it as the cache.
+    """
+    pngs = render_pngs(images, pyramids, jobs)
+    if optimize_dir != None:
+        pngs = optimize_pngs(pngs, jobs, optimize_dir)
+    if output_format == '.icns':
+        create_icns(pngs, output_file)
+    elif output_format == '.ico':
+        create_ico(pngs, output_file)
     else:
-        print("unknown extension " + output_file_ext, file=sys.stderr)
-        sys.exit(1)
-        
-    print("wrote " + args.output_file)
+        os.makedirs(output_file, exist_ok=True)
+        write_iconset(pngs, output_file)
+
+def build_icon(input_dir, output_file, jobs=1, pyramids=None,
+               output_format=None, optimize_dir=None):
+    """
+    Build an .icns, .ico or .iconset dir at output_file from input_dir,
+    a directory of square pngs.  This is the entry point for callers
+    that import lazyicon instead of running it.
+
+    pyramids: dict of src image path to ImagePyramid, shared between
+    calls to reuse decoded sources.
+
+    output_format: one of ICON_FORMATS, or None to use the extension
+    of output_file.
+
+    optimize_dir: png optimization cache dir, or None to skip
+    optimization.
+    """
+    if pyramids == None:
+        pyramids = {}
+    if output_format == None:
+        output_format = os.path.splitext(output_file)[1].lower()
+
+    print("creating %s from %s" % (output_file, input_dir))
+    images = icon_images(input_dir, output_format)
+    write_icon(images, output_file, output_format, pyramids, jobs,
+               optimize_dir)
+    print_pyramid_times(pyramids)
+    print("wrote " + output_file)
+
+def icon_cache_key(input_dir, output_file_ext, optimize=False):
+    """
+    return a hex key covering everything build_icon() output depends
+    on: the source pngs, the output format, the resample filter,
+    png optimization and the icon writers themselves.
+    """
+    h = hashlib.sha256()
+    h.update(('%d:%s:%s\n' % (ICON_FORMAT_VERSION, output_file_ext.lower(),
+                               RESAMPLE_FILTER_NAME)).encode('utf-8'))
+    if optimize:
+        h.update(('pngopt:%d\n' % PNGOPT_VERSION).encode('utf-8'))
+    for src_img in sorted(glob.iglob(path_join(input_dir, '*.png'))):
+        with open(src_img, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        h.update(('%s:%s\n' % (os.path.basename(src_img), digest)).encode('utf-8'))
+    return h.hexdigest()
+
+def build_icon_cached(input_dir, output_file, cache_dir, jobs=1,
+                      optimize_dir=None):
+    """
+    build_icon() through a cache of finished icons in cache_dir.  On a
+    hit the cached icon is copied to output_file.  It is never linked:
+    callers write over their output, as make_dist's insert copy does,
+    and a link would carry that write back into the cache.
+    optimize_dir is passed on to build_icon().
+
+    returns True on a cache hit.
+    """
+    with _metrics_stage('icon', output_file) as stage:
+        stage.cache_hit = _build_icon_cached(input_dir, output_file,
+                                             cache_dir, jobs, optimize_dir)
+    return stage.cache_hit
+
+def _build_icon_cached(input_dir, output_file, cache_dir, jobs, optimize_dir):
+    output_file_ext = os.path.splitext(output_file)[1].lower()
+    if output_file_ext == '.iconset':
+        build_icon(input_dir, output_file, jobs, optimize_dir=optimize_dir)
+        return False
+
+    key = icon_cache_key(input_dir, output_file_ext, optimize_dir != None)
+    cached_path = path_join(cache_dir, key + output_file_ext)
+
+    hit = os.path.isfile(cached_path)
+    if hit:
+        print("icon cache hit: %s" % cached_path)
+    else:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = path_join(cache_dir, '%s.%d.tmp%s' % \
+                             (key, os.getpid(), output_file_ext))
+        build_icon(input_dir, tmp_path, jobs, optimize_dir=optimize_dir)
+        os.replace(tmp_path, cached_path)
+
+    # by way of a rename, replacing rather than writing through an
+    # output_file linked to the cache by an older lazyicon
+    tmp_path = '%s.%d.tmp' % (output_file, os.getpid())
+    shutil.copyfile(cached_path, tmp_path)
+    os.replace(tmp_path, output_file)
+    return hit
+
+def read_batch_file(batch_path):
+    """
+    Read a batch job list: one job per line, as
+
+        input_dir output_path [format]
+
+    format is one of ico, icns, iconset, and defaults to the extension
+    of output_path.  Relative paths are relative to the batch file.
+    # starts a comment.
+
+    returns a list of (input_dir, output_path, format).
+    """
+    base_dir = os.path.dirname(os.path.abspath(batch_path))
+    batch_jobs = []
+    with open(batch_path, 'rt') as f:
+        for line_num, line in enumerate(f, 1):
+            fields = line.split('#', 1)[0].split()
+            if len(fields) == 0:
+                continue
+            if len(fields) not in (2, 3):
+                print("%s:%d: expected 'input_dir output_path [format]'" % \
+                      (batch_path, line_num), file=sys.stderr)
+                sys.exit(1)
+
+            input_dir = path_join(base_dir, fields[0])
+            output_path = path_join(base_dir, fields[1])
+            if len(fields) == 3:
+                output_format = '.' + fields[2].lstrip('.').lower()
+            else:
+                output_format = os.path.splitext(output_path)[1].lower()
+
+            if output_format not in ICON_FORMATS:
+                print("%s:%d: unknown format %s" % \
+                      (batch_path, line_num, output_format), file=sys.stderr)
+                sys.exit(1)
+            if not os.path.isdir(input_dir):
+                print("%s:%d: %s does not exist" % \
+                      (batch_path, line_num, input_dir), file=sys.stderr)
+                sys.exit(1)
+            batch_jobs.append((input_dir, output_path, output_format))
+    return batch_jobs
+
+def build_icon_batch(batch_jobs, jobs, optimize_dir=None):
+    """
+    Build every (input_dir, output_path, format) in batch_jobs.
+
+    Sources are decoded, and every size any job needs is resized, once
+    up front on a shared pool, so jobs using the same source pngs share
+    them.  The jobs then encode and write on a pool of jobs threads.
+    """
+    import concurrent.futures
+
+    start = time.perf_counter()
+    pyramids = {}
+
+    job_images = [icon_images(input_dir, output_format) \
+                  for input_dir, output_path, output_format in batch_jobs]
+    requests = set()
+    for images in job_images:
+        requests.update((src, size) for name, size, src in images)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        resize_all(pyramids, sorted(requests), pool)
+        shared_time = time.perf_counter() - start
+
+        def run_job(i):
+            input_dir, output_path, output_format = batch_jobs[i]
+            job_start = time.perf_counter()
+            with _metrics_stage('batch_job', output_path) as stage:
+                stage.cache_hit = False
+                write_icon(job_images[i], output_path, output_format, pyramids,
+                           1, optimize_dir)
+            return time.perf_counter() - job_start
+
+        job_times = list(pool.map(run_job, range(len(batch_jobs))))
+
+    print_pyramid_times(pyramids)
+    print("batch: %d jobs, %d source images, %d threads" % \
+          (len(batch_jobs), len(pyramids), jobs))
+    print("\t%8.1fms  shared decode+resize" % (shared_time * 1000.0))
+    for (input_dir, output_path, output_format), seconds in \
+        zip(batch_jobs, job_times):
+        print("\t%8.1fms  %s -> %s" % (seconds * 1000.0, input_dir, output_path))
+    print("\t%8.1fms  total" % ((time.perf_counter() - start) * 1000.0))
+
+def _optimize_dir(args):
+    """png optimization cache dir for args, or None"""
+    if not args.optimize:
+        return None
+    return path_join(_default_cache_dir(), 'pngopt')
+
+def action_build_icon(args):
+    with _metrics_stage('icon', args.output_file) as stage:
+        stage.cache_hit = False
+        build_icon(args.input_dir, args.output_file, args.jobs,
+                   optimize_dir=_optimize_dir(args))
 
 def _color_from_string(s):
     l = (int(x) for x in s.split(','))
@@ -223,32 +959,95 @@ def _color_from_string(s):
     if len(t) != 4:  return None
     return t
     
+@functools.lru_cache(maxsize=None)
+def _load_font(font_path, pixel_size):
+    from PIL import ImageFont
+    return ImageFont.truetype(font_path, pixel_size)
+
+def _text_size(dc, msg, font):
+    # textsize() was removed in Pillow 10; textbbox() from the origin
+    # measures the same extent
+    if hasattr(dc, 'textbbox'):
+        left, top, right, bottom = dc.textbbox((0, 0), msg, font=font)
+        return (right, bottom)
+    return dc.textsize(msg, font=font)
+
+def render_initials(size, msg, font_path, fg_col, bg_col):
+    """rasterize the generated icon directly at size x size pixels"""
+    from PIL import Image, ImageDraw
+
+    dims = (size, size)
+    im_icon = Image.new('RGBA', dims, fg_col)
+
+    font = _load_font(font_path, int(dims[0]*0.625))
+
+    dc = ImageDraw.Draw(im_icon)
+    w,h = _text_size(dc, msg, font)
+
+    pos = ((dims[0]/2) - (w/2),
+           (dims[1]/2) - (h/1.5))
+
+    marg = int(dims[0]*0.0625)
+    dc.rectangle([(marg,marg), (dims[0]-marg-1, dims[1]-marg-1)], fill=bg_col)
+    dc.text(pos, msg, font=font, fill=fg_col)
+    return im_icon
+
 def action_generate_icon(args):
-    DIMS = [(1024,1024), (32, 32)]
+    import concurrent.futures
 
     fg_col = _color_from_string(args.gen_fg_color)
     bg_col = _color_from_string(args.gen_bg_color)
     msg = args.gen_initials
 
-    for dims in DIMS:
-        im_icon = Image.new('RGBA', dims, fg_col)
-        
-        font_height = dims[0]*0.625
-        font = ImageFont.truetype(args.gen_font, int(dims[0]*0.625))
-        
-        dc = ImageDraw.Draw(im_icon)
-        w,h = dc.textsize(msg, font=font)
+    output_format = os.path.splitext(args.output_file)[1].lower()
+    if output_format not in ICON_FORMATS:
+        # no container: write master pngs to feed -i later
+        for size in (1024, 32):
+            im_icon = render_initials(size, msg, args.gen_font, fg_col, bg_col)
+            filename = '%s_%d.png' % (args.output_file, size)
+            im_icon.save(filename, "png")
+            print("saved %s (%dx%d)" % (filename, size, size))
+        return
+
+    # Every size the container holds is rasterized directly, rather
+    # than downsampled from a 1024 master.  Small sizes come out
+    # sharper, and the master is never encoded or decoded.
+    if output_format == '.ico':
+        size_map = {256:None, 128:None, 64:None, 48:None,
+                    32:None, 24:None, 16:None}
+    else:
+        size_map = {1024:None, 512:None, 256:None, 128:None,
+                    32:None, 16:None}
+    for size in size_map:
+        size_map[size] = ((size, size), None)
+
+    if output_format == '.ico':
+        images = ico_image_list(size_map)
+    else:
+        images = icns_image_list(size_map)
 
-        pos = ((dims[0]/2) - (w/2),
-               (dims[1]/2) - (h/1.5))
+    def render_png(size):
+        return encode_png(render_initials(size, msg, args.gen_font,
+                                          fg_col, bg_col))
 
-        marg = int(dims[0]*0.0625)
-        dc.rectangle([(marg,marg), (dims[0]-marg-1, dims[1]-marg-1)], fill=bg_col)
-        dc.text(pos, msg, font=font, fill=fg_col)
+    start = time.perf_counter()
+    sizes = sorted(set(size for name, size, src in images), reverse=True)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        size_pngs = dict(zip(sizes, pool.map(render_png, sizes)))
+    pngs = {name: size_pngs[size] for name, size, src in images}
+    print("rendered %d sizes in %.1fms" % \
+          (len(sizes), (time.perf_counter() - start) * 1000.0))
+    if args.optimize:
+        pngs = optimize_pngs(pngs, args.jobs, _optimize_dir(args))
 
-        filename = '%s_%d.png' % (args.output_file, dims[0])
-        im_icon.save(filename, "png")
-        print("saved %s (%dx%d)" % (filename, dims[0], dims[1]))
+    if output_format == '.icns':
+        create_icns(pngs, args.output_file)
+    elif output_format == '.ico':
+        create_ico(pngs, args.output_file)
+    else:
+        os.makedirs(args.output_file, exist_ok=True)
+        write_iconset(pngs, args.output_file)
+    print("wrote " + args.output_file)
 
     
 if __name__ == '__main__':
@@ -256,6 +1055,11 @@ if __name__ == '__main__':
     
     if args.input_dir:
         action_build_icon(args)
+    elif args.batch:
+        build_icon_batch(read_batch_file(args.batch), args.jobs,
+                         _optimize_dir(args))
+    elif args.optimize_dir:
+        action_optimize_dir(args)
     elif args.generate_icon:
         action_generate_icon(args)
     
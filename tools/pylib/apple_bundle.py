@@ -7,8 +7,16 @@
 #
 
 import os
+import sys
 import shutil
 
+# how members get from their source into the bundle
+LINK_MODES = ('copy', 'hardlink', 'reflink')
+PLIST_FORMATS = ('xml', 'binary')
+
+# linux/fs.h: _IOW(0x94, 9, int)
+_FICLONE = 0x40049409
+
 class AppleBundle:
     def __init__(self, app_name, exe_path, icon_path, version_str):
         """
@@ -22,9 +30,8 @@ class AppleBundle:
         self.exe_path = exe_path
         self.icon_path = icon_path
 
-        app_name_nospaces = app_name[:]
-        app_name_nospaces.replace(' ', '')
-        
+        app_name_nospaces = app_name.replace(' ', '')
+
         exe_filename = os.path.basename(exe_path)
 
         self.info_plist = {
@@ -38,40 +45,163 @@ class AppleBundle:
             'CFBundleIconFile': os.path.basename(icon_path),
 
             # having this makes the app display properly on retina screens(huh?)
-            'NSPrincipalClass': app_name, 
+            'NSPrincipalClass': app_name,
         }
 
-        
-    def write(self, out_root, rm_existing_root=False):
+    def members(self):
+        """
+        return a dict of path relative to the .app dir to the source
+        path each file member comes from.  Info.plist is generated and
+        not listed.
+        """
+        return {
+            'Contents/MacOS/' + os.path.basename(self.exe_path): self.exe_path,
+            'Contents/Resources/' + os.path.basename(self.icon_path): self.icon_path,
+        }
+
+    def plist_bytes(self, plist_format='xml'):
+        import plistlib
+
+        if plist_format == 'binary':
+            fmt = plistlib.FMT_BINARY
+        else:
+            fmt = plistlib.FMT_XML
+        return plistlib.dumps(self.info_plist, fmt=fmt, sort_keys=True)
+
+    def write(self, out_root, rm_existing_root=False, link_mode='copy',
+              plist_format='xml'):
+        """
+        Write or update out_root/<app_name>.app.
+
+        Members whose source is unchanged since the last write are left
+        alone, as is an Info.plist with the same bytes.  Files in the
+        bundle that are no longer members are removed.  Works on any
+        platform, so bundles can be staged off-Mac.
+
+        link_mode is one of LINK_MODES.  hardlink shares the source's
+        inode; reflink clones the data copy-on-write where the
+        filesystem can (FICLONE on linux, clonefile on darwin) and
+        copies where it can't.
+
+        returns the paths under out_root that were written or removed.
+        """
+        if link_mode not in LINK_MODES:
+            raise ValueError("link_mode must be one of %s" % ', '.join(LINK_MODES))
+
         if rm_existing_root and os.path.isdir(out_root):
             shutil.rmtree(out_root, ignore_errors=True)
-        
-        os.makedirs(out_root, exist_ok=True)
-
-        app_root = os.path.join(out_root, '%s.app' % self.app_name)
-        contents = os.path.join(app_root, 'Contents')
-        macos    = os.path.join(contents, 'MacOS')
-        resources= os.path.join(contents, 'Resources')
-
-        os.mkdir(app_root)
-        os.mkdir(contents)
-        os.mkdir(macos)
-        os.mkdir(resources)
-        shutil.copy(self.exe_path, macos)
-        shutil.copy(self.icon_path, resources)
-
-        f = open(os.path.join(contents, 'Info.plist'), "wt", encoding='utf-8')
-        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-        f.write('<!DOCTYPE plist PUBLIC "-//Apple Computer//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">\n')
-        f.write('<plist version="1.0">\n')
-        f.write('\t<dict>\n')
-
-        for key, value in self.info_plist.items():
-            f.write('\t\t<key>%s</key>\n' % key)
-            f.write('\t\t<string>%s</string>\n' % value)
-
-        f.write('\t</dict>\n')
-        f.write('</plist>\n')
-        f.close()
-                 
-                
+
+        bundle_name = '%s.app' % self.app_name
+        app_root = os.path.join(out_root, bundle_name)
+        for d in ('MacOS', 'Resources'):
+            os.makedirs(os.path.join(app_root, 'Contents', d), exist_ok=True)
+
+        changed = []
+        members = self.members()
+        for rel_path, src_path in sorted(members.items()):
+            dst_path = os.path.join(app_root, rel_path)
+            if _up_to_date(src_path, dst_path, link_mode):
+                continue
+            _install(src_path, dst_path, link_mode)
+            changed.append(bundle_name + '/' + rel_path)
+
+        plist_path = os.path.join(app_root, 'Contents', 'Info.plist')
+        if _write_if_changed(plist_path, self.plist_bytes(plist_format)):
+            changed.append(bundle_name + '/Contents/Info.plist')
+
+        keep = set(members)
+        keep.add('Contents/Info.plist')
+        for removed in _prune(app_root, keep):
+            changed.append(bundle_name + '/' + removed)
+        return changed
+
+
+def _up_to_date(src_path, dst_path, link_mode):
+    try:
+        dst = os.lstat(dst_path)
+    except FileNotFoundError:
+        return False
+    src = os.stat(src_path)
+
+    if link_mode == 'hardlink':
+        return os.path.samestat(src, dst)
+    # copies carry the source's mtime and mode over, so a matching
+    # stat means the same contents
+    return not os.path.samestat(src, dst) and \
+        dst.st_size == src.st_size and \
+        dst.st_mtime_ns == src.st_mtime_ns and \
+        dst.st_mode == src.st_mode
+
+
+def _install(src_path, dst_path, link_mode):
+    """
+    put src_path at dst_path by way of a temp file and a rename, so a
+    hardlinked dst is replaced rather than written through.
+    """
+    tmp_path = dst_path + '.tmp'
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+
+    if link_mode == 'hardlink':
+        os.link(src_path, tmp_path)
+    else:
+        if link_mode != 'reflink' or not _reflink(src_path, tmp_path):
+            shutil.copyfile(src_path, tmp_path)
+        shutil.copystat(src_path, tmp_path)
+    os.replace(tmp_path, dst_path)
+
+
+def _reflink(src_path, dst_path):
+    """clone src_path to dst_path, returning False where unsupported"""
+    if sys.platform == 'darwin':
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(libc, 'clonefile'):
+            return False
+        return libc.clonefile(os.fsencode(src_path), os.fsencode(dst_path), 0) == 0
+
+    if not sys.platform.startswith('linux'):
+        return False
+
+    import fcntl
+    with open(src_path, 'rb') as src:
+        with open(dst_path, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+                return True
+            except OSError:
+                # other filesystem, or one without extent sharing
+                pass
+    os.remove(dst_path)
+    return False
+
+
+def _write_if_changed(path, data):
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def _prune(app_root, keep):
+    """remove files under app_root not in keep, then empty dirs"""
+    removed = []
+    for dirpath, dirnames, filenames in os.walk(app_root, topdown=False):
+        rel_dir = os.path.relpath(dirpath, app_root).replace(os.sep, '/')
+        for filename in filenames:
+            rel_path = filename if rel_dir == '.' else rel_dir + '/' + filename
+            if rel_path not in keep:
+                os.remove(os.path.join(dirpath, filename))
+                removed.append(rel_path)
+        if rel_dir not in ('.', 'Contents', 'Contents/MacOS', 'Contents/Resources') and \
+           len(os.listdir(dirpath)) == 0:
+            os.rmdir(dirpath)
+    return sorted(removed)
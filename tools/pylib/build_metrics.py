@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2016 Frogtoss Games, Inc.
+#
+# Usage rights granted under repo license
+#
+
+"""
+Per-stage build metrics, for dashboards.
+
+Set IVMETRICS to a dir to turn them on, following the IVROOT/IVBIN/
+IVCACHE convention.  Each stage that finishes then appends a record to
+build_metrics.jsonl there and rewrites investickgator_build.prom, a
+textfile for node_exporter's textfile collector holding the last run
+of every stage plus run, cache hit and failure counters.  Unset, a
+stage costs next to nothing and nothing is written.
+
+    with build_metrics.Stage('make_dist', 'build_tgz') as stage:
+        ...
+        stage.cache_hit = False
+
+CPU, peak RSS and I/O are read for the whole process, so a stage that
+runs alongside others on threads is charged for their work too.  Peak
+RSS is the high-water mark of the process and its waited-for children
+so far, not of the stage alone.
+"""
+
+import os
+import sys
+import time
+import functools
+import threading
+
+from os.path import join as path_join
+
+METRICS_DIR_VAR = 'IVMETRICS'
+
+JSONL_NAME = 'build_metrics.jsonl'
+TEXTFILE_NAME = 'investickgator_build.prom'
+_STATE_NAME = 'build_metrics.state.json'
+_LOCK_NAME = 'build_metrics.lock'
+
+# bump when the state layout changes, so old state is ignored
+_STATE_VERSION = 1
+
+# (metric name, help, record field) for the gauges in the textfile
+_GAUGES = (
+    ('iv_build_stage_duration_seconds',
+     'Wall time of the last run of the stage.', 'duration_seconds'),
+    ('iv_build_stage_cpu_seconds',
+     'User+system CPU of the build process during the last run.', 'cpu_seconds'),
+    ('iv_build_stage_child_cpu_seconds',
+     'User+system CPU of child processes reaped during the last run.',
+     'child_cpu_seconds'),
+    ('iv_build_stage_peak_rss_bytes',
+     'Peak RSS of the build process or its children, as of the last run.',
+     'peak_rss_bytes'),
+    ('iv_build_stage_read_bytes',
+     'Bytes read from storage during the last run.', 'read_bytes'),
+    ('iv_build_stage_written_bytes',
+     'Bytes written to storage during the last run.', 'written_bytes'),
+    ('iv_build_stage_cache_hit',
+     '1 if the last run was served from a cache, 0 if it built.', 'cache_hit'),
+    ('iv_build_stage_success',
+     '1 if the last run succeeded.', 'ok'),
+    ('iv_build_stage_last_run_timestamp_seconds',
+     'Unix time the last run started.', 'time'),
+)
+
+# (metric name, help, state field) for the counters
+_COUNTERS = (
+    ('iv_build_stage_runs_total', 'Runs of the stage.', 'runs'),
+    ('iv_build_stage_cache_hits_total',
+     'Runs of the stage served from a cache.', 'cache_hits'),
+    ('iv_build_stage_failures_total', 'Runs of the stage that failed.',
+     'failures'),
+)
+
+# threads of one process; other processes are kept out by the lock file
+_lock = threading.Lock()
+
+
+def metrics_dir():
+    """the dir metrics go to, or None when they are off"""
+    return os.environ.get(METRICS_DIR_VAR) or None
+
+
+class Stage:
+    """
+    Context manager measuring one stage of a build.
+
+    tool:   what is building, e.g. make_dist
+    stage:  the step, e.g. build_tgz
+    labels: more label=value pairs, kept few so series stay few
+
+    Set cache_hit to True or False before the block ends where the
+    stage knows; it is left out otherwise.  A stage that raises is
+    recorded as failed and the exception goes on.
+    """
+    def __init__(self, tool, stage, **labels):
+        self.tool = tool
+        self.stage = stage
+        self.labels = labels
+        self.cache_hit = None
+        self._start = None
+
+    def __enter__(self):
+        if metrics_dir() != None:
+            self._start = _sample()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self._start == None:
+            return False
+        end = _sample()
+        start = self._start
+        self._start = None
+
+        rec = {
+            'time': round(start['time'], 3),
+            'tool': self.tool,
+            'stage': self.stage,
+            'labels': dict((k, str(v)) for k, v in self.labels.items()),
+            'ok': exc_type == None,
+            'cache_hit': self.cache_hit,
+            'duration_seconds': round(end['wall'] - start['wall'], 6),
+            'peak_rss_bytes': end['peak_rss_bytes'],
+            'pid': os.getpid(),
+        }
+        for field in ('cpu_seconds', 'child_cpu_seconds'):
+            rec[field] = _delta(start, end, field, 6)
+        for field in ('read_bytes', 'written_bytes'):
+            rec[field] = _delta(start, end, field, 0)
+        record(rec)
+        return False
+
+
+def timed(tool, stage=None):
+    """decorator running the function as Stage(tool, stage or its name)"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with Stage(tool, stage or fn.__name__):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _delta(start, end, field, digits):
+    if start[field] == None or end[field] == None:
+        return None
+    value = end[field] - start[field]
+    return round(value, digits) if digits else value
+
+
+def _sample():
+    """
+    the process's counters now.  Fields the platform can't provide
+    are None.
+    """
+    sample = {'time': time.time(), 'wall': time.perf_counter(),
+              'cpu_seconds': None, 'child_cpu_seconds': None,
+              'peak_rss_bytes': None,
+              'read_bytes': None, 'written_bytes': None}
+    try:
+        import resource
+    except ImportError:
+        # windows
+        return sample
+
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    sample['cpu_seconds'] = usage_self.ru_utime + usage_self.ru_stime
+    sample['child_cpu_seconds'] = usage_children.ru_utime + usage_children.ru_stime
+
+    # ru_maxrss is KiB on linux, bytes on darwin
+    rss_scale = 1 if sys.platform == 'darwin' else 1024
+    sample['peak_rss_bytes'] = rss_scale * max(usage_self.ru_maxrss,
+                                               usage_children.ru_maxrss)
+
+    io = _proc_io()
+    if io != None:
+        # includes reaped children
+        sample['read_bytes'] = io.get('read_bytes')
+        sample['written_bytes'] = io.get('write_bytes')
+    else:
+        # block counts: 512 byte units, and only where the fs reports them
+        sample['read_bytes'] = 512 * (usage_self.ru_inblock +
+                                      usage_children.ru_inblock)
+        sample['written_bytes'] = 512 * (usage_self.ru_oublock +
+                                         usage_children.ru_oublock)
+    return sample
+
+
+def _proc_io():
+    """/proc/self/io as a dict, or None off linux or where it is hidden"""
+    try:
+        with open('/proc/self/io', 'rt') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    io = {}
+    for line in lines:
+        name, _, value = line.partition(':')
+        if value.strip().isdigit():
+            io[name.strip()] = int(value)
+    return io
+
+
+class _FileLock:
+    """exclusive flock on path, where there is flock"""
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+
+    def __enter__(self):
+        self._f = open(self.path, 'a')
+        try:
+            import fcntl
+        except ImportError:
+            return self
+        fcntl.flock(self._f.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        # closing releases the flock
+        self._f.close()
+        self._f = None
+        return False
+
+
+def record(rec, out_dir=None):
+    """
+    Append rec to the JSONL file in out_dir (default: $IVMETRICS) and
+    rewrite the textfile with it.  Metrics never fail a build: errors
+    writing them are printed and dropped.
+    """
+    import json
+
+    if out_dir == None:
+        out_dir = metrics_dir()
+    if out_dir == None:
+        return
+
+    line = json.dumps(rec, sort_keys=True) + '\n'
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        with _lock, _FileLock(path_join(out_dir, _LOCK_NAME)):
+            with open(path_join(out_dir, JSONL_NAME), 'at') as f:
+                f.write(line)
+
+            state_path = path_join(out_dir, _STATE_NAME)
+            state = _load_state(state_path)
+            _update_state(state, rec)
+            _write_atomic(path_join(out_dir, TEXTFILE_NAME),
+                          render_textfile(state))
+            _write_atomic(state_path, json.dumps(state, indent=1,
+                                                 sort_keys=True) + '\n')
+    except OSError as e:
+        print("build_metrics: could not write to %s: %s" % (out_dir, e),
+              file=sys.stderr)
+
+
+def _load_state(state_path):
+    import json
+
+    try:
+        with open(state_path, 'rt') as f:
+            state = json.load(f)
+        if state.get('version') == _STATE_VERSION:
+            return state
+    except (OSError, ValueError):
+        pass
+    return {'version': _STATE_VERSION, 'series': {}}
+
+
+def _series_key(rec):
+    return '\0'.join([rec['tool'], rec['stage']] +
+                     ['%s=%s' % item for item in sorted(rec['labels'].items())])
+
+
+def _update_state(state, rec):
+    key = _series_key(rec)
+    series = state['series'].get(key)
+    if series == None:
+        series = {'runs': 0, 'cache_hits': 0, 'failures': 0}
+        state['series'][key] = series
+    series['last'] = rec
+    series['runs'] += 1
+    if rec['cache_hit']:
+        series['cache_hits'] += 1
+    if not rec['ok']:
+        series['failures'] += 1
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_str(rec):
+    labels = [('tool', rec['tool']), ('stage', rec['stage'])] + \
+        sorted(rec['labels'].items())
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape_label(value))
+                             for name, value in labels)
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def render_textfile(state):
+    """the node_exporter textfile for state, as a str"""
+    series = [state['series'][key] for key in sorted(state['series'])]
+    lines = []
+    for name, help_str, field in _GAUGES:
+        samples = [(s['last'], s['last'].get(field)) for s in series]
+        samples = [(rec, value) for rec, value in samples if value != None]
+        if len(samples) == 0:
+            continue
+        lines.append('# HELP %s %s' % (name, help_str))
+        lines.append('# TYPE %s gauge' % name)
+        for rec, value in samples:
+            lines.append('%s%s %s' % (name, _label_str(rec), _format_value(value)))
+
+    for name, help_str, field in _COUNTERS:
+        if len(series) == 0:
+            break
+        lines.append('# HELP %s %s' % (name, help_str))
+        lines.append('# TYPE %s counter' % name)
+        for s in series:
+            lines.append('%s%s %d' % (name, _label_str(s['last']), s[field]))
+    return '\n'.join(lines) + '\n'
+
+
+def _write_atomic(path, text):
+    """write via a rename, so the collector never reads half a file"""
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wt') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2016 Frogtoss Games, Inc.
+#
+# Usage rights granted under repo license
+#
+
+"""
+Binary deltas between two released .tar.gz dist archives.
+
+The delta is computed over the uncompressed tar streams, since a
+change of a few bytes in the compressed stream moves everything after
+it.  Applying a delta rebuilds the new tar stream byte-for-byte and
+verifies it against the SHA-256 of the tar stream recorded when the
+delta was made.
+
+The rebuilt tar stream is then gzipped again, which does not give the
+released .tar.gz's bytes back: the released archive was compressed by
+tar z, with its own gzip header.  So the rebuilt archive's sha256 is
+not the one in its manifest, but dist_tool.py verify passes it by
+checking its members, as it does for any recompressed archive.
+"""
+
+import io
+import gzip
+import lzma
+import struct
+import hashlib
+
+_MAGIC = b'IVDELTA1'
+
+# Old archive is indexed on this stride; any run of at least twice
+# this length that also exists in the old archive is found.
+_BLOCK_SIZE = 64
+
+_OP_COPY   = 0
+_OP_INSERT = 1
+
+class DeltaError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return repr(self.message)
+
+
+def read_tar_stream(archive_path):
+    """
+    return the uncompressed tar stream of a .tar.gz archive
+    """
+    with gzip.open(archive_path, 'rb') as f:
+        return f.read()
+
+
+def make_delta(old_archive_path, new_archive_path, delta_path):
+    """
+    Write a delta to delta_path that turns old_archive_path into
+    new_archive_path.  Returns the size of the delta file in bytes.
+    """
+    old = read_tar_stream(old_archive_path)
+    new = read_tar_stream(new_archive_path)
+
+    ops = _diff(old, new)
+
+    body = io.BytesIO()
+    for op in ops:
+        if op[0] == _OP_COPY:
+            body.write(struct.pack('<BQQ', _OP_COPY, op[1], op[2]))
+        else:
+            body.write(struct.pack('<BQ', _OP_INSERT, len(op[1])))
+            body.write(op[1])
+
+    header = _MAGIC
+    header += hashlib.sha256(old).digest()
+    header += hashlib.sha256(new).digest()
+    header += struct.pack('<Q', len(new))
+
+    with open(delta_path, 'wb') as f:
+        f.write(header)
+        f.write(lzma.compress(body.getvalue(), preset=9))
+        return f.tell()
+
+
+def apply_delta(old_archive_path, delta_path, out_archive_path):
+    """
+    Rebuild the new archive from old_archive_path and a delta, writing
+    it to out_archive_path.  Raises DeltaError if the old archive is
+    not the one the delta was made against, or if the result does not
+    match.
+
+    What is verified is the uncompressed tar stream.  The gzip around
+    it is written here, so out_archive_path holds the same files as
+    the released archive but not its bytes; check it against the
+    manifest with dist_tool.py verify, not by archive sha256.
+    """
+    old = read_tar_stream(old_archive_path)
+    old_digest, new_digest, new_len, body = _read_delta(delta_path)
+
+    if hashlib.sha256(old).digest() != old_digest:
+        raise DeltaError("%s is not the archive this delta was made against" %
+                         old_archive_path)
+
+    new = bytearray()
+    new_len_found = _run_ops(old, body, new.extend)
+    if new_len_found != new_len or hashlib.sha256(new).digest() != new_digest:
+        raise DeltaError("rebuilt archive does not match the delta checksum")
+
+    # mtime=0 so that applying the same delta twice gives identical
+    # files.  They still differ from the released archive; see above
+    with open(out_archive_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+            f.write(new)
+
+
+def verify_delta(old_archive_path, delta_path, new_archive_path):
+    """
+    return True if applying the delta to old_archive_path yields the
+    same tar stream as new_archive_path.  The delta's ops are run into
+    a hash, so a corrupt body fails even when its header matches.
+    Raises DeltaError if the delta can't be read or decoded.
+    """
+    old_digest, new_digest, new_len, body = _read_delta(delta_path)
+
+    new = read_tar_stream(new_archive_path)
+    if hashlib.sha256(new).digest() != new_digest:
+        return False
+
+    old = read_tar_stream(old_archive_path)
+    if hashlib.sha256(old).digest() != old_digest:
+        return False
+
+    h = hashlib.sha256()
+    if _run_ops(old, body, h.update) != new_len:
+        return False
+    return h.digest() == new_digest
+
+
+def _run_ops(old, body, write):
+    """
+    Pass each piece of the rebuilt tar stream to write, in order.
+    returns the length of the stream.  Raises DeltaError on an op that
+    is unknown, truncated or reaches outside old.
+    """
+    old = memoryview(old)
+    body = memoryview(body)
+    total = 0
+    pos = 0
+    try:
+        while pos < len(body):
+            op = body[pos]
+            if op == _OP_COPY:
+                offset, length = struct.unpack_from('<QQ', body, pos+1)
+                if offset + length > len(old):
+                    raise DeltaError("corrupt delta: copy past the end of "
+                                     "the old archive")
+                write(old[offset:offset+length])
+                pos += 17
+            elif op == _OP_INSERT:
+                length, = struct.unpack_from('<Q', body, pos+1)
+                if pos + 9 + length > len(body):
+                    raise DeltaError("corrupt delta: insert past the end "
+                                     "of the delta")
+                write(body[pos+9:pos+9+length])
+                pos += 9 + length
+            else:
+                raise DeltaError("corrupt delta: unknown op %d" % op)
+            total += length
+    except struct.error:
+        raise DeltaError("corrupt delta: truncated op")
+    return total
+
+
+def _read_delta(delta_path):
+    with open(delta_path, 'rb') as f:
+        data = f.read()
+
+    if not data.startswith(_MAGIC):
+        raise DeltaError("%s is not a dist delta" % delta_path)
+
+    pos = len(_MAGIC)
+    try:
+        old_digest = data[pos:pos+32]
+        new_digest = data[pos+32:pos+64]
+        new_len, = struct.unpack_from('<Q', data, pos+64)
+        body = lzma.decompress(data[pos+72:])
+    except (lzma.LZMAError, struct.error, EOFError) as e:
+        raise DeltaError("%s is truncated or corrupt: %s" % (delta_path, e))
+    return (old_digest, new_digest, new_len, body)
+
+
+def _diff(old, new):
+    """
+    Greedy block match.  Returns a list of (_OP_COPY, offset, length)
+    and (_OP_INSERT, bytes) tuples.
+    """
+    B = _BLOCK_SIZE
+    index = {}
+    for offset in range(0, len(old) - B + 1, B):
+        index.setdefault(old[offset:offset+B], offset)
+
+    ops = []
+    literal_start = 0
+    i = 0
+    end = len(new) - B
+    while i <= end:
+        offset = index.get(new[i:i+B])
+        if offset is None:
+            i += 1
+            continue
+
+        # extend backwards into the pending literal run
+        back = 0
+        while back < i - literal_start and back < offset and \
+              old[offset-back-1] == new[i-back-1]:
+            back += 1
+
+        # extend forwards, a chunk at a time, then byte by byte
+        length = B
+        chunk = 4096
+        while True:
+            a = old[offset+length:offset+length+chunk]
+            if a and a == new[i+length:i+length+len(a)]:
+                length += len(a)
+            else:
+                break
+        while offset+length < len(old) and i+length < len(new) and \
+              old[offset+length] == new[i+length]:
+            length += 1
+
+        if i - back > literal_start:
+            ops.append((_OP_INSERT, new[literal_start:i-back]))
+        ops.append((_OP_COPY, offset-back, length+back))
+
+        i += length
+        literal_start = i
+
+    if literal_start < len(new):
+        ops.append((_OP_INSERT, new[literal_start:]))
+    return ops
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2016 Frogtoss Games, Inc.
+#
+# Usage rights granted under repo license
+#
+
+"""
+Checksum manifests for dist outputs.
+
+A manifest records the size and SHA-256 of a finished archive and of
+every file that went into it, keyed by the path the file has inside
+the archive (or inside the installed tree).  It is written as JSON
+next to the archive, as <archive>.manifest.json.
+"""
+
+import os
+import json
+import mmap
+import hashlib
+import tarfile
+import concurrent.futures
+
+from os.path import join as path_join
+
+MANIFEST_SUFFIX = '.manifest.json'
+
+_STREAM_CHUNK = 1024 * 1024
+
+def hash_file(path):
+    """
+    return (size, sha256 hexdigest) for the file at path
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        # mmap can't map empty files
+        if size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                h.update(m)
+    return (size, h.hexdigest())
+
+
+def tree_members(root, prefix=''):
+    """
+    return a sorted list of (member_name, path) for every file under
+    root.  Member names use forward slashes and start with prefix.
+    """
+    members = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        for filename in filenames:
+            if rel_dir == '.':
+                name = filename
+            else:
+                name = path_join(rel_dir, filename).replace(os.sep, '/')
+            members.append((prefix + name, path_join(dirpath, filename)))
+    members.sort()
+    return members
+
+
+def build_manifest(members, archive_path, jobs=None):
+    """
+    Hash members, a list of (member_name, path), and the archive at
+    archive_path on a thread pool.  Returns the manifest dict.
+    """
+    paths = [path for name, path in members] + [archive_path]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(hash_file, paths))
+
+    manifest = {'archive': {}, 'members': []}
+    for (name, path), (size, digest) in zip(members, results):
+        manifest['members'].append({'path': name,
+                                    'size': size,
+                                    'sha256': digest})
+
+    size, digest = results[-1]
+    manifest['archive'] = {'name': os.path.basename(archive_path),
+                           'size': size,
+                           'sha256': digest}
+    return manifest
+
+
+def write_manifest(manifest, manifest_path):
+    with open(manifest_path, 'wt') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+        f.write('\n')
+
+
+def read_manifest(manifest_path):
+    with open(manifest_path, 'rt') as f:
+        return json.load(f)
+
+
+def verify_archive(manifest, archive_path):
+    """
+    Check archive_path against manifest, stopping at the first
+    mismatch.  Returns None on success, or a string describing the
+    mismatch.
+
+    If the archive bytes match, the members are not checked.  If they
+    don't and the archive is a tarball, its members are streamed and
+    checked one by one, which catches archives that were recompressed
+    but still hold the same files.
+    """
+    expected = manifest['archive']
+    if os.path.getsize(archive_path) == expected['size']:
+        if _hash_stream_path(archive_path) == expected['sha256']:
+            return None
+
+    if not tarfile.is_tarfile(archive_path):
+        return "%s: archive checksum mismatch" % archive_path
+
+    remaining = {m['path']: m for m in manifest['members']}
+    with tarfile.open(archive_path, 'r|*') as tar:
+        for info in tar:
+            if not info.isfile():
+                continue
+            name = _normalize_member_name(info.name)
+            entry = remaining.pop(name, None)
+            if entry is None:
+                return "%s: not in manifest" % name
+            if info.size != entry['size']:
+                return "%s: size %d, expected %d" % \
+                    (name, info.size, entry['size'])
+            if _hash_stream(tar.extractfile(info)) != entry['sha256']:
+                return "%s: checksum mismatch" % name
+
+    if len(remaining) != 0:
+        return "%s: missing from archive" % sorted(remaining)[0]
+    return None
+
+
+def verify_tree(manifest, root):
+    """
+    Check an installed or extracted tree at root against manifest,
+    stopping at the first mismatch.  Returns None on success, or a
+    string describing the mismatch.
+    """
+    for entry in manifest['members']:
+        path = path_join(root, *entry['path'].split('/'))
+        if not os.path.isfile(path):
+            return "%s: missing" % entry['path']
+        if os.path.getsize(path) != entry['size']:
+            return "%s: size %d, expected %d" % \
+                (entry['path'], os.path.getsize(path), entry['size'])
+        if hash_file(path)[1] != entry['sha256']:
+            return "%s: checksum mismatch" % entry['path']
+    return None
+
+
+def _normalize_member_name(name):
+    while name.startswith('./'):
+        name = name[2:]
+    return name
+
+
+def _hash_stream(f):
+    h = hashlib.sha256()
+    while True:
+        buf = f.read(_STREAM_CHUNK)
+        if not buf:
+            break
+        h.update(buf)
+    return h.hexdigest()
+
+
+def _hash_stream_path(path):
+    with open(path, 'rb') as f:
+        return _hash_stream(f)
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2016 Frogtoss Games, Inc.
+#
+# Usage rights granted under repo license
+#
+
+"""
+Resolve the shared library closure of an ELF executable by reading
+DT_NEEDED, DT_RPATH and DT_RUNPATH directly, the way ld.so would,
+without running ldd.
+
+Libraries matching the system library allowlist are expected to be on
+every user's machine.  They are neither bundled nor scanned further.
+Everything else in the closure must be resolvable and gets bundled.
+"""
+
+import os
+import glob
+import json
+import fnmatch
+import hashlib
+
+import elf_file
+from os.path import join as path_join
+
+# fnmatch patterns of sonames that are never bundled
+DEFAULT_SYSTEM_LIBS = (
+    'linux-vdso.so.*',
+    'linux-gate.so.*',
+    'ld-linux*.so.*',
+    'libc.so.*',
+    'libm.so.*',
+    'libdl.so.*',
+    'libpthread.so.*',
+    'librt.so.*',
+    'libresolv.so.*',
+    'libstdc++.so.*',
+    'libgcc_s.so.*',
+    'libGL.so.*',
+    'libGLX.so.*',
+    'libGLdispatch.so.*',
+    'libEGL.so.*',
+    'libX*.so.*',
+    'libxcb*.so.*',
+    'libasound.so.*',
+    'libpulse*.so.*',
+    'libudev.so.*',
+    'libdbus-1.so.*',
+)
+
+_DEFAULT_LIB_DIRS = ('/lib', '/usr/lib', '/lib64', '/usr/lib64')
+
+# bump when the cached record format changes
+_CACHE_VERSION = 1
+
+class DepError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return repr(self.message)
+
+
+def read_allowlist(path):
+    """
+    read a system library allowlist: one fnmatch soname pattern per
+    line, # starts a comment.
+    """
+    patterns = []
+    with open(path, 'rt') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if len(line) != 0:
+                patterns.append(line)
+    return tuple(patterns)
+
+
+def is_system_lib(soname, allowlist):
+    for pattern in allowlist:
+        if fnmatch.fnmatchcase(soname, pattern):
+            return True
+    return False
+
+
+class DepCache:
+    """
+    Parsed dynamic sections keyed by file SHA-256, persisted as JSON.
+
+    (path, size, mtime) is remembered alongside each hash so unchanged
+    files are not rehashed on every run.  Paths that no longer exist,
+    like an exe staged in a temp dir, and parsed files no remaining
+    path hashes to, are dropped on save.
+    """
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path
+        self._dirty = False
+        self._data = {'version': _CACHE_VERSION, 'files': {}, 'stats': {}}
+
+        if cache_path != None and os.path.isfile(cache_path):
+            try:
+                with open(cache_path, 'rt') as f:
+                    data = json.load(f)
+                if data.get('version') == _CACHE_VERSION:
+                    self._data = data
+            except (OSError, ValueError):
+                pass
+
+    def lookup(self, path):
+        """
+        return the dynamic info dict for the ELF file at path, parsing
+        it only on a cache miss.
+        """
+        st = os.stat(path)
+        stat_key = [st.st_size, st.st_mtime_ns]
+        prev = self._data['stats'].get(path)
+        if prev != None and prev[:2] == stat_key:
+            digest = prev[2]
+        else:
+            digest = _hash_file(path)
+            self._data['stats'][path] = stat_key + [digest]
+            self._dirty = True
+
+        info = self._data['files'].get(digest)
+        if info == None:
+            elf = elf_file.ElfFile(path)
+            info = elf.dynamic()
+            info['is_64'] = elf.is_64
+            info['machine'] = elf.machine
+            self._data['files'][digest] = info
+            self._dirty = True
+        return info
+
+    def save(self):
+        if self.cache_path == None or not self._dirty:
+            return
+        stats = self._data['stats']
+        for path in [p for p in stats if not os.path.exists(p)]:
+            del stats[path]
+        live = set(stat[2] for stat in stats.values())
+        files = self._data['files']
+        for digest in [d for d in files if d not in live]:
+            del files[digest]
+
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'wt') as f:
+            json.dump(self._data, f)
+        os.replace(tmp_path, self.cache_path)
+        self._dirty = False
+
+
+def scan_closure(exe_path, allowlist=DEFAULT_SYSTEM_LIBS, cache=None,
+                 extra_lib_dirs=()):
+    """
+    Walk the shared library closure of exe_path.
+
+    Returns (bundle, system) where bundle is a dict of soname to the
+    resolved path of every library that must ship with the exe, and
+    system is a sorted list of sonames left to the user's system.
+
+    Raises DepError if a library that needs bundling can't be found,
+    or exe_path can't be parsed.
+
+    extra_lib_dirs are searched after the exe's own paths and before
+    the system dirs; pass the vendors lib dir here.
+    """
+    if cache == None:
+        cache = DepCache()
+
+    try:
+        exe_info = cache.lookup(exe_path)
+    except elf_file.ElfError as e:
+        raise DepError(e.message)
+    system_dirs = _system_lib_dirs()
+    ld_library_path = _split_path_list(os.environ.get('LD_LIBRARY_PATH', ''))
+
+    bundle = {}
+    system = set()
+    pending = [(exe_path, exe_info)]
+    while len(pending) != 0:
+        loader_path, loader_info = pending.pop()
+        origin = os.path.dirname(os.path.realpath(loader_path))
+
+        # glibc: DT_RPATH only applies when DT_RUNPATH is absent
+        search = []
+        if len(loader_info['runpath']) == 0:
+            search += _expand_origin(loader_info['rpath'], origin)
+        search += ld_library_path
+        search += _expand_origin(loader_info['runpath'], origin)
+        search += list(extra_lib_dirs)
+        search += system_dirs
+
+        for soname in loader_info['needed']:
+            if soname in bundle or soname in system:
+                continue
+            if is_system_lib(soname, allowlist):
+                system.add(soname)
+                continue
+
+            lib_path, lib_info = _find_lib(soname, search, exe_info, cache)
+            if lib_path == None:
+                raise DepError("%s (needed by %s) not found" % \
+                               (soname, loader_path))
+            bundle[soname] = lib_path
+            pending.append((lib_path, lib_info))
+
+    cache.save()
+    return (bundle, sorted(system))
+
+
+def _find_lib(soname, search, exe_info, cache):
+    if '/' in soname:
+        candidates = [soname]
+    else:
+        candidates = [path_join(d, soname) for d in search]
+
+    for path in candidates:
+        if not os.path.isfile(path):
+            continue
+        try:
+            info = cache.lookup(path)
+        except elf_file.ElfError:
+            continue
+        # skip libs for the other word size, as ld.so does
+        if info['is_64'] != exe_info['is_64'] or \
+           info['machine'] != exe_info['machine']:
+            continue
+        return (path, info)
+    return (None, None)
+
+
+def _expand_origin(dirs, origin):
+    expanded = []
+    for d in dirs:
+        if len(d) == 0:
+            continue
+        d = d.replace('${ORIGIN}', origin).replace('$ORIGIN', origin)
+        expanded.append(d)
+    return expanded
+
+
+def _split_path_list(s):
+    return [d for d in s.replace(';', ':').split(':') if len(d) != 0]
+
+
+_system_lib_dirs_memo = None
+
+def _system_lib_dirs():
+    """
+    dirs from /etc/ld.so.conf, then the defaults.  This stands in for
+    ld.so.cache, which lists the libs found in exactly these dirs.
+    """
+    global _system_lib_dirs_memo
+    if _system_lib_dirs_memo == None:
+        dirs = []
+        _read_ld_so_conf('/etc/ld.so.conf', dirs, set())
+        for d in _DEFAULT_LIB_DIRS:
+            if d not in dirs:
+                dirs.append(d)
+        _system_lib_dirs_memo = [d for d in dirs if os.path.isdir(d)]
+    return _system_lib_dirs_memo
+
+
+def _read_ld_so_conf(conf_path, dirs, seen):
+    if conf_path in seen or not os.path.isfile(conf_path):
+        return
+    seen.add(conf_path)
+
+    with open(conf_path, 'rt') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if len(line) == 0:
+                continue
+            if line.startswith('include'):
+                pattern = line.split(None, 1)[1]
+                if not os.path.isabs(pattern):
+                    pattern = path_join(os.path.dirname(conf_path), pattern)
+                for included in sorted(glob.glob(pattern)):
+                    _read_ld_so_conf(included, dirs, seen)
+            elif line not in dirs:
+                dirs.append(line)
+
+
+def _hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(1024 * 1024)
+            if not buf:
+                break
+            h.update(buf)
+    return h.hexdigest()
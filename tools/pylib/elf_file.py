@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2016 Frogtoss Games, Inc.
+#
+# Usage rights granted under repo license
+#
+
+"""
+Minimal ELF reader.  Only reads what make_dist needs, without running
+readelf or objdump.
+"""
+
+import mmap
+import struct
+
+_ELF_MAGIC = b'\x7fELF'
+
+(_ELFCLASS32, _ELFCLASS64) = (1, 2)
+(_ELFDATA2LSB, _ELFDATA2MSB) = (1, 2)
+
+_NT_GNU_BUILD_ID = 3
+_SHT_NOTE = 7
+_SHT_DYNAMIC = 6
+
+_DT_NULL    = 0
+_DT_NEEDED  = 1
+_DT_SONAME  = 14
+_DT_RPATH   = 15
+_DT_RUNPATH = 29
+
+class ElfError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return repr(self.message)
+
+
+def is_elf(path):
+    with open(path, 'rb') as f:
+        return f.read(4) == _ELF_MAGIC
+
+
+class ElfFile:
+    """
+    Parsed headers of one ELF file.
+
+    is_64:   True for ELFCLASS64
+    machine: e_machine
+    sections: list of (name, type, offset, size, link)
+    """
+    def __init__(self, path):
+        self.path = path
+
+        # mapped rather than read: only the headers and a few sections
+        # are ever touched, even in large shared libs
+        with open(path, 'rb') as f:
+            try:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError: # empty file
+                self._data = b''
+
+        data = self._data
+        if data[:4] != _ELF_MAGIC:
+            raise ElfError("%s is not an ELF file" % path)
+        if len(data) < 16:
+            raise self._truncated("e_ident")
+
+        if data[4] == _ELFCLASS32:
+            self.is_64 = False
+        elif data[4] == _ELFCLASS64:
+            self.is_64 = True
+        else:
+            raise ElfError("%s: unknown ELF class %d" % (path, data[4]))
+
+        if data[5] == _ELFDATA2LSB:
+            self._endian = '<'
+        elif data[5] == _ELFDATA2MSB:
+            self._endian = '>'
+        else:
+            raise ElfError("%s: unknown ELF data encoding %d" % (path, data[5]))
+
+        if self.is_64:
+            (_, self.machine, _, _, self._phoff, self._shoff, _,
+             _, self._phentsize, self._phnum, self._shentsize,
+             self._shnum, self._shstrndx) = \
+                self._unpack('HHIQQQIHHHHHH', 16)
+        else:
+            (_, self.machine, _, _, self._phoff, self._shoff, _,
+             _, self._phentsize, self._phnum, self._shentsize,
+             self._shnum, self._shstrndx) = \
+                self._unpack('HHIIIIIHHHHHH', 16)
+
+        self.sections = self._read_sections()
+
+    def build_id(self):
+        """
+        return the GNU build-id as a hex string, or None if the
+        file has none.
+        """
+        for name, sh_type, offset, size, link in self.sections:
+            if sh_type != _SHT_NOTE:
+                continue
+            for n_type, n_name, desc in self._read_notes(offset, size):
+                if n_type == _NT_GNU_BUILD_ID and n_name == b'GNU':
+                    return desc.hex()
+        return None
+
+    def dynamic(self):
+        """
+        return a dict of the dynamic linking entries:
+
+        needed:  list of DT_NEEDED sonames, in load order
+        rpath:   list of DT_RPATH dirs
+        runpath: list of DT_RUNPATH dirs
+        soname:  DT_SONAME or None
+
+        Statically linked files return empty lists.
+        """
+        result = {'needed': [], 'rpath': [], 'runpath': [], 'soname': None}
+
+        for name, sh_type, offset, size, link in self.sections:
+            if sh_type != _SHT_DYNAMIC:
+                continue
+            if link >= len(self.sections):
+                raise self._truncated("sh_link %d of %s" % (link, name))
+            strtab_offset = self.sections[link][2]
+
+            if self.is_64:
+                fmt, entsize = 'qQ', 16
+            else:
+                fmt, entsize = 'iI', 8
+
+            for entry_offset in range(offset, offset + size, entsize):
+                d_tag, d_val = self._unpack(fmt, entry_offset)
+                if d_tag == _DT_NULL:
+                    break
+                if d_tag == _DT_NEEDED:
+                    result['needed'].append(self._cstring(strtab_offset + d_val))
+                elif d_tag == _DT_SONAME:
+                    result['soname'] = self._cstring(strtab_offset + d_val)
+                elif d_tag == _DT_RPATH:
+                    result['rpath'].extend(
+                        self._cstring(strtab_offset + d_val).split(':'))
+                elif d_tag == _DT_RUNPATH:
+                    result['runpath'].extend(
+                        self._cstring(strtab_offset + d_val).split(':'))
+        return result
+
+    def _truncated(self, what):
+        return ElfError("%s: truncated or corrupt ELF file (bad %s)" % \
+                        (self.path, what))
+
+    def _unpack(self, fmt, offset):
+        try:
+            return struct.unpack_from(self._endian + fmt, self._data, offset)
+        except (struct.error, OverflowError):
+            raise self._truncated("offset %d" % offset)
+
+    def _read_sections(self):
+        if self._shoff == 0 or self._shnum == 0:
+            return []
+
+        if self.is_64:
+            fmt = 'IIQQQQIIQQ'
+        else:
+            fmt = 'IIIIIIIIII'
+
+        raw = []
+        for i in range(self._shnum):
+            (sh_name, sh_type, _, _, sh_offset, sh_size, sh_link, _, _, _) = \
+                self._unpack(fmt, self._shoff + i * self._shentsize)
+            raw.append((sh_name, sh_type, sh_offset, sh_size, sh_link))
+
+        if self._shstrndx >= len(raw):
+            raise self._truncated("e_shstrndx %d" % self._shstrndx)
+        strtab_offset = raw[self._shstrndx][2]
+        sections = []
+        for sh_name, sh_type, sh_offset, sh_size, sh_link in raw:
+            sections.append((self._cstring(strtab_offset + sh_name),
+                             sh_type, sh_offset, sh_size, sh_link))
+        return sections
+
+    def _read_notes(self, offset, size):
+        notes = []
+        end = offset + size
+        while offset + 12 <= end:
+            namesz, descsz, n_type = self._unpack('III', offset)
+            offset += 12
+            name = self._data[offset:offset+namesz].rstrip(b'\0')
+            offset += (namesz + 3) & ~3
+            desc = self._data[offset:offset+descsz]
+            offset += (descsz + 3) & ~3
+            notes.append((n_type, name, desc))
+        return notes
+
+    def _cstring(self, offset):
+        end = -1
+        if offset < len(self._data):
+            end = self._data.find(b'\0', offset)
+        if end == -1:
+            raise self._truncated("string offset %d" % offset)
+        return self._data[offset:end].decode('utf-8', 'replace')
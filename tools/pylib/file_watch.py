@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2016 Frogtoss Games, Inc.
+#
+# Usage rights granted under repo license
+#
+
+"""
+Watch files and directory trees for changes.
+
+On linux, inotify is used through ctypes, with one watch per directory.
+Everywhere else, or if inotify runs out of watches, the trees are
+polled by stat().  Both watchers report paths, not event types.
+"""
+
+import os
+import sys
+import time
+import fnmatch
+
+from os.path import join as path_join
+
+# linux/inotify.h
+_IN_MODIFY      = 0x00000002
+_IN_ATTRIB      = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM  = 0x00000040
+_IN_MOVED_TO    = 0x00000080
+_IN_CREATE      = 0x00000100
+_IN_DELETE      = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF   = 0x00000800
+_IN_Q_OVERFLOW  = 0x00004000
+_IN_IGNORED     = 0x00008000
+_IN_ONLYDIR     = 0x01000000
+_IN_ISDIR       = 0x40000000
+_IN_NONBLOCK    = 0o4000
+_IN_CLOEXEC     = 0o2000000
+
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | \
+    _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF
+
+class WatchError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return repr(self.message)
+
+
+def _excluded(name, excludes):
+    for pattern in excludes:
+        if fnmatch.fnmatchcase(name, pattern):
+            return True
+    return False
+
+
+class InotifyWatcher:
+    """
+    roots: files and dirs to watch; dirs are watched recursively.
+    excludes: fnmatch patterns of names to ignore, and not descend into.
+
+    Raises WatchError if inotify is unavailable or out of watches.
+    """
+    name = 'inotify'
+
+    def __init__(self, roots, excludes=()):
+        import ctypes
+        import ctypes.util
+
+        self.excludes = tuple(excludes)
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or None,
+                                 use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise WatchError("no inotify in libc")
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise WatchError("inotify_init1: %s" % \
+                             os.strerror(ctypes.get_errno()))
+
+        # wd -> (dir path, names to report or None for all, recursive)
+        self._watches = {}
+        self._roots = [os.path.abspath(root) for root in roots]
+        try:
+            for root in self._roots:
+                if os.path.isdir(root):
+                    self._add_tree(root)
+                else:
+                    parent, name = os.path.split(root)
+                    self._add_dir(parent, names={name}, recursive=False)
+        except WatchError:
+            self.close()
+            raise
+
+    def _add_dir(self, path, names=None, recursive=True):
+        import ctypes
+
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path),
+                                          _WATCH_MASK | _IN_ONLYDIR)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            if errno == 28: # ENOSPC: fs.inotify.max_user_watches
+                raise WatchError("out of inotify watches at %s" % path)
+            # gone already, or not a dir
+            return
+        # the same dir again: another file root in it, or a file root's
+        # dir that is also in a tree
+        prev = self._watches.get(wd)
+        if prev != None:
+            if prev[1] == None or names == None:
+                names = None
+            else:
+                names = prev[1] | names
+            recursive = recursive or prev[2]
+        self._watches[wd] = (path, names, recursive)
+
+    def _add_tree(self, root):
+        """watch root and every dir under it; returns the files found"""
+        found = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames
+                           if not _excluded(d, self.excludes)]
+            self._add_dir(dirpath)
+            found += [path_join(dirpath, f) for f in filenames
+                      if not _excluded(f, self.excludes)]
+        return found
+
+    def wait(self, timeout=None):
+        """
+        return the paths changed since the last call, waiting up to
+        timeout seconds (forever if None) for the first one.
+        """
+        import select
+        import struct
+
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if len(ready) == 0:
+            return []
+
+        changed = set()
+        while True:
+            try:
+                buf = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset + 16 <= len(buf):
+                wd, mask, cookie, name_len = struct.unpack_from('iIII', buf, offset)
+                name = buf[offset + 16:offset + 16 + name_len].rstrip(b'\0')
+                offset += 16 + name_len
+
+                if mask & _IN_Q_OVERFLOW:
+                    # events were lost; everything may have changed
+                    changed.update(self._roots)
+                    continue
+                if mask & _IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+                watch = self._watches.get(wd)
+                if watch == None:
+                    continue
+                dir_path, names, recursive = watch
+                name = os.fsdecode(name)
+                if names != None and name not in names:
+                    continue
+                if name != '' and _excluded(name, self.excludes):
+                    continue
+
+                path = path_join(dir_path, name) if name else dir_path
+                changed.add(path)
+                if recursive and mask & _IN_ISDIR and \
+                   mask & (_IN_CREATE | _IN_MOVED_TO):
+                    # a new dir: watch it, and count what's already in it
+                    changed.update(self._add_tree(path))
+        return sorted(changed)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """
+    Same interface as InotifyWatcher, comparing stat() snapshots of the
+    roots every interval seconds.
+    """
+    name = 'polling'
+
+    def __init__(self, roots, excludes=(), interval=0.5):
+        self.excludes = tuple(excludes)
+        self.interval = interval
+        self._roots = [os.path.abspath(root) for root in roots]
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for root in self._roots:
+            if not os.path.isdir(root):
+                try:
+                    st = os.stat(root)
+                    snapshot[root] = (st.st_size, st.st_mtime_ns)
+                except FileNotFoundError:
+                    pass
+                continue
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = [d for d in dirnames
+                               if not _excluded(d, self.excludes)]
+                for f in filenames:
+                    if _excluded(f, self.excludes):
+                        continue
+                    path = path_join(dirpath, f)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    snapshot[path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout=None):
+        deadline = None if timeout == None else time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = [path for path in set(snapshot) | set(self._snapshot)
+                       if snapshot.get(path) != self._snapshot.get(path)]
+            self._snapshot = snapshot
+            if len(changed) != 0:
+                return sorted(changed)
+
+            delay = self.interval
+            if deadline != None:
+                delay = min(delay, deadline - time.monotonic())
+                if delay <= 0:
+                    return []
+            time.sleep(delay)
+
+    def close(self):
+        pass
+
+
+def make_watcher(roots, excludes=(), polling=False, log=print):
+    """inotify where it works, else polling"""
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(roots, excludes)
+        except (WatchError, OSError) as e:
+            log("inotify unavailable (%s); polling instead" % \
+                getattr(e, 'message', e))
+    return PollingWatcher(roots, excludes)
+
+
+def wait_for_changes(watcher, debounce=0.1, max_delay=2.0):
+    """
+    Block until something changes, then keep collecting until nothing
+    has changed for debounce seconds, or max_delay has passed since the
+    first change, so a burst of saves is one batch.
+
+    returns (paths, time.time() of the first change).  The first change
+    is dated by the earliest mtime among the changed files, as a poll
+    only notices it later.
+    """
+    paths = set(watcher.wait())
+    noticed = time.time()
+    start = time.monotonic()
+    while time.monotonic() - start < max_delay:
+        more = watcher.wait(debounce)
+        if len(more) == 0:
+            break
+        paths.update(more)
+
+    first = noticed
+    for path in paths:
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            continue
+        # ignore mtimes from the past, like an mv of an old file
+        if noticed - 5.0 < mtime < first:
+            first = mtime
+    return (sorted(paths), first)
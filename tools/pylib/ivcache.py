@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2016 Frogtoss Games, Inc.
+#
+# Usage rights granted under repo license
+#
+
+"""
+Where the build tools keep their caches.  Imports only os, so entry
+points can use it without paying for anything else.
+"""
+
+import os
+
+def get_cache_dir():
+    """
+    Cache for build and dist tooling.  Set IVCACHE to override,
+    following the IVROOT/IVBIN convention in vendor_build.py.
+    """
+    if 'IVCACHE' in os.environ:
+        return os.environ['IVCACHE']
+    return os.path.join(os.path.expanduser('~'), '.cache', 'investickgator')
@@ -11,22 +11,27 @@ This module packages up a built Native Project Standards project into
 installers, bundles or zip files for distribution.
 """
 
-import re
 import sys
 import time
 import copy
-import glob
 import shutil
 import os.path
 import argparse
-import tempfile
 import subprocess
 
-from apple_bundle import AppleBundle
 from os.path import join as path_join
 
+import build_metrics
+from ivcache import get_cache_dir
+
+# Modules only some code paths need (re, glob, tempfile, dist_manifest,
+# apple_bundle, ...) are imported inside the functions that use them,
+# keeping build_dist.py --help and argument errors fast.
+
 _VALID_ARCHS = ('x86', 'x64')
 
+_FINGERPRINT_SUFFIX = '.fingerprint.json'
+
 def dist_cli(argv):
     """
     DistCLI queries the user for command line options.
@@ -43,6 +48,36 @@ def dist_cli(argv):
     parser.add_argument('-o', '--output-dir', dest='output_dir',
                         default='.',
                         help='output dir to place finished archive')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                        default=os.cpu_count(),
+                        help='worker threads for hashing and icons '
+                        '(default %d)' % \
+                        os.cpu_count())
+    parser.add_argument('--split-debug', dest='split_debug',
+                        action='store_true', default=False,
+                        help='linux: strip the exe and ship its debug info '
+                        'in a separate symbol archive.  Needs an exe built '
+                        'with -g; the gmake release configs link with -s, '
+                        'so this is skipped for them')
+    parser.add_argument('-f', '--force', dest='force',
+                        action='store_true', default=False,
+                        help='rebuild even if no inputs have changed')
+    parser.add_argument('--system-libs', dest='system_libs',
+                        default=None,
+                        help='linux: file of soname patterns that are never '
+                        'bundled (default: elf_deps.DEFAULT_SYSTEM_LIBS)')
+    parser.add_argument('--optimize-icons', dest='optimize_icons',
+                        action='store_true', default=False,
+                        help='losslessly optimize the pngs inside generated '
+                        'icons')
+    parser.add_argument('--reproducible', dest='reproducible',
+                        action='store_true', default=False,
+                        help='linux: archives depend only on file names and '
+                        'contents; timestamps come from SOURCE_DATE_EPOCH')
+    parser.add_argument('--delta-dir', dest='delta_dir',
+                        default=None,
+                        help='dir of previous release archives to build '
+                        'binary deltas against (.tar.gz only)')
     args = parser.parse_args()
 
     if args.target_arch not in _VALID_ARCHS:
@@ -50,6 +85,20 @@ def dist_cli(argv):
               (', '.join(_VALID_ARCHS)), file=sys.stderr)
         sys.exit(1)
 
+    if args.delta_dir and not os.path.isdir(args.delta_dir):
+        print('Delta dir does not exist at %s' % args.delta_dir, \
+              file=sys.stderr)
+        sys.exit(1)
+
+    args.source_date_epoch = None
+    if args.reproducible:
+        try:
+            args.source_date_epoch = int(os.environ['SOURCE_DATE_EPOCH'])
+        except (KeyError, ValueError):
+            print('--reproducible needs SOURCE_DATE_EPOCH set to a unix time, '
+                  'e.g. $(git log -1 --format=%ct)', file=sys.stderr)
+            sys.exit(1)
+
     if not os.path.exists(args.version_file):
         print('Version file does not exist at %s' % args.version_file, \
               file=sys.stderr)
@@ -117,7 +166,172 @@ class AppDefinition:
         self.w32icons.append(w32_icon)
 
 def build_all(app_def, options):
-    """run through all of the build steps for the platform"""
+    """
+    run through all of the build steps for the platform, returning the
+    path to the finished archive.
+
+    If the archive exists and none of its inputs have changed since it
+    was built, it is returned without rebuilding.  options['force']
+    rebuilds regardless.
+    """
+    with build_metrics.Stage('make_dist', 'build_all',
+                             platform=options['target_platform']) as stage:
+        output_path = get_output_path(app_def, options)
+        fingerprint = dist_fingerprint(app_def, options)
+
+        if options.get('force'):
+            print("rebuilding %s: --force" % output_path)
+        else:
+            reason = _rebuild_reason(output_path, fingerprint)
+            if reason == None:
+                print("%s is up to date" % output_path)
+                stage.cache_hit = True
+                return output_path
+            print("rebuilding %s: %s" % (output_path, reason))
+        stage.cache_hit = False
+
+        _build_all_platform(app_def, options)
+
+        _write_fingerprint(output_path, fingerprint)
+        return output_path
+
+
+def get_output_path(app_def, options):
+    """
+    return the path of the archive build_all() produces for options
+    """
+    target_platform = options['target_platform']
+    if target_platform == 'win32':
+        filename = _get_installer_filename(app_def.name,
+                                           options['target_arch'],
+                                           app_def.version_str,
+                                           include_bits=True) + '.exe'
+    elif target_platform == 'darwin':
+        filename = _get_installer_filename(app_def.name,
+                                           'x64',
+                                           app_def.version_str,
+                                           include_bits=False) + '.dmg'
+    else:
+        filename = _get_installer_filename(app_def.name,
+                                           options['target_arch'],
+                                           app_def.version_str,
+                                           include_bits=True) + '.tar.gz'
+    return path_join(options['output_dir'], filename)
+
+
+def dist_fingerprint(app_def, options):
+    """
+    return a dict of input name to digest, covering everything that
+    goes into the archive build_all() produces.
+    """
+    script_path = _get_script_path()
+    target_platform = options['target_platform']
+
+    fp = {}
+    exe_path = _get_exe_src_path(app_def, options['target_arch'],
+                                 _get_build_folder(target_platform))
+    fp['exe'] = _digest_path(exe_path)
+    fp['insert'] = _digest_path(path_join(script_path, '..', 'build', 'dist',
+                                          'insert_%s' % sys.platform))
+    fp['version_file'] = _digest_path(options['version_file'])
+    if target_platform in ('win32', 'darwin'):
+        fp['icon_src'] = _digest_path(app_def.icon_graphics_path)
+        fp['lazyicon'] = _digest_path(_import_lazyicon().__file__)
+    fp['tools'] = _digest_path(os.path.dirname(os.path.realpath(__file__)))
+
+    if options.get('system_libs'):
+        fp['system_libs'] = _digest_path(options['system_libs'])
+
+    # the libs copy_shared_libs() will bundle; a rebuilt vendor lib or
+    # a system upgrade changes the archive without touching the exe
+    if target_platform == 'linux' and os.path.isfile(exe_path):
+        import elf_deps
+        try:
+            bundle = _scan_shared_libs(exe_path, options)[0]
+        except elf_deps.DepError as e:
+            # copy_shared_libs() reports it when the archive is built
+            fp['shared_libs'] = _digest_str(e.message)
+        else:
+            fp['shared_libs'] = _digest_str(repr(sorted(
+                (soname, _digest_path(bundle[soname])) for soname in bundle)))
+
+    # only the listing: a new previous release means a new delta
+    if options.get('delta_dir'):
+        fp['delta_dir'] = _digest_str(
+            repr(sorted(os.listdir(options['delta_dir']))))
+
+    app = dict(vars(app_def))
+    app['w32icons'] = [icon.args for icon in app_def.w32icons]
+    fp['app_def'] = _digest_str(repr(sorted(app.items())))
+
+    # options that don't change the output
+    skip_opts = ('force', 'jobs', 'output_dir')
+    opts = [(k, v) for k, v in options.items() if k not in skip_opts]
+    fp['options'] = _digest_str(repr(sorted(opts)))
+    return fp
+
+
+def _rebuild_reason(output_path, fingerprint):
+    """
+    return why output_path needs rebuilding, or None if it is up to date
+    """
+    import json
+
+    if not os.path.exists(output_path):
+        return "%s does not exist" % output_path
+
+    try:
+        with open(output_path + _FINGERPRINT_SUFFIX, 'rt') as f:
+            prev = json.load(f)
+    except (OSError, ValueError):
+        return "no previous fingerprint"
+
+    changed = [k for k in sorted(set(prev) | set(fingerprint)) \
+               if prev.get(k) != fingerprint.get(k)]
+    if len(changed) != 0:
+        return "changed: %s" % ', '.join(changed)
+    return None
+
+
+def _write_fingerprint(output_path, fingerprint):
+    import json
+
+    with open(output_path + _FINGERPRINT_SUFFIX, 'wt') as f:
+        json.dump(fingerprint, f, indent=1, sort_keys=True)
+        f.write('\n')
+
+
+def _digest_str(s):
+    import hashlib
+    return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+
+def _digest_path(path):
+    """
+    sha256 of a file, or of the names and contents of every file in a
+    dir.  A missing path digests to None.
+    """
+    import hashlib
+    import dist_manifest
+
+    if os.path.isfile(path):
+        return dist_manifest.hash_file(path)[1]
+    if not os.path.isdir(path):
+        return None
+
+    h = hashlib.sha256()
+    for name, member_path in dist_manifest.tree_members(path):
+        if '__pycache__' in name:
+            continue
+        h.update(name.encode('utf-8') + b'\0')
+        h.update(dist_manifest.hash_file(member_path)[1].encode('ascii'))
+    return h.hexdigest()
+
+
+def _build_all_platform(app_def, options):
+    import tempfile
+    from dist_manifest import tree_members
+
     with tempfile.TemporaryDirectory(suffix='_make_dist') as tmp_dir:
         if options['target_platform'] == 'win32':
             build_dir = path_join(tmp_dir, 'build')
@@ -142,53 +356,84 @@ def build_all(app_def, options):
             icon_path = path_join(build_dir, '%s.ico' % app_def.name.lower())
             generate_icon(app_def.icon_graphics_path,
                           options['target_platform'],
-                          icon_path)
+                          icon_path,
+                          options.get('jobs', 1),
+                          options.get('optimize_icons', False))
             
             copy_insert(app_def, build_dir)
 
 
-            make_innosetup_installer(app_def,
-                                     options['target_arch'],
-                                     options['output_dir'],
-                                     tmp_dir)
+            output_path = make_innosetup_installer(app_def,
+                                                   options['target_arch'],
+                                                   options['output_dir'],
+                                                   tmp_dir)
+
+            # the installer copies build_dir into {app}
+            build_manifest(tree_members(build_dir), output_path, options)
 
         elif options['target_platform'] == 'darwin':
-            script_path = _get_script_path()            
-            exe_src_path = path_join(script_path, '..',
-                                     'build', 'gmake_macosx', 'bin',
-                                     'Release', options['target_arch'],
-                                     app_def.exe_name)
+            exe_src_path = _get_exe_src_path(app_def,
+                                             options['target_arch'],
+                                             'gmake_macosx')
 
             icon_path = path_join(tmp_dir, 'icon.icns')
             generate_icon(app_def.icon_graphics_path, options['target_platform'],
-                          icon_path)
+                          icon_path, options.get('jobs', 1),
+                          options.get('optimize_icons', False))
+
+            from apple_bundle import AppleBundle
 
             # fixme: this does not copy dlls and it should
             ab = AppleBundle(app_def.name, exe_src_path, \
                              icon_path, app_def.version_str)
-            ab.write(tmp_dir)
+            with build_metrics.Stage('make_dist', 'bundle'):
+                ab.write(tmp_dir, link_mode='reflink')
+
+            output_path = build_dmg(app_def,
+                                    tmp_dir,
+                                    options['output_dir'])
 
-            build_dmg(app_def,
-                      tmp_dir,
-                      options['output_dir'])
+            bundle_name = '%s.app' % app_def.name
+            build_manifest(tree_members(path_join(tmp_dir, bundle_name),
+                                        prefix=bundle_name + '/'),
+                           output_path, options)
 
         elif options['target_platform'] == 'linux':
             archive_dir = app_def.name.lower() + '-' + app_def.version_str
             archive_path = path_join(tmp_dir, archive_dir)
             os.makedirs(archive_path)
             
-            copy_exe(app_def,
-                     options,
-                     archive_path,
-                     'gmake_linux')
-            # fixme: this does not copy dlls
+            exe_path = copy_exe(app_def,
+                                options,
+                                archive_path,
+                                'gmake_linux')
+            copy_shared_libs(exe_path, options)
             copy_insert(app_def,
                         archive_path)
 
-            build_tgz(app_def,
-                      tmp_dir,
-                      options['output_dir'],
-                      options['target_arch'])
+            # symbols live outside tmp_dir, which is archived whole
+            with tempfile.TemporaryDirectory(suffix='_symbols') as symbols_dir:
+                has_symbols = options.get('split_debug') and \
+                    split_debug_info(exe_path, symbols_dir) != None
+
+                output_path = build_tgz(app_def,
+                                        tmp_dir,
+                                        options['output_dir'],
+                                        options['target_arch'],
+                                        options.get('source_date_epoch'))
+
+                build_manifest(tree_members(tmp_dir), output_path, options)
+
+                if has_symbols:
+                    build_symbol_archive(app_def,
+                                         symbols_dir,
+                                         options['output_dir'],
+                                         options['target_arch'],
+                                         options.get('source_date_epoch'))
+
+            if options.get('delta_dir'):
+                build_deltas(app_def, options['target_arch'], output_path,
+                             options['delta_dir'], options['output_dir'])
 
 
         
@@ -333,18 +578,15 @@ def _get_installer_filename(app_name, target_arch, version_str, include_bits):
         return "%s-%s-pre" % (app_name, version_str)
 
 
+@build_metrics.timed('make_dist')
 def copy_exe(app_def, options, dst_build_dir, src_build_folder):
     """
     copy the exe for the target_arch to the proper subdirectory in dst_build_dir
 
     src_build_folder: the folder name in /build for the target platform
     """
-    script_path = _get_script_path()
     target_arch = options['target_arch']
-
-    src_path = path_join(script_path, '..',  \
-                         'build', src_build_folder, 'bin', 'Release', \
-                         target_arch, app_def.exe_name)
+    src_path = _get_exe_src_path(app_def, target_arch, src_build_folder)
 
     dst_path = path_join(dst_build_dir, 'bin', _arch_dir(target_arch))
     os.makedirs(dst_path)
@@ -356,8 +598,100 @@ def copy_exe(app_def, options, dst_build_dir, src_build_folder):
     shutil.copyfile(src_path, dst_path)
     if sys.platform == 'linux':
         _run_cmd(['chmod', '+x', dst_path])
+    return dst_path
+
+
+@build_metrics.timed('make_dist')
+def split_debug_info(exe_path, symbols_dir):
+    """
+    Move the debug info out of the ELF exe at exe_path into a .debug
+    file under symbols_dir, and strip exe_path.
+
+    The .debug file is stored under .build-id/xx/yyyy.debug, the layout
+    gdb and debuginfod look up by build-id.  Exes without a build-id
+    (linked without --build-id) are stored under their SHA-256 instead
+    and are found through the .gnu_debuglink section.
+
+    Returns the path to the .debug file, or None if the exe has no
+    debug info to split, as from the release configs, which compile
+    without -g and link with -s.
+    """
+    import zlib
+    import hashlib
+    import elf_file
+
+    objcopy = os.environ.get('OBJCOPY', 'objcopy')
+
+    try:
+        elf = elf_file.ElfFile(exe_path)
+    except elf_file.ElfError as e:
+        print("Could not read %s: %s" % (exe_path, e.message))
+        sys.exit(1)
+    if not any(name.startswith(('.debug_', '.zdebug_'))
+               for name, sh_type, offset, size, link in elf.sections):
+        print("%s has no debug info (built without -g, or linked with -s); "
+              "not splitting" % os.path.basename(exe_path))
+        return None
+
+    build_id = elf.build_id()
+    if build_id == None or len(build_id) < 3:
+        print("%s has no build-id; content-addressing by sha256" % exe_path)
+        with open(exe_path, 'rb') as f:
+            build_id = hashlib.sha256(f.read()).hexdigest()
+
+    debug_dir = path_join(symbols_dir, '.build-id', build_id[:2])
+    debug_path = path_join(debug_dir, build_id[2:] + '.debug')
+    os.makedirs(debug_dir, exist_ok=True)
+
+    with open(exe_path, 'rb') as f:
+        before = f.read()
+
+    _run_cmd([objcopy, '--only-keep-debug', exe_path, debug_path])
+    _run_cmd([objcopy, '--strip-unneeded',
+              '--add-gnu-debuglink=' + debug_path, exe_path])
+
+    with open(exe_path, 'rb') as f:
+        after = f.read()
+
+    # tar z compresses with gzip -6; compressing the exe alone is a
+    # close estimate of what it costs inside the archive.
+    saved_installed = len(before) - len(after)
+    saved_archive = len(zlib.compress(before, 6)) - len(zlib.compress(after, 6))
+    print("split debug info to %s" % debug_path)
+    print("exe: %d -> %d bytes; install-time I/O saved %d bytes" % \
+          (len(before), len(after), saved_installed))
+    print("archive shrinks by about %d bytes" % saved_archive)
+    return debug_path
+
+
+@build_metrics.timed('make_dist')
+def build_symbol_archive(app_def, symbols_dir, output_dir, target_arch,
+                         source_date_epoch=None):
+    """
+    Build a .tar.gz of the .build-id tree written by split_debug_info()
+    at output_dir, named after the release archive.  See build_tgz()
+    for source_date_epoch.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    out_filename = _get_installer_filename(app_def.name,
+                                           target_arch,
+                                           app_def.version_str,
+                                           include_bits=True) + \
+                                           '-symbols.tar.gz'
+    output_path = path_join(output_dir, out_filename)
 
+    if source_date_epoch != None:
+        _write_reproducible_tgz(symbols_dir, output_path, source_date_epoch)
+        return output_path
 
+    cmd = ['tar', 'zcvf', output_path, '-C', symbols_dir+'/', '.']
+    _run_cmd(cmd)
+    return output_path
+
+
+@build_metrics.timed('make_dist')
 def copy_dlls(app_def, target_arch, build_dir, dist_dir=None):
     """
     copy all dlls for the target arch to tmp_dir
@@ -365,6 +699,8 @@ def copy_dlls(app_def, target_arch, build_dir, dist_dir=None):
     dist_dir:  The root distribution dir to copy all files from.
                (currently unsupported)
     """
+    import glob
+
     script_path = _get_script_path()
 
     # fixme: assumes no dist_dir
@@ -377,7 +713,67 @@ def copy_dlls(app_def, target_arch, build_dir, dist_dir=None):
     for dll in glob.iglob(path_join(src_path, "*.dll")):
         shutil.copy(dll, dst_dir)
 
+
+def _scan_shared_libs(exe_path, options):
+    """
+    elf_deps.scan_closure() of exe_path with the dist's allowlist and
+    the vendor libs, through the dep cache.  Returns (bundle, system,
+    cache).  Raises elf_deps.DepError.
+    """
+    import elf_deps
+
+    if options.get('system_libs'):
+        allowlist = elf_deps.read_allowlist(options['system_libs'])
+    else:
+        allowlist = elf_deps.DEFAULT_SYSTEM_LIBS
+
+    cache = elf_deps.DepCache(path_join(get_cache_dir(), 'elf_deps.json'))
+    vendor_lib_dir = path_join(_get_script_path(), '..', 'vendors', 'lib',
+                               options['target_arch'])
+    bundle, system = elf_deps.scan_closure(exe_path, allowlist, cache,
+                                           extra_lib_dirs=[vendor_lib_dir])
+    return (bundle, system, cache)
+
+
+@build_metrics.timed('make_dist')
+def copy_shared_libs(exe_path, options):
+    """
+    Linux: copy every shared lib in the closure of exe_path that is not
+    on the system library allowlist next to exe_path.  The exe must
+    have $ORIGIN in its RUNPATH for ld.so to find them there.
+
+    The allowlist is options['system_libs'], a file of soname patterns,
+    or elf_deps.DEFAULT_SYSTEM_LIBS.  Returns the list of copied paths.
+    """
+    import elf_deps
+
+    try:
+        bundle, system, cache = _scan_shared_libs(exe_path, options)
+    except elf_deps.DepError as e:
+        print("Could not resolve shared libs: %s" % e.message)
+        sys.exit(1)
+
+    print("system libs (not bundled): %s" % ', '.join(system))
+    if len(bundle) == 0:
+        return []
+
+    # iv.make links with -rpath '$ORIGIN'; a hand-rolled link may not
+    info = cache.lookup(exe_path)
+    if not any('ORIGIN' in d for d in info['runpath'] + info['rpath']):
+        print("warning: %s has no $ORIGIN RUNPATH; bundled libs will "
+              "not be found at runtime" % os.path.basename(exe_path))
+
+    dst_dir = os.path.dirname(exe_path)
+    copied = []
+    for soname in sorted(bundle):
+        dst_path = path_join(dst_dir, soname)
+        print("bundling %s (%s)" % (soname, bundle[soname]))
+        shutil.copyfile(bundle[soname], dst_path)
+        copied.append(dst_path)
+    return copied
+
         
+@build_metrics.timed('make_dist')
 def copy_insert(app_def, build_dir):
     """
     Copy the designated directory's "insert" files into the build.
@@ -390,24 +786,46 @@ def copy_insert(app_def, build_dir):
     _copyintotree(src_path, dst_path)
     
 
-def generate_icon(icon_graphics_path, target_platform, out_path):
+def generate_icon(icon_graphics_path, target_platform, out_path, jobs=1,
+                  optimize=False):
     """
-    Generate at icon for the target platform, returning the path to a tempfile
-    that is that icon.
+    Generate at icon for the target platform at out_path.
 
     icon_graphics_path: a path containing exclusively png files. See
     lazyicon.py for more detail.
 
     If out_path has .icns extension, it will generate a mac
     icon.  .ico generates windows icon.
+
+    lazyicon runs in-process, and finished icons are cached under
+    the dist cache keyed on the source pngs, so unchanged sources
+    cost a copy.
+
+    optimize: losslessly optimize the pngs in the icon, caching each
+    optimized png under the dist cache.
     """
-    script_path = path_join(_get_script_path(), 'lazyicon.py')
-    cmd = [sys.executable, script_path, '-i', icon_graphics_path,
-           '-o', out_path]
-    _run_cmd(cmd)
+    optimize_dir = None
+    if optimize:
+        optimize_dir = path_join(get_cache_dir(), 'pngopt')
+
+    lazyicon = _import_lazyicon()
+    with build_metrics.Stage('make_dist', 'generate_icon') as stage:
+        stage.cache_hit = lazyicon.build_icon_cached(
+            icon_graphics_path, out_path, path_join(get_cache_dir(), 'icons'),
+            jobs, optimize_dir)
+
+
+def _import_lazyicon():
+    # lazyicon.py lives in tools/, one level up from this module
+    tools_dir = os.path.abspath(path_join(os.path.dirname(__file__), '..'))
+    if tools_dir not in sys.path:
+        sys.path.append(tools_dir)
+    import lazyicon
+    return lazyicon
     
     
 
+@build_metrics.timed('make_dist')
 def make_innosetup_installer(app_def,
                              target_arch,
                              output_dir,
@@ -468,11 +886,16 @@ def make_innosetup_installer(app_def,
         
     cmd = [innosetup_exe, '/O'+output_dir, setup_iss]
     _run_cmd(cmd)
+    return path_join(output_dir, installer_filename + '.exe')
 
+@build_metrics.timed('make_dist')
 def build_dmg(app_def, tmp_dir, output_dmg_dir):
     """
     Build a dmg containing an app bundle at tmp_dir.
     """
+    import re
+    import glob
+
     dmg_filename = _get_installer_filename(app_def.name,
                                            'x64',
                                            app_def.version_str,
@@ -516,11 +939,43 @@ def build_dmg(app_def, tmp_dir, output_dmg_dir):
         os.remove(output_path)
     _run_cmd(['hdiutil', 'convert', '-format', 'UDZO', dmg_path,
               '-o', output_path])
+    return output_path
+
+
+@build_metrics.timed('make_dist')
+def build_manifest(members, archive_path, options):
+    """
+    Write a checksum manifest for a finished archive next to it,
+    returning the manifest path.  Verify it with
+    tools/dist_tool.py verify.
+
+    members: list of (name inside archive, staged path), as returned
+             by dist_manifest.tree_members()
+    """
+    import dist_manifest
+
+    manifest = dist_manifest.build_manifest(members, archive_path,
+                                            options.get('jobs'))
+    manifest_path = archive_path + dist_manifest.MANIFEST_SUFFIX
+    dist_manifest.write_manifest(manifest, manifest_path)
+    print("wrote %s (%d members)" % (manifest_path, len(members)))
+    return manifest_path
     
 
 def _get_script_path():    
     return os.path.dirname(os.path.realpath(sys.argv[0]))
 
+def _get_build_folder(target_platform):
+    """the folder name in /build for the target platform"""
+    return {'win32':  'vs2015',
+            'darwin': 'gmake_macosx',
+            'linux':  'gmake_linux'}[target_platform]
+
+def _get_exe_src_path(app_def, target_arch, src_build_folder):
+    return path_join(_get_script_path(), '..',
+                     'build', src_build_folder, 'bin', 'Release',
+                     target_arch, app_def.exe_name)
+
 def _icon_line(param, value, quotes=True):
     return '%s: "%s"; ' % (param, value)
     
@@ -543,10 +998,15 @@ def _swap_slashes(s):
     return s.replace('/','\\')
 
 
-def build_tgz(app_def, in_dir, output_dir, target_arch):
+@build_metrics.timed('make_dist')
+def build_tgz(app_def, in_dir, output_dir, target_arch,
+              source_date_epoch=None):
     """
     Build a .tar.gz distributable at output_dir with the intended
     archive name, copying all of the files in in_dir.
+
+    source_date_epoch: if set, write a reproducible archive with
+    timestamps clamped to it.  See _write_reproducible_tgz().
     """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -558,8 +1018,110 @@ def build_tgz(app_def, in_dir, output_dir, target_arch):
 
     output_path = path_join(output_dir, out_filename)
 
+    if source_date_epoch != None:
+        _write_reproducible_tgz(in_dir, output_path, source_date_epoch)
+        return output_path
+
     cmd = ['tar', 'zcvf', output_path, '-C', in_dir+'/', '.']
     _run_cmd(cmd)
+    return output_path
+
+
+def _write_reproducible_tgz(in_dir, output_path, source_date_epoch):
+    """
+    Write in_dir to output_path as a .tar.gz whose bytes depend only on
+    the names and contents of the files in it.  Members are sorted,
+    owners are cleared, modes are normalized to 755/644, mtimes are
+    clamped to source_date_epoch and the gzip header holds no name or
+    time.  Member names match tar -C in_dir . output.
+    """
+    import gzip
+    import tarfile
+
+    def add(tar, path, arcname):
+        info = tar.gettarinfo(path, arcname)
+        info.uid = info.gid = 0
+        info.uname = info.gname = ''
+        info.mtime = min(int(info.mtime), source_date_epoch)
+        if info.isdir() or info.mode & 0o111:
+            info.mode = 0o755
+        else:
+            info.mode = 0o644
+
+        print(arcname)
+        if info.isfile():
+            with open(path, 'rb') as f:
+                tar.addfile(info, f)
+        else:
+            tar.addfile(info)
+
+    with open(output_path, 'wb') as raw:
+        with gzip.GzipFile(filename='', fileobj=raw, mode='wb',
+                           mtime=source_date_epoch) as gz:
+            with tarfile.open(fileobj=gz, mode='w',
+                              format=tarfile.GNU_FORMAT) as tar:
+                add(tar, in_dir, './')
+                for dirpath, dirnames, filenames in os.walk(in_dir):
+                    dirnames.sort()
+                    for name in sorted(dirnames + filenames):
+                        path = path_join(dirpath, name)
+                        rel_path = os.path.relpath(path, in_dir)
+                        add(tar, path, './' + rel_path.replace(os.sep, '/'))
+
+
+@build_metrics.timed('make_dist')
+def build_deltas(app_def, target_arch, archive_path, delta_dir, output_dir):
+    """
+    Build a binary delta from the newest previous release archive in
+    delta_dir to archive_path, and write it to output_dir.  Deltas are
+    applied with tools/dist_tool.py apply.
+
+    Only archives for the same target_arch are previous releases.
+
+    Returns the path to the delta, or None if there was no previous
+    release to diff against.
+    """
+    import re
+    import glob
+    import dist_delta
+
+    # any version of this archive's name: the same word size, and not
+    # the -symbols archive
+    archive_filename = os.path.basename(archive_path)
+    version_mark = '\0'
+    prefix, suffix = (_get_installer_filename(app_def.name, target_arch,
+                                              version_mark,
+                                              include_bits=True) +
+                      '.tar.gz').split(version_mark)
+    name_re = re.compile(re.escape(prefix) + r'.+' + re.escape(suffix))
+    prev_paths = []
+    for path in glob.iglob(path_join(delta_dir, '*.tar.gz')):
+        filename = os.path.basename(path)
+        if filename != archive_filename and name_re.fullmatch(filename):
+            prev_paths.append(path)
+
+    if len(prev_paths) == 0:
+        print("no previous release in %s; skipping delta" % delta_dir)
+        return None
+
+    prev_path = max(prev_paths, key=os.path.getmtime)
+    delta_filename = '%s-to-%s.ivdelta' % \
+                     (_strip_tgz(os.path.basename(prev_path)),
+                      _strip_tgz(archive_filename))
+    delta_path = path_join(output_dir, delta_filename)
+
+    print("building delta %s" % delta_path)
+    delta_size = dist_delta.make_delta(prev_path, archive_path, delta_path)
+    full_size = os.path.getsize(archive_path)
+    print("delta is %d bytes; full archive is %d bytes (%.2f%%)" % \
+          (delta_size, full_size, 100.0 * delta_size / full_size))
+    return delta_path
+
+
+def _strip_tgz(filename):
+    if filename.endswith('.tar.gz'):
+        return filename[:-len('.tar.gz')]
+    return filename
 
 
 def _copyintotree(src, dst, symlinks=False, ignore=None):
@@ -574,6 +1136,10 @@ def _copyintotree(src, dst, symlinks=False, ignore=None):
         else:
             if not os.path.exists(d) or \
                os.stat(s).st_mtime - os.stat(d).st_mtime > 1:
+                # d may be a hard link into a cache; replace it, don't
+                # write through it
+                if os.path.lexists(d):
+                    os.remove(d)
                 shutil.copy2(s, d)
 
     
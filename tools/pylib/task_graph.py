@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+#
+# Copyright (C) 2016 Frogtoss Games, Inc.
+#
+# Usage rights granted under repo license
+#
+
+"""
+A small build graph: tasks with declared inputs, outputs and
+dependencies, run in parallel where the dependencies allow.
+
+A task is skipped when the fingerprint of its inputs matches the one
+recorded after its last successful run and its outputs all exist.
+Fingerprints are built from stat() alone, (path, size, mtime) for every
+file under each input, so checking an unchanged tree never reads file
+contents.
+"""
+
+import os
+import json
+import time
+import fnmatch
+import hashlib
+
+from os.path import join as path_join
+
+# bump when the fingerprint recipe changes, so old state is ignored
+_STATE_VERSION = 1
+
+# never part of a fingerprint
+DEFAULT_EXCLUDES = ('__pycache__', '*.pyc', '.git', '*~', '.#*')
+
+class TaskError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return repr(self.message)
+
+
+class Task:
+    """
+    One step of the build.
+
+    name:    unique name, also used on the command line
+    action:  callable taking the Task; raises TaskError on failure
+    inputs:  files and dirs whose stat() makes up the fingerprint
+    outputs: files that must exist for the task to be skipped
+    deps:    names of tasks that must finish first
+    key:     string of settings that also go into the fingerprint
+    excludes: fnmatch patterns of file and dir names left out of inputs
+    writes_inputs: the action writes into its own inputs (an in-tree
+             configure/make), so the fingerprint is taken after it runs
+    """
+    def __init__(self, name, action, inputs=(), outputs=(), deps=(),
+                 key='', excludes=(), writes_inputs=False):
+        self.name = name
+        self.action = action
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.key = key
+        self.excludes = DEFAULT_EXCLUDES + tuple(excludes)
+        self.writes_inputs = writes_inputs
+
+
+def fingerprint(task):
+    """sha256 over the task's key and the stat of every input file"""
+    h = hashlib.sha256()
+    h.update(task.key.encode('utf-8'))
+    for input_path in task.inputs:
+        h.update(b'\0' + input_path.encode('utf-8'))
+        for rel_path, size, mtime_ns in _stat_tree(input_path, task.excludes):
+            h.update(('\n%s %d %d' % (rel_path, size, mtime_ns)).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _excluded(name, excludes):
+    for pattern in excludes:
+        if fnmatch.fnmatchcase(name, pattern):
+            return True
+    return False
+
+
+def _stat_tree(path, excludes):
+    """yield (relative path, size, mtime_ns) for path or every file
+    under it, sorted; a missing input yields one 'missing' record"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        yield ('<missing>', -1, -1)
+        return
+
+    if not os.path.isdir(path):
+        yield ('', st.st_size, st.st_mtime_ns)
+        return
+
+    pending = ['']
+    while len(pending) != 0:
+        rel_dir = pending.pop()
+        with os.scandir(path_join(path, rel_dir)) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        subdirs = []
+        for entry in entries:
+            if _excluded(entry.name, excludes):
+                continue
+            rel_path = entry.name if rel_dir == '' else rel_dir + '/' + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(rel_path)
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                # dangling symlink
+                st = entry.stat(follow_symlinks=False)
+            yield (rel_path, st.st_size, st.st_mtime_ns)
+        # depth first, in name order
+        pending.extend(reversed(subdirs))
+
+
+class TaskGraph:
+    """
+    Tasks by name, with the fingerprints of their last successful runs
+    persisted as JSON at state_path.
+    """
+    def __init__(self, state_path=None):
+        self.tasks = {}
+        self.state_path = state_path
+        self._state = {'version': _STATE_VERSION, 'fingerprints': {}}
+
+        if state_path != None and os.path.isfile(state_path):
+            try:
+                with open(state_path, 'rt') as f:
+                    state = json.load(f)
+                if state.get('version') == _STATE_VERSION:
+                    self._state = state
+            except (OSError, ValueError):
+                pass
+
+    def add(self, task):
+        if task.name in self.tasks:
+            raise TaskError("task %s added twice" % task.name)
+        self.tasks[task.name] = task
+        return task
+
+    def closure(self, targets):
+        """
+        names of targets and everything they depend on, dependencies
+        first.  Raises TaskError on an unknown name or a cycle.
+        """
+        order = []
+        state = {}
+        def visit(name, path):
+            if name not in self.tasks:
+                raise TaskError("unknown task %s (needed by %s)" % \
+                                (name, ' -> '.join(path) or 'command line'))
+            if state.get(name) == 'done':
+                return
+            if state.get(name) == 'visiting':
+                raise TaskError("dependency cycle: %s" % \
+                                ' -> '.join(path + [name]))
+            state[name] = 'visiting'
+            for dep in self.tasks[name].deps:
+                visit(dep, path + [name])
+            state[name] = 'done'
+            order.append(name)
+
+        for target in targets:
+            visit(target, [])
+        return order
+
+    def is_up_to_date(self, task, digest=None):
+        if digest == None:
+            digest = fingerprint(task)
+        if self._state['fingerprints'].get(task.name) != digest:
+            return False
+        for output in task.outputs:
+            if not os.path.exists(output):
+                return False
+        return True
+
+    def run(self, targets, jobs=1, force=(), dry_run=False, log=print):
+        """
+        Run targets and their dependencies, up to jobs at a time.
+
+        force is a collection of task names to run whatever their
+        fingerprint; '*' forces everything.  A dry run only reports
+        what would run, treating every task it would run as changing
+        what depends on it.
+
+        returns a dict of task name to (status, seconds) where status
+        is 'ran', 'skipped', 'failed', 'would run' or 'not run'.
+        Dependents of a failed task are not run.
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, \
+            FIRST_COMPLETED
+
+        order = self.closure(targets)
+        results = {}
+        pending = list(order)
+        running = {}
+        started = {}
+
+        def forced(task):
+            return '*' in force or task.name in force
+
+        def work(task, deps_would_run):
+            start = time.perf_counter()
+            digest = fingerprint(task)
+            if not forced(task) and not deps_would_run and \
+               self.is_up_to_date(task, digest):
+                return ('skipped', time.perf_counter() - start)
+            if dry_run:
+                return ('would run', time.perf_counter() - start)
+
+            log("[%s] running" % task.name)
+            task.action(task)
+            for output in task.outputs:
+                if not os.path.exists(output):
+                    raise TaskError("%s did not write %s" % (task.name, output))
+
+            after = fingerprint(task)
+            if after == digest or task.writes_inputs:
+                self._state['fingerprints'][task.name] = after
+            else:
+                # an edit landed mid-run; leave the task stale
+                log("[%s] inputs changed while it ran; it will run again" % \
+                    task.name)
+                self._state['fingerprints'].pop(task.name, None)
+            return ('ran', time.perf_counter() - start)
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            while len(pending) != 0 or len(running) != 0:
+                # start everything whose dependencies are done
+                for name in list(pending):
+                    task = self.tasks[name]
+                    dep_status = [results.get(dep, (None,))[0] for dep in task.deps]
+                    if any(s in ('failed', 'not run') for s in dep_status):
+                        results[name] = ('not run', 0.0)
+                        pending.remove(name)
+                        continue
+                    if any(s == None for s in dep_status):
+                        continue
+                    # in a dry run a dependency's outputs haven't changed
+                    # yet, but would have
+                    deps_would_run = 'would run' in dep_status
+                    pending.remove(name)
+                    started[name] = time.perf_counter()
+                    running[pool.submit(work, task, deps_would_run)] = name
+
+                if len(running) == 0:
+                    break
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except (TaskError, OSError) as e:
+                        log("[%s] failed: %s" % (name, getattr(e, 'message', e)))
+                        results[name] = ('failed', time.perf_counter() - started[name])
+                        # nothing new starts once a task fails
+                        for other in pending:
+                            results[other] = ('not run', 0.0)
+                        pending = []
+
+        if not dry_run:
+            self.save()
+        return results
+
+    def save(self):
+        if self.state_path == None:
+            return
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'wt') as f:
+            json.dump(self._state, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
@@ -12,9 +12,7 @@
 import os
 import sys
 import shutil
-import tempfile
 import platform
-import optparse
 import subprocess
 
 from os.path import join as path_join
@@ -24,6 +22,7 @@ globals = {'default_parallel_jobs': 4,
            'execute_shell_cmd':     True,
            'use_ccache':            False,  # set to True with --use-ccache
            'force_clang':           False,  # set to True with --force-clang
+           'reproducible':          False,  # set to True with --reproducible
            'supported_platforms':   ['Linux', 'Darwin', 'Windows', 'Android', 'Pi'] }
 
 
@@ -233,6 +232,50 @@ def decorate_cmd_with_setarch( cmd, arch ):
     return cmd
 
 
+class _FixedTempDir:
+    """Stand-in for tempfile.TemporaryDirectory at a fixed path.  For
+    reproducible builds: the install prefix is baked into configure
+    output, so it must not change from build to build.
+
+    The path is the same for every build of a lib and arch, so it is
+    locked until the build exits: a second build of the same lib and
+    arch waits rather than installing over the first.  Set TMPDIR to
+    build somewhere else when another user holds the path."""
+    def __init__( self, libname, arch ):
+        import tempfile
+        name = path_join( tempfile.gettempdir(), 'vendor_build_%s_%s' % \
+                          (libname.replace( ' ', '_' ), arch) )
+        try:
+            self._lock = _lock_file( name + '.lock' )
+            if os.path.isdir( name ):
+                shutil.rmtree( name )
+            os.makedirs( name )
+        except OSError as e:
+            raise BuildError( "can't use %s: %s" % (name, e) )
+        self.name = name
+
+    def cleanup( self ):
+        shutil.rmtree( self.name, ignore_errors=True )
+        self._lock.close()
+
+
+def _lock_file( path ):
+    """Open path and hold an exclusive lock on it until the returned
+    file is closed, waiting for any other holder."""
+    f = open( path, 'a' )
+    try:
+        import fcntl
+    except ImportError:
+        # windows builds don't run configure
+        return f
+    try:
+        fcntl.flock( f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB )
+    except BlockingIOError:
+        print( "waiting for another build to release %s" % path )
+        fcntl.flock( f.fileno(), fcntl.LOCK_EX )
+    return f
+
+
 class BuildError(Exception):
     def __init__( self, message ):
         self.message = message
@@ -248,6 +291,8 @@ class BuildCLI:
         self.argv = argv
         self.libname = libname
 
+        import optparse
+
         supported_platforms = ', '.join( globals['supported_platforms'] )
         
         parser = optparse.OptionParser()
@@ -269,6 +314,10 @@ class BuildCLI:
                            help='force Clang for Linux target' )
         parser.add_option( '-d', '--debug', default=False,
                            help='build vendor in debug mode (if available)')
+        parser.add_option( '-r', '--reproducible', dest='reproducible',
+                           action="store_true", default=False,
+                           help='byte-for-byte repeatable output: remap source paths, '
+                           'fixed install prefix, deterministic static libs' )
 
 
         (self.options, self.args) = parser.parse_args()
@@ -289,6 +338,10 @@ class BuildCLI:
         if self.options.force_clang:
             globals['force_clang'] = True
 
+        # Set global
+        if self.options.reproducible:
+            globals['reproducible'] = True
+
 
     def get_target_platform( self ):
         if self.options.platform == None:
@@ -431,6 +484,24 @@ class BuildLib:
         else:
             raise BuildError("No environment to set for this platform.")
 
+        if globals['reproducible']:
+            self._set_reproducible_environment( code_root )
+
+
+    def _set_reproducible_environment( self, code_root ):
+        """Keep the checkout path and archive timestamps out of build products.
+        gcc and clang read SOURCE_DATE_EPOCH for __DATE__ and __TIME__ themselves."""
+        prefix_map = ' -ffile-prefix-map=%s=.' % os.path.abspath( code_root )
+        for var in ('CFLAGS', 'CXXFLAGS'):
+            os.environ[var] = os.environ.get( var, '' ) + prefix_map
+
+        # GNU ar: D zeroes member timestamps, uids and gids.  Makefiles
+        # that hardcode their ar flags are fixed up in copy_lib_file().
+        os.environ['ARFLAGS'] = 'rcD'
+
+        # Apple ar, libtool and ld
+        os.environ['ZERO_AR_DATE'] = '1'
+
 
 
     def set_rootdir( self, rootdir ):
@@ -440,15 +511,23 @@ class BuildLib:
 
 
 
-    def shell( self, step, check_errorlevel=True ):
-        """Run a shell command as a build step."""
+    def shell( self, step, check_errorlevel=True, stage=None ):
+        """Run a shell command as a build step.
+
+        stage names the step in build metrics; the command name by default."""
         self._print_shell_cmd( step )
 
         if not globals['execute_shell_cmd']:
             return
+
+        import build_metrics
+        if stage == None:
+            stage = os.path.basename( step[0] )
         try:
-            returncode = subprocess.check_call( ' '.join(step),
-                                                shell=True )
+            with build_metrics.Stage( 'vendor_build', stage,
+                                      lib=self._cli.libname ):
+                returncode = subprocess.check_call( ' '.join(step),
+                                                    shell=True )
         except subprocess.CalledProcessError as e:
             if check_errorlevel:
                 raise BuildError( 'run_step("%s") returned %i' % (' '.join(step), e.returncode) )
@@ -470,7 +549,12 @@ class BuildLib:
             cmd = decorate_cmd_with_setarch( cmd, self.get_arch() )
 
         if install_to_temp:
-            self._tmpdir = tempfile.TemporaryDirectory(suffix="vendor_build")
+            import tempfile
+            if globals['reproducible']:
+                self._tmpdir = _FixedTempDir( self._cli.libname,
+                                              _get_standardized_archstring_from_arch( self.get_arch() ) )
+            else:
+                self._tmpdir = tempfile.TemporaryDirectory(suffix="vendor_build")
             cmd.append( '--prefix=%s' % (self._tmpdir.name) )
         elif len(self._outdir):
             cmd.append('--prefix=%s' % (self._outdir))
@@ -478,7 +562,7 @@ class BuildLib:
         if more_args != None:
             cmd.extend( more_args )
 
-        self.shell( cmd, check_errorlevel=True )
+        self.shell( cmd, check_errorlevel=True, stage='configure' )
 
             
     def make( self, jobs=globals['default_parallel_jobs'] ):
@@ -496,7 +580,8 @@ class BuildLib:
         elif isinstance( command, list ):
             cmd = ['make'] + command
 
-        self.shell( cmd, check_errorlevel=check_errorlevel )
+        self.shell( cmd, check_errorlevel=check_errorlevel,
+                    stage=' '.join( cmd[:2] ) )
 
     def make_optional_clean( self, check_errorlevel=True ):
         """Runs make clean if the user specified to clean
@@ -505,7 +590,7 @@ class BuildLib:
             return
 
         cmd = ['make', 'clean']
-        self.shell( cmd, check_errorlevel )
+        self.shell( cmd, check_errorlevel, stage='make clean' )
 
 
     def nmake_build( self, makefile_path, check_errorlevel=True ):
@@ -762,6 +847,16 @@ class BuildLib:
         self.mkdir(path_join(dst_root, 'vendors', 'lib'))
         self.mkdir(path_join(dst_root, 'vendors', 'lib', arch_str))
         shutil.copy(lib_path, dst_dir)
+
+        # rewrite static libs with zeroed member timestamps, uids and
+        # gids, for makefiles that ignore ARFLAGS (cmake, libtool).
+        # ranlib -D only makes the index deterministic; objcopy -D
+        # rewrites every member header.  Apple's ar honors ZERO_AR_DATE
+        # instead.
+        if globals['reproducible'] and lib_path.endswith('.a') and \
+           self._cli.get_target_platform() == 'Linux':
+            objcopy = os.environ.get('OBJCOPY', 'objcopy')
+            self.shell( [objcopy, '-D', path_join(dst_dir, os.path.basename(lib_path))] )
                    
 
 
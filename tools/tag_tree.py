@@ -13,7 +13,6 @@ import sys
 import time
 import os.path
 import argparse
-import subprocess
 
 from os.path import join as path_join
 
@@ -31,6 +30,10 @@ def do_args():
                    help='unique build event number')
     p.add_argument('--output-filename', required=True,
                    help='path to write out to')
+    p.add_argument('--volatile-c-file',
+                   help='define BUILDERNAME, BUILDNUMBER and BUILD_TIMESTAMP '
+                   'in this .c file (src/config/ivbuildinfo_volatile.c is in '
+                   'the projects) and only declare them in the header')
     #p.add_argument('--rev-short', required=True,
     #               help='short revision')
     #p.add_argument('--rev-long', required=True,
@@ -38,30 +41,120 @@ def do_args():
     return p.parse_args()
                    
                    
+def _read_first_line(path):
+    with open(path, 'rt') as f:
+        return f.readline().strip()
+
+def _find_git_dirs(wd):
+    """
+    return (git_dir, common_dir) for the checkout at wd, or None.
+
+    git_dir holds HEAD; in a linked worktree .git is a file pointing at
+    it, and shared refs live in the common dir it names.
+    """
+    dot_git = path_join(wd, '.git')
+    if os.path.isdir(dot_git):
+        git_dir = dot_git
+    elif os.path.isfile(dot_git):
+        line = _read_first_line(dot_git)
+        if not line.startswith('gitdir:'):
+            return None
+        git_dir = path_join(wd, line[len('gitdir:'):].strip())
+    else:
+        return None
+
+    common_dir = git_dir
+    commondir_path = path_join(git_dir, 'commondir')
+    if os.path.isfile(commondir_path):
+        common_dir = path_join(git_dir, _read_first_line(commondir_path))
+    return (git_dir, common_dir)
+
+def _is_hash(s):
+    return len(s) in (40, 64) and \
+        all(c in '0123456789abcdef' for c in s)
+
+def _read_packed_ref(common_dir, ref):
+    packed_path = path_join(common_dir, 'packed-refs')
+    if not os.path.isfile(packed_path):
+        return None
+    with open(packed_path, 'rt') as f:
+        for line in f:
+            # '#' starts the header, '^' the peeled hash of a tag
+            if line.startswith('#') or line.startswith('^'):
+                continue
+            fields = line.split()
+            if len(fields) == 2 and fields[1] == ref:
+                return fields[0]
+    return None
+
+def read_git_head(wd):
+    """
+    Resolve HEAD of the checkout at wd by reading .git directly.
+
+    returns the long hash, or None if HEAD can't be resolved this way
+    (no .git, unborn branch, or a layout this doesn't know).
+    """
+    dirs = _find_git_dirs(wd)
+    if dirs == None:
+        return None
+    git_dir, common_dir = dirs
+
+    head_path = path_join(git_dir, 'HEAD')
+    if not os.path.isfile(head_path):
+        return None
+    value = _read_first_line(head_path)
+
+    # follow symbolic refs; HEAD is detached if it is already a hash
+    for depth in range(5):
+        if _is_hash(value):
+            return value
+        if not value.startswith('ref:'):
+            return None
+        ref = value[len('ref:'):].strip()
+
+        # per-worktree refs are in git_dir, shared ones in common_dir
+        value = None
+        for refs_dir in (git_dir, common_dir):
+            ref_path = path_join(refs_dir, *ref.split('/'))
+            if os.path.isfile(ref_path):
+                value = _read_first_line(ref_path)
+                break
+        if value == None:
+            value = _read_packed_ref(common_dir, ref)
+        if value == None:
+            return None
+    return None
+
 def get_git_hashes():
     wd = _get_project_root()
-    cmd = ['git', 'log', '--pretty="%h"', '-n 1']
-
-    # Short hash
-    pipe = subprocess.Popen( ' '.join(cmd), shell=True, \
-                             bufsize=0, stdout=subprocess.PIPE, cwd=wd ).stdout
-    hash_short = pipe.readline().decode('utf-8')
-    hash_short = hash_short.rstrip()
-    pipe.close()
-
-    # Long hash
-    cmd[2] = '--pretty="%H"'
-    pipe = subprocess.Popen( ' '.join(cmd), shell=True, \
-                             bufsize=0, stdout=subprocess.PIPE, cwd=wd ).stdout
-    hash_long = pipe.readline().decode('utf-8')
-    hash_long = hash_long.rstrip()
-    pipe.close()
-        
+
+    hash_long = read_git_head(wd)
+    if hash_long == None:
+        # unusual layout: ask git, if there is one
+        import subprocess
+        try:
+            hash_long = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                                cwd=wd,
+                                                stderr=subprocess.DEVNULL)
+            hash_long = hash_long.decode('utf-8').strip()
+        except (OSError, subprocess.CalledProcessError):
+            print("warning: could not resolve git HEAD in %s" % wd,
+                  file=sys.stderr)
+            return ('', '')
+
+    hash_short = hash_long[:7]
     return (hash_short, hash_long)
 
 def get_timestamp():
+    # reproducible builds: SOURCE_DATE_EPOCH is in UTC by definition
+    # https://reproducible-builds.org/specs/source-date-epoch/
+    if 'SOURCE_DATE_EPOCH' in os.environ:
+        build_time = time.gmtime(int(os.environ['SOURCE_DATE_EPOCH']))
+    else:
+        build_time = time.localtime()
+
     # style choice: Emulate DOS .bat %time% and %date%
-    return time.strftime( "%a %m/%d/%Y  %I:%M:%S.00", time.localtime() )
+    return time.strftime( "%a %m/%d/%Y  %I:%M:%S.00", build_time )
 
 def get_version_tuple():
     version_file = path_join(_get_project_root(), "VERSION")
@@ -70,39 +163,53 @@ def get_version_tuple():
     return tuple(version.split('.'))
         
 
-if __name__ == '__main__':
-    args = do_args()
+def write_if_changed(path, content):
+    """
+    Write content to path unless it already holds exactly that, so
+    the file's mtime only moves when it changes.  Returns True if the
+    file was written.
+    """
+    if os.path.isfile(path):
+        with open(path, 'rt') as f:
+            if f.read() == content:
+                return False
 
-    context = {}
-    context['buildername'] = args.buildername
-    context['buildnumber'] = args.buildnumber
-    context['revision'], context['revision_long'] = get_git_hashes()
-    context['build_timestamp'] = get_timestamp()
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wt') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return True
 
-    version = get_version_tuple()
-    context['version'] = '.'.join(map(str,version))
-    context['version_major'] = version[0]
-    context['version_minor'] = version[1]
-    context['version_micro'] = version[2]
-    
-    doc = """// generated buildinfo from build server. 
-// do not check in. do not modify
-
-// name of the machine that compiled the build.
+def make_header(context, volatile_c_file):
+    if volatile_c_file == None:
+        context['volatile'] = """// name of the machine that compiled the build.
 #define BUILDERNAME "%(buildername)s"
 
 // unique build event number from builder.  
 const unsigned int BUILDNUMBER=%(buildnumber)d;
 
+// Build timestamp string
+#define BUILD_TIMESTAMP "%(build_timestamp)s"
+""" % context
+    else:
+        context['volatile_c_file'] = os.path.basename(volatile_c_file)
+        context['volatile'] = """// fields that change on every build are defined in %(volatile_c_file)s
+#define IVBUILDINFO_VOLATILE 1
+extern const char BUILDERNAME[];
+extern const unsigned int BUILDNUMBER;
+extern const char BUILD_TIMESTAMP[];
+""" % context
+
+    return """// generated buildinfo from build server. 
+// do not check in. do not modify
+
+%(volatile)s
 // Git short hash or similar
 #define REVISION "%(revision)s"
 
 // Git long hash (or same as REVISION)
 #define REVISION_LONG "%(revision_long)s"
 
-// Build timestamp string
-#define BUILD_TIMESTAMP "%(build_timestamp)s"
-
 // version bits
 #define VERSION_STRING "%(version)s"
 #define VERSION_MAJOR %(version_major)s
@@ -110,9 +217,62 @@ const unsigned int BUILDNUMBER=%(buildnumber)d;
 #define VERSION_MICRO %(version_micro)s
 """ % context
 
-    print(doc)
+def make_volatile_c(context, header_filename, volatile_c_file):
+    # include the header by its path relative to the .c file, so the
+    # declarations are checked against the definitions
+    context['header_include'] = os.path.relpath(
+        os.path.abspath(header_filename),
+        os.path.dirname(os.path.abspath(volatile_c_file))).replace(os.sep, '/')
+
+    return """// generated buildinfo from build server. 
+// do not check in. do not modify
+
+#include "%(header_include)s"
+
+// the projects always compile this file; it is empty unless the header
+// was generated with --volatile-c-file
+#ifdef IVBUILDINFO_VOLATILE
+
+// name of the machine that compiled the build.
+const char BUILDERNAME[] = "%(buildername)s";
+
+// unique build event number from builder.  
+const unsigned int BUILDNUMBER = %(buildnumber)d;
+
+// Build timestamp string
+const char BUILD_TIMESTAMP[] = "%(build_timestamp)s";
+
+#endif
+""" % context
+
+
+if __name__ == '__main__':
+    args = do_args()
+
+    context = {}
+    context['buildername'] = args.buildername
+    context['buildnumber'] = args.buildnumber
+    context['revision'], context['revision_long'] = get_git_hashes()
+    context['build_timestamp'] = get_timestamp()
+
+    version = get_version_tuple()
+    context['version'] = '.'.join(map(str,version))
+    context['version_major'] = version[0]
+    context['version_minor'] = version[1]
+    context['version_micro'] = version[2]
+
+    outputs = [(args.output_filename,
+                make_header(context, args.volatile_c_file))]
+    if args.volatile_c_file != None:
+        outputs.append((args.volatile_c_file,
+                        make_volatile_c(context, args.output_filename,
+                                        args.volatile_c_file)))
 
-    with open(args.output_filename, 'wt') as f:
-        print(doc, file=f)
+    for path, doc in outputs:
+        print(doc)
+        if write_if_changed(path, doc + '\n'):
+            print("wrote " + path)
+        else:
+            print("%s unchanged" % path)
     
     sys.exit(0)
@@ -26,7 +26,17 @@
 #include "SDL_assert.h"
 #include "SDL_sysjoystick.h"
 #include "SDL_hints.h"
+
+/* SDL_gamecontrollerdb_compiled.h is SDL_gamecontrollerdb.h run through
+   compile_controllers.py: the built-in mappings are found by GUID in a
+   perfect hash and added the first time they are asked for, instead of
+   all being added at init.  Define SDL_GAMECONTROLLER_STRING_DB to add
+   them from the strings at init instead. */
+#ifdef SDL_GAMECONTROLLER_STRING_DB
 #include "SDL_gamecontrollerdb.h"
+#else
+#include "SDL_gamecontrollerdb_compiled.h"
+#endif
 
 #if !SDL_EVENTS_DISABLED
 #include "../events/SDL_events_c.h"
@@ -239,18 +249,96 @@ int SDL_GameControllerEventWatcher(void *userdata, SDL_Event * event)
     return 1;
 }
 
+#ifndef SDL_GAMECONTROLLER_STRING_DB
+/*
+ * Helper function to add a built-in mapping from the compiled table
+ */
+static ControllerMapping_t *
+SDL_PrivateAddCompiledMapping(SDL_JoystickGUID guid, const SDL_CompiledControllerMapping *pCompiled)
+{
+    ControllerMapping_t *pControllerMapping;
+
+    pControllerMapping = SDL_malloc(sizeof(*pControllerMapping));
+    if (!pControllerMapping) {
+        SDL_OutOfMemory();
+        return NULL;
+    }
+    pControllerMapping->guid = guid;
+    pControllerMapping->name = SDL_strdup(pCompiled->name);
+    pControllerMapping->mapping = SDL_strdup(pCompiled->mapping);
+    if (!pControllerMapping->name || !pControllerMapping->mapping) {
+        SDL_free(pControllerMapping->name);
+        SDL_free(pControllerMapping->mapping);
+        SDL_free(pControllerMapping);
+        SDL_OutOfMemory();
+        return NULL;
+    }
+    pControllerMapping->next = s_pSupportedControllers;
+    s_pSupportedControllers = pControllerMapping;
+    return pControllerMapping;
+}
+
+/*
+ * Helper function to add the built-in mappings SDL matches by name, not GUID
+ */
+static void
+SDL_PrivateAddCompiledSpecialMappings(void)
+{
+    int i, j;
+
+    for (i = 0; s_CompiledControllerSpecial[i].guid; i++) {
+        const SDL_CompiledControllerMapping *entry = &s_CompiledControllerMappings[s_CompiledControllerSpecial[i].entry];
+        const SDL_CompiledControllerMapping *found = NULL;
+        char *pMappingString;
+        size_t needed;
+
+        /* the last one compiled in wins, as when the strings are added in order */
+        for (j = 0; j <= entry->more; j++) {
+            if (entry[j].section & SDL_COMPILED_SECTIONS) {
+                found = &entry[j];
+            }
+        }
+        if (!found) {
+            continue;
+        }
+
+        /* allocate enough memory for GUID + ',' + name + ',' + mapping + \0 */
+        needed = SDL_strlen(s_CompiledControllerSpecial[i].guid) + 1 + SDL_strlen(found->name) + 1 + SDL_strlen(found->mapping) + 1;
+        pMappingString = SDL_malloc(needed);
+        if (!pMappingString) {
+            SDL_OutOfMemory();
+            return;
+        }
+        SDL_snprintf(pMappingString, needed, "%s,%s,%s", s_CompiledControllerSpecial[i].guid, found->name, found->mapping);
+        SDL_GameControllerAddMapping(pMappingString);
+        SDL_free(pMappingString);
+    }
+}
+#endif /* !SDL_GAMECONTROLLER_STRING_DB */
+
 /*
  * Helper function to scan the mappings database for a controller with the specified GUID
  */
 ControllerMapping_t *SDL_PrivateGetControllerMappingForGUID(SDL_JoystickGUID *guid)
 {
     ControllerMapping_t *pSupportedController = s_pSupportedControllers;
+#ifndef SDL_GAMECONTROLLER_STRING_DB
+    const SDL_CompiledControllerMapping *pCompiled;
+#endif
     while (pSupportedController) {
         if (SDL_memcmp(guid, &pSupportedController->guid, sizeof(*guid)) == 0) {
             return pSupportedController;
         }
         pSupportedController = pSupportedController->next;
     }
+#ifndef SDL_GAMECONTROLLER_STRING_DB
+    /* not asked for yet, or not built in; a mapping added later for the
+       same GUID replaces this one, as it would a string added at init */
+    pCompiled = SDL_PrivateFindCompiledMapping(guid->data, SDL_COMPILED_SECTIONS);
+    if (pCompiled) {
+        return SDL_PrivateAddCompiledMapping(*guid, pCompiled);
+    }
+#endif
     return NULL;
 }
 
@@ -862,6 +950,7 @@ SDL_GameControllerInit(void)
     int i = 0;
     const char *pMappingString = NULL;
     s_pSupportedControllers = NULL;
+#ifdef SDL_GAMECONTROLLER_STRING_DB
     pMappingString = s_ControllerMappings[i];
     while (pMappingString) {
         SDL_GameControllerAddMapping(pMappingString);
@@ -869,6 +958,10 @@ SDL_GameControllerInit(void)
         i++;
         pMappingString = s_ControllerMappings[i];
     }
+#else
+    (void)pMappingString;
+    SDL_PrivateAddCompiledSpecialMappings();
+#endif
 
     /* load in any user supplied config */
     SDL_GameControllerLoadHints();
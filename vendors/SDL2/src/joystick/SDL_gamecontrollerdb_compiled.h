@@ -0,0 +1,188 @@
+/* Generated by compile_controllers.py from SDL_gamecontrollerdb.h; do not edit. */
+
+#if SDL_JOYSTICK_XINPUT
+#define SDL_COMPILED_SECTION_1 (1u << 1)
+#endif
+#if SDL_JOYSTICK_DINPUT
+#define SDL_COMPILED_SECTION_2 (1u << 2)
+#endif
+#if defined(__MACOSX__)
+#define SDL_COMPILED_SECTION_3 (1u << 3)
+#endif
+#if defined(__LINUX__)
+#define SDL_COMPILED_SECTION_4 (1u << 4)
+#endif
+#if defined(__ANDROID__)
+#define SDL_COMPILED_SECTION_5 (1u << 5)
+#endif
+#if defined(SDL_JOYSTICK_MFI)
+#define SDL_COMPILED_SECTION_6 (1u << 6)
+#endif
+#if defined(SDL_JOYSTICK_EMSCRIPTEN)
+#define SDL_COMPILED_SECTION_7 (1u << 7)
+#endif
+#ifndef SDL_COMPILED_SECTION_0
+#define SDL_COMPILED_SECTION_0 1u
+#endif
+#ifndef SDL_COMPILED_SECTION_1
+#define SDL_COMPILED_SECTION_1 0
+#endif
+#ifndef SDL_COMPILED_SECTION_2
+#define SDL_COMPILED_SECTION_2 0
+#endif
+#ifndef SDL_COMPILED_SECTION_3
+#define SDL_COMPILED_SECTION_3 0
+#endif
+#ifndef SDL_COMPILED_SECTION_4
+#define SDL_COMPILED_SECTION_4 0
+#endif
+#ifndef SDL_COMPILED_SECTION_5
+#define SDL_COMPILED_SECTION_5 0
+#endif
+#ifndef SDL_COMPILED_SECTION_6
+#define SDL_COMPILED_SECTION_6 0
+#endif
+#ifndef SDL_COMPILED_SECTION_7
+#define SDL_COMPILED_SECTION_7 0
+#endif
+#define SDL_COMPILED_SECTIONS (SDL_COMPILED_SECTION_0 | SDL_COMPILED_SECTION_1 | SDL_COMPILED_SECTION_2 | SDL_COMPILED_SECTION_3 | SDL_COMPILED_SECTION_4 | SDL_COMPILED_SECTION_5 | SDL_COMPILED_SECTION_6 | SDL_COMPILED_SECTION_7)
+
+typedef struct
+{
+    Uint8 guid[16];
+    const char *name;
+    const char *mapping;            /* the bindings, as in the database */
+    Uint32 section;                 /* SDL_COMPILED_SECTION_n bit it came from */
+    Uint8 more;                     /* entries after this one with the same GUID */
+} SDL_CompiledControllerMapping;
+
+static const SDL_CompiledControllerMapping s_CompiledControllerMappings[] =
+{
+    { {0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0}, "XInput Controller", "a:b0,b:b1,back:b6,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b10,leftshoulder:b4,leftstick:b8,lefttrigger:a2,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b9,righttrigger:a5,rightx:a3,righty:a4,start:b7,x:b2,y:b3,", 1u << 1, 1 },
+    { {0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0}, "XInput Controller", "a:b0,b:b1,back:b6,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b8,leftshoulder:b4,leftstick:b9,lefttrigger:a2,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b10,righttrigger:a5,rightx:a3,righty:a4,start:b7,x:b2,y:b3,", 1u << 4, 0 },
+    { {52,26,54,8,0,0,0,0,0,0,80,73,68,86,73,68}, "Afterglow PS3 Controller", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b12,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b0,y:b3,", 1u << 2, 0 },
+    { {232,32,96,88,0,0,0,0,0,0,80,73,68,86,73,68}, "Cideko AK08b", "a:b2,b:b1,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b3,y:b0,", 1u << 2, 0 },
+    { {255,255,0,0,0,0,0,0,0,0,80,73,68,86,73,68}, "GameStop Gamepad", "a:b0,b:b1,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b2,y:b3,", 1u << 2, 0 },
+    { {109,4,22,194,0,0,0,0,0,0,80,73,68,86,73,68}, "Generic DirectInput Controller", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b0,y:b3,", 1u << 2, 0 },
+    { {109,4,24,194,0,0,0,0,0,0,80,73,68,86,73,68}, "Logitech F510 Gamepad", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b0,y:b3,", 1u << 2, 0 },
+    { {109,4,25,194,0,0,0,0,0,0,80,73,68,86,73,68}, "Logitech F710 Gamepad", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b0,y:b3,", 1u << 2, 0 },
+    { {77,105,99,114,111,115,111,102,116,32,80,67,45,106,111,121}, "OUYA Controller", "a:b0,b:b3,dpdown:b9,dpleft:b10,dpright:b11,dpup:b8,guide:b14,leftshoulder:b4,leftstick:b6,lefttrigger:b12,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b7,righttrigger:b13,rightx:a5,righty:a4,x:b1,y:b2,", 1u << 2, 0 },
+    { {136,136,8,3,0,0,0,0,0,0,80,73,68,86,73,68}, "PS3 Controller", "a:b2,b:b1,back:b8,dpdown:h0.8,dpleft:h0.4,dpright:h0.2,dpup:h0.1,guide:b12,leftshoulder:b4,leftstick:b9,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b10,righttrigger:b7,rightx:a3,righty:a4,start:b11,x:b0,y:b3,", 1u << 2, 0 },
+    { {76,5,104,2,0,0,0,0,0,0,80,73,68,86,73,68}, "PS3 Controller", "a:b14,b:b13,back:b0,dpdown:b6,dpleft:b7,dpright:b5,dpup:b4,guide:b16,leftshoulder:b10,leftstick:b1,lefttrigger:b8,leftx:a0,lefty:a1,rightshoulder:b11,rightstick:b2,righttrigger:b9,rightx:a2,righty:a3,start:b3,x:b15,y:b12,", 1u << 2, 0 },
+    { {37,9,5,0,0,0,0,0,0,0,80,73,68,86,73,68}, "PS3 DualShock", "a:b2,b:b1,back:b9,dpdown:h0.8,dpleft:h0.4,dpright:h0.2,dpup:h0.1,guide:,leftshoulder:b6,leftstick:b10,lefttrigger:b4,leftx:a0,lefty:a1,rightshoulder:b7,rightstick:b11,righttrigger:b5,rightx:a2,righty:a3,start:b8,x:b0,y:b3,", 1u << 2, 0 },
+    { {76,5,196,5,0,0,0,0,0,0,80,73,68,86,73,68}, "PS4 Controller", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b12,leftshoulder:b4,leftstick:b10,lefttrigger:a3,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:a4,rightx:a2,righty:a5,start:b9,x:b0,y:b3,", 1u << 2, 0 },
+    { {131,5,0,0,0,0,0,0,49,176,0,0,0,0,0,0}, "Cideko AK08b", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b0,y:b3,", 1u << 3, 0 },
+    { {5,0,0,0,71,83,32,71,97,109,101,112,97,100,0,0}, "GameStop Gamepad", "a:b0,b:b1,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b2,y:b3,", 1u << 3, 1 },
+    { {5,0,0,0,71,83,32,71,97,109,101,112,97,100,0,0}, "GameStop Gamepad", "a:b0,b:b1,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b2,y:b3,", 1u << 4, 0 },
+    { {109,4,0,0,0,0,0,0,22,194,0,0,0,0,0,0}, "Logitech F310 Gamepad (DInput)", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b0,y:b3,", 1u << 3, 0 },
+    { {109,4,0,0,0,0,0,0,24,194,0,0,0,0,0,0}, "Logitech F510 Gamepad (DInput)", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b0,y:b3,", 1u << 3, 0 },
+    { {109,4,0,0,0,0,0,0,31,194,0,0,0,0,0,0}, "Logitech F710 Gamepad (XInput)", "a:b0,b:b1,back:b9,dpdown:b12,dpleft:b13,dpright:b14,dpup:b11,guide:b10,leftshoulder:b4,leftstick:b6,lefttrigger:a2,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b7,righttrigger:a5,rightx:a3,righty:a4,start:b8,x:b2,y:b3,", 1u << 3, 0 },
+    { {109,4,0,0,0,0,0,0,25,194,0,0,0,0,0,0}, "Logitech Wireless Gamepad (DInput)", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b0,y:b3,", 1u << 3, 0 },
+    { {76,5,0,0,0,0,0,0,104,2,0,0,0,0,0,0}, "PS3 Controller", "a:b14,b:b13,back:b0,dpdown:b6,dpleft:b7,dpright:b5,dpup:b4,guide:b16,leftshoulder:b10,leftstick:b1,lefttrigger:b8,leftx:a0,lefty:a1,rightshoulder:b11,rightstick:b2,righttrigger:b9,rightx:a2,righty:a3,start:b3,x:b15,y:b12,", 1u << 3, 0 },
+    { {76,5,0,0,0,0,0,0,196,5,0,0,0,0,0,0}, "PS4 Controller", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b12,leftshoulder:b4,leftstick:b10,lefttrigger:a3,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:a4,rightx:a2,righty:a5,start:b9,x:b0,y:b3,", 1u << 3, 0 },
+    { {17,1,0,0,0,0,0,0,32,20,0,0,0,0,0,0}, "SteelSeries Nimbus", "a:b0,b:b1,dpdown:b9,dpleft:b11,dpright:b10,dpup:b8,leftshoulder:b4,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,righttrigger:b7,rightx:a2,righty:a3,start:b12,x:b2,y:b3,", 1u << 3, 0 },
+    { {17,1,0,0,0,0,0,0,23,20,0,0,0,0,0,0}, "SteelSeries Stratus XL", "a:b0,b:b1,dpdown:b9,dpleft:b11,dpright:b10,dpup:b8,leftshoulder:b4,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,righttrigger:b7,rightx:a2,righty:a3,start:b12,x:b2,y:b3,", 1u << 3, 0 },
+    { {94,4,0,0,0,0,0,0,142,2,0,0,0,0,0,0}, "X360 Controller", "a:b0,b:b1,back:b9,dpdown:b12,dpleft:b13,dpright:b14,dpup:b11,guide:b10,leftshoulder:b4,leftstick:b6,lefttrigger:a2,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b7,righttrigger:a5,rightx:a3,righty:a4,start:b8,x:b2,y:b3,", 1u << 3, 0 },
+    { {3,0,0,0,232,32,0,0,96,88,0,0,1,1,0,0}, "Cideko AK08b", "a:b2,b:b1,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b3,y:b0,", 1u << 4, 0 },
+    { {3,0,0,0,111,14,0,0,1,4,0,0,0,1,0,0}, "Gamestop Logic3 Controller", "a:b0,b:b1,back:b6,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b8,leftshoulder:b4,leftstick:b9,lefttrigger:a2,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b10,righttrigger:a5,rightx:a3,righty:a4,start:b7,x:b2,y:b3,", 1u << 4, 0 },
+    { {3,0,0,0,186,34,0,0,32,16,0,0,1,1,0,0}, "Jess Technology USB Game Controller", "a:b2,b:b1,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:,leftshoulder:b4,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,righttrigger:b7,rightx:a3,righty:a2,start:b9,x:b3,y:b0,", 1u << 4, 0 },
+    { {3,0,0,0,109,4,0,0,25,194,0,0,16,1,0,0}, "Logitech Cordless RumblePad 2", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b0,y:b3,", 1u << 4, 0 },
+    { {3,0,0,0,109,4,0,0,29,194,0,0,20,64,0,0}, "Logitech F310 Gamepad (XInput)", "a:b0,b:b1,back:b6,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b8,leftshoulder:b4,leftstick:b9,lefttrigger:a2,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b10,righttrigger:a5,rightx:a3,righty:a4,start:b7,x:b2,y:b3,", 1u << 4, 0 },
+    { {3,0,0,0,109,4,0,0,30,194,0,0,32,32,0,0}, "Logitech F510 Gamepad (XInput)", "a:b0,b:b1,back:b6,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b8,leftshoulder:b4,leftstick:b9,lefttrigger:a2,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b10,righttrigger:a5,rightx:a3,righty:a4,start:b7,x:b2,y:b3,", 1u << 4, 0 },
+    { {3,0,0,0,109,4,0,0,25,194,0,0,17,1,0,0}, "Logitech F710 Gamepad (DInput)", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b0,y:b3,", 1u << 4, 0 },
+    { {3,0,0,0,109,4,0,0,31,194,0,0,5,3,0,0}, "Logitech F710 Gamepad (XInput)", "a:b0,b:b1,back:b6,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b8,leftshoulder:b4,leftstick:b9,lefttrigger:a2,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b10,righttrigger:a5,rightx:a3,righty:a4,start:b7,x:b2,y:b3,", 1u << 4, 0 },
+    { {3,0,0,0,109,4,0,0,24,194,0,0,16,1,0,0}, "Logitech RumblePad 2", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b0,y:b3,", 1u << 4, 0 },
+    { {3,0,0,0,85,9,0,0,16,114,0,0,17,1,0,0}, "NVIDIA Controller", "a:b0,b:b1,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,leftshoulder:b4,leftstick:b8,lefttrigger:a5,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b9,righttrigger:a4,rightx:a2,righty:a3,start:b7,x:b2,y:b3,", 1u << 4, 0 },
+    { {5,0,0,0,126,5,0,0,48,3,0,0,1,0,0,0}, "Nintendo Wii Remote Pro Controller", "a:b1,b:b0,back:b8,dpdown:b14,dpleft:b15,dpright:b16,dpup:b13,guide:b10,leftshoulder:b4,leftstick:b11,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b12,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b2,y:b3,", 1u << 4, 0 },
+    { {0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0}, "OUYA Game Controller", "a:b0,b:b3,dpdown:b9,dpleft:b10,dpright:b11,dpup:b8,guide:b14,leftshoulder:b4,leftstick:b6,lefttrigger:a2,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b7,righttrigger:a5,rightx:a3,righty:a4,x:b1,y:b2,", 1u << 4, 0 },
+    { {3,0,0,0,76,5,0,0,104,2,0,0,17,1,0,0}, "PS3 Controller", "a:b14,b:b13,back:b0,dpdown:b6,dpleft:b7,dpright:b5,dpup:b4,guide:b16,leftshoulder:b10,leftstick:b1,lefttrigger:b8,leftx:a0,lefty:a1,rightshoulder:b11,rightstick:b2,righttrigger:b9,rightx:a2,righty:a3,start:b3,x:b15,y:b12,", 1u << 4, 0 },
+    { {3,0,0,0,52,26,0,0,54,8,0,0,17,1,0,0}, "PS3 Controller", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b12,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b0,y:b3,", 1u << 4, 0 },
+    { {3,0,0,0,76,5,0,0,196,5,0,0,17,1,0,0}, "PS4 Controller", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b12,leftshoulder:b4,leftstick:b10,lefttrigger:a3,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:a4,rightx:a2,righty:a5,start:b9,x:b0,y:b3,", 1u << 4, 0 },
+    { {5,0,0,0,76,5,0,0,196,5,0,0,0,1,0,0}, "PS4 Controller", "a:b1,b:b2,back:b8,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b12,leftshoulder:b4,leftstick:b10,lefttrigger:a3,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:a4,rightx:a2,righty:a5,start:b9,x:b0,y:b3,", 1u << 4, 0 },
+    { {3,0,0,0,198,36,0,0,4,93,0,0,37,1,0,0}, "Razer Sabertooth", "a:b0,b:b1,back:b6,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b8,leftshoulder:b4,leftstick:b9,lefttrigger:a2,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b10,righttrigger:a5,rightx:a3,righty:a4,start:b7,x:b2,y:b3,", 1u << 4, 0 },
+    { {3,0,0,0,50,21,0,0,0,9,0,0,17,1,0,0}, "Razer Serval", "a:b0,b:b1,back:b6,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b8,leftshoulder:b4,leftstick:b9,lefttrigger:a5,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b10,righttrigger:a4,rightx:a2,righty:a3,start:b7,x:b2,y:b3,", 1u << 4, 0 },
+    { {5,0,0,0,50,21,0,0,0,9,0,0,22,58,0,0}, "Razer Serval", "a:b0,b:b1,back:b6,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b8,leftshoulder:b4,leftstick:b9,lefttrigger:a5,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b10,righttrigger:a4,rightx:a2,righty:a3,start:b7,x:b2,y:b3,", 1u << 4, 0 },
+    { {3,0,0,0,222,40,0,0,252,17,0,0,1,0,0,0}, "Steam Controller", "a:b0,b:b1,back:b6,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b8,leftshoulder:b4,leftstick:b9,lefttrigger:a2,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b10,righttrigger:a5,rightx:a3,righty:a4,start:b7,x:b2,y:b3,", 1u << 4, 0 },
+    { {3,0,0,0,222,40,0,0,255,17,0,0,1,0,0,0}, "Valve Streaming Gamepad", "a:b0,b:b1,back:b6,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b8,leftshoulder:b4,leftstick:b9,lefttrigger:a2,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b10,righttrigger:a5,rightx:a3,righty:a4,start:b7,x:b2,y:b3,", 1u << 4, 0 },
+    { {3,0,0,0,94,4,0,0,209,2,0,0,1,1,0,0}, "Xbox One Wireless Controller", "a:b0,b:b1,back:b6,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,guide:b8,leftshoulder:b4,leftstick:b9,lefttrigger:a2,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b10,righttrigger:a5,rightx:a3,righty:a4,start:b7,x:b2,y:b3,", 1u << 4, 0 },
+    { {78,86,73,68,73,65,32,67,111,114,112,111,114,97,116,105}, "NVIDIA Controller", "a:b0,b:b1,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,leftshoulder:b9,leftstick:b7,lefttrigger:a4,leftx:a0,lefty:a1,rightshoulder:b10,rightstick:b8,righttrigger:a5,rightx:a2,righty:a3,start:b6,x:b2,y:b3,", 1u << 5, 0 },
+    { {77,70,105,71,97,109,101,112,97,100,1,0,0,0,0,0}, "MFi Extended Gamepad", "a:b0,b:b1,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,leftshoulder:b4,lefttrigger:a2,leftx:a0,lefty:a1,rightshoulder:b5,righttrigger:a5,rightx:a3,righty:a4,start:b6,x:b2,y:b3,", 1u << 6, 0 },
+    { {77,70,105,71,97,109,101,112,97,100,2,0,0,0,0,0}, "MFi Gamepad", "a:b0,b:b1,dpdown:h0.4,dpleft:h0.8,dpright:h0.2,dpup:h0.1,leftshoulder:b4,rightshoulder:b5,start:b6,x:b2,y:b3,", 1u << 6, 0 },
+    { {0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0}, "Standard Gamepad", "a:b0,b:b1,back:b8,dpdown:b13,dpleft:b14,dpright:b15,dpup:b12,guide:b16,leftshoulder:b4,leftstick:b10,lefttrigger:b6,leftx:a0,lefty:a1,rightshoulder:b5,rightstick:b11,righttrigger:b7,rightx:a2,righty:a3,start:b9,x:b2,y:b3,", 1u << 7, 0 },
+};
+#define SDL_COMPILED_MAPPING_COUNT 51
+
+static const struct { const char *guid; Uint32 entry; } s_CompiledControllerSpecial[] =
+{
+    { "xinput", 0 },
+    { "050000003620000100000002010000", 36 },
+    { "emscripten", 50 },
+    { NULL, 0 }
+};
+
+#define SDL_COMPILED_HASH_SEED 0u
+#define SDL_COMPILED_HASH_BUCKETS 12u
+#define SDL_COMPILED_HASH_SLOTS 59u
+
+static const Uint16 s_CompiledControllerDisplacements[] =
+{
+    5, 13, 6, 5, 0, 4, 3, 2, 2, 4, 13, 12,
+};
+
+/* entry index + 1 of the first entry for the GUID in each slot, or 0 */
+static const Uint32 s_CompiledControllerSlots[] =
+{
+    33, 43, 28, 10, 0, 11, 40, 0, 26, 29, 47, 31, 41, 0, 17, 48,
+    15, 0, 32, 0, 3, 0, 4, 22, 46, 13, 44, 8, 42, 30, 18, 23,
+    34, 38, 9, 39, 5, 19, 21, 0, 0, 20, 0, 49, 0, 45, 0, 12,
+    27, 6, 35, 14, 25, 0, 50, 0, 24, 36, 7,
+};
+
+static Uint32
+SDL_CompiledControllerFmix(Uint32 h)
+{
+    h ^= h >> 16;
+    h *= 0x85ebca6bu;
+    h ^= h >> 13;
+    h *= 0xc2b2ae35u;
+    h ^= h >> 16;
+    return h;
+}
+
+/*
+ * Find the mapping for a hardware GUID among the sections in mask
+ * (normally SDL_COMPILED_SECTIONS), or NULL.
+ */
+static const SDL_CompiledControllerMapping *
+SDL_PrivateFindCompiledMapping(const Uint8 *guid, Uint32 mask)
+{
+    const SDL_CompiledControllerMapping *entry;
+    const SDL_CompiledControllerMapping *found = NULL;
+    Uint32 h = 2166136261u ^ SDL_COMPILED_HASH_SEED;
+    Uint32 g, first, step, slot, index;
+    int i;
+
+    for (i = 0; i < 16; i++) {
+        h = (h ^ guid[i]) * 16777619u;
+    }
+    g = SDL_CompiledControllerFmix(h);
+    first = g % SDL_COMPILED_HASH_SLOTS;
+    step = 1 + SDL_CompiledControllerFmix(g ^ 0x9e3779b9u) % (SDL_COMPILED_HASH_SLOTS - 1);
+    slot = (Uint32)((first + (Uint64)s_CompiledControllerDisplacements[h % SDL_COMPILED_HASH_BUCKETS] * step)
+                    % SDL_COMPILED_HASH_SLOTS);
+
+    index = s_CompiledControllerSlots[slot];
+    if (index == 0) {
+        return NULL;
+    }
+    entry = &s_CompiledControllerMappings[index - 1];
+    if (SDL_memcmp(entry->guid, guid, 16) != 0) {
+        return NULL;
+    }
+    for (i = 0; i <= entry->more; i++) {
+        if (entry[i].section & mask) {
+            found = &entry[i];
+        }
+    }
+    return found;
+}
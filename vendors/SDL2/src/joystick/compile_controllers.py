@@ -0,0 +1,560 @@
+#!/usr/bin/env python
+#
+# Script to compile SDL_gamecontrollerdb.h into a packed C table
+#
+# SDL_gamecontroller.c includes the table instead of the strings, and
+# adds a built-in mapping the first time its GUID is asked for rather
+# than adding every mapping at startup.  Hardware GUIDs are found
+# through a hash-and-displace perfect hash, so a lookup is one FNV-1a
+# pass over the GUID, one probe and one memcmp however large the
+# database gets.
+#
+# Every mapping's bindings are checked here, the way
+# SDL_PrivateGameControllerParseButton() would parse them when a
+# controller opens, and the ones it would reject are reported.
+#
+# The header's #if sections become bits: each entry records the section
+# it came from, and the generated header replays the same #if lines to
+# work out which bits are compiled in.  Where a GUID is in more than one
+# enabled section the last one wins, as when SDL adds the mappings in
+# order.
+#
+# Usage:
+#   compile_controllers.py [SDL_gamecontrollerdb.h] [-o output]
+#   compile_controllers.py --benchmark 50000
+
+import sys
+import time
+import argparse
+
+from sort_controllers import Section, iter_db
+
+
+# in SDL_GameControllerAxis / SDL_GameControllerButton order
+AXES = ["leftx", "lefty", "rightx", "righty", "lefttrigger", "righttrigger"]
+BUTTONS = ["a", "b", "x", "y", "back", "guide", "start", "leftstick",
+           "rightstick", "leftshoulder", "rightshoulder", "dpup", "dpdown",
+           "dpleft", "dpright"]
+
+# k_nMaxReverseEntries and the hat limit in SDL_gamecontroller.c
+MAX_REVERSE_ENTRIES = 20
+MAX_HATS = 4
+
+MAX_SECTIONS = 32
+MAX_DISPLACEMENT = 0xffff
+LOAD_FACTOR = 0.85
+KEYS_PER_BUCKET = 4
+
+
+class CompiledMapping(object):
+    """One mapping, with the #if section it came from."""
+    __slots__ = ('guid', 'name', 'mapping', 'section', 'more')
+
+    def __init__(self, guid, name, mapping, section):
+        self.guid = guid
+        self.name = name
+        self.mapping = mapping
+        self.section = section
+        self.more = 0
+
+
+def check_bindings(compiled, mapping, log=print):
+    """Report the bindings in a mapping string that SDL would reject
+    with an error or an assert when the controller opens."""
+    # SDL ignores spaces anywhere in the mapping string
+    for binding in mapping.replace(" ", "").split(","):
+        target, _, source = binding.partition(":")
+        if source == "":
+            continue
+        target = target.lower()
+        axis = AXES.index(target) if target in AXES else -1
+        button = BUTTONS.index(target) if target in BUTTONS else -1
+        if axis == -1 and button == -1:
+            log("Warning: %s: unknown binding '%s'" % (compiled.name, binding))
+            continue
+
+        kind = source[0]
+        if kind == "h":
+            hat, _, mask = source[1:].partition(".")
+            if not hat.isdigit() or not mask.isdigit():
+                log("Warning: %s: can't parse hat binding '%s'" % (compiled.name, binding))
+                continue
+            # SDL indexes its reverse table with (hat << 4) | mask
+            if button == -1 or int(hat) >= MAX_HATS or int(mask) > 0xf:
+                log("Warning: %s: unsupported hat binding '%s'" % (compiled.name, binding))
+            continue
+
+        if kind not in "ab" or not source[1:].isdigit():
+            log("Warning: %s: can't parse binding '%s'" % (compiled.name, binding))
+            continue
+        if int(source[1:]) >= MAX_REVERSE_ENTRIES:
+            log("Warning: %s: index too large in '%s'" % (compiled.name, binding))
+
+
+def guid_bytes(guid):
+    """The 16 bytes SDL_JoystickGetGUIDFromString() would give, or None
+    for a special GUID like xinput that SDL matches by name."""
+    if len(guid) != 32:
+        return None
+    try:
+        return bytes.fromhex(guid)
+    except ValueError:
+        return None
+
+
+def read_db(lines, log=print):
+    """Returns (entries, chain) from a database.  entries are
+    CompiledMappings in file order; chain is the #if / #el / #endif
+    lines with the index of the section each one opens, or None."""
+    entries = []
+    chain = []
+    sections = 0
+    # section 0 is everything outside an #if
+    current = 0
+    for item in iter_db(lines, log=lambda message: None):
+        if isinstance(item, Section):
+            for mapping in item.mappings:
+                compiled = CompiledMapping(mapping.guid[:-1], mapping.name[:-1],
+                                           mapping.bindings, current)
+                check_bindings(compiled, mapping.bindings, log)
+                entries.append(compiled)
+        elif item.startswith("#if") or item.startswith("#el"):
+            sections += 1
+            current = sections
+            chain.append((item.strip(), current))
+        elif item.startswith("#endif"):
+            current = 0
+            chain.append((item.strip(), None))
+    return entries, chain
+
+
+def fnv1a(data, basis):
+    h = basis
+    for b in data:
+        h = ((h ^ b) * 16777619) & 0xffffffff
+    return h
+
+
+def fmix(h):
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & 0xffffffff
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & 0xffffffff
+    h ^= h >> 16
+    return h
+
+
+def key_hashes(key, seed, bucket_count, slot_count):
+    """(bucket, first slot, step) for key; keep in sync with the C
+    lookup written by write_header()."""
+    h = fnv1a(key, 2166136261 ^ seed)
+    g = fmix(h)
+    return (h % bucket_count, g % slot_count,
+            1 + fmix(g ^ 0x9e3779b9) % (slot_count - 1))
+
+
+def _is_prime(n):
+    if n < 2:
+        return False
+    i = 2
+    while i * i <= n:
+        if n % i == 0:
+            return False
+        i += 1
+    return True
+
+
+def build_perfect_hash(keys, seed=0):
+    """Hash and displace: keys go into buckets by one hash, and each
+    bucket, largest first, gets the smallest displacement d that puts
+    all of its keys in free slots at (first + d * step) % slot_count.
+
+    Returns (seed, displacements, slots) with slots[i] the index into
+    keys of the key in slot i, or -1.  Retries with the next seed if a
+    bucket can't be placed.
+    """
+    slot_count = max(3, int(len(keys) / LOAD_FACTOR) + 1)
+    while not _is_prime(slot_count):
+        slot_count += 1
+    bucket_count = max(1, (len(keys) + KEYS_PER_BUCKET - 1) // KEYS_PER_BUCKET)
+
+    while True:
+        buckets = [[] for i in range(bucket_count)]
+        for i, key in enumerate(keys):
+            bucket, first, step = key_hashes(key, seed, bucket_count, slot_count)
+            buckets[bucket].append((i, first, step))
+
+        order = sorted(range(bucket_count), key=lambda b: -len(buckets[b]))
+        displacements = [0] * bucket_count
+        slots = [-1] * slot_count
+        placed = True
+        for b in order:
+            bucket = buckets[b]
+            if len(bucket) == 0:
+                break
+            for d in range(MAX_DISPLACEMENT + 1):
+                taken = [(first + d * step) % slot_count for i, first, step in bucket]
+                if len(set(taken)) == len(taken) and \
+                   all(slots[slot] == -1 for slot in taken):
+                    break
+            else:
+                placed = False
+                break
+            displacements[b] = d
+            for (i, first, step), slot in zip(bucket, taken):
+                slots[slot] = i
+        if placed:
+            return seed, displacements, slots
+        seed += 1
+
+
+def lookup(table, key):
+    """Python twin of the generated C lookup, for checking a table."""
+    seed, displacements, slots, keys = table
+    bucket, first, step = key_hashes(key, seed, len(displacements), len(slots))
+    i = slots[(first + displacements[bucket] * step) % len(slots)]
+    if i != -1 and keys[i] == key:
+        return i
+    return None
+
+
+def compile_db(lines, log=print):
+    """Compile database lines.  Returns a dict with the entries grouped
+    by GUID, the perfect hash over their hardware GUIDs, the special
+    GUID entries and the #if chain."""
+    entries, chain = read_db(lines, log)
+    sections = max([number for condition, number in chain if number is not None] + [0]) + 1
+    if sections > MAX_SECTIONS:
+        raise ValueError("%d sections; at most %d fit the section mask" %
+                         (sections, MAX_SECTIONS))
+
+    # entries for one GUID are kept together, in file order, so the
+    # lookup can scan them for the last enabled one
+    groups = {}
+    for entry in entries:
+        groups.setdefault(entry.guid, []).append(entry)
+
+    ordered = []
+    keys = []
+    key_entries = []
+    special = []
+    for guid, group in groups.items():
+        if len(group) > 256:
+            raise ValueError("%s is in the database %d times" % (guid, len(group)))
+        for n, entry in enumerate(group):
+            entry.more = len(group) - 1 - n
+        key = guid_bytes(guid)
+        if key is None:
+            special.append((guid, len(ordered)))
+        else:
+            keys.append(key)
+            key_entries.append(len(ordered))
+        ordered.extend(group)
+
+    seed, displacements, slots = build_perfect_hash(keys)
+    table = (seed, displacements, slots, keys)
+    for i, key in enumerate(keys):
+        assert lookup(table, key) == i
+
+    return {
+        'entries': ordered,
+        'seed': seed,
+        'displacements': displacements,
+        'slots': [key_entries[i] if i != -1 else -1 for i in slots],
+        'special': special,
+        'chain': chain,
+        'sections': sections,
+    }
+
+
+def _c_array(values, per_line=16):
+    lines = []
+    for i in range(0, len(values), per_line):
+        lines.append("    " + ", ".join(str(v) for v in values[i:i + per_line]) + ",")
+    return "\n".join(lines) if lines else "    0,"
+
+
+def write_header(compiled, output, source_name):
+    entries = compiled['entries']
+    w = output.write
+
+    w("/* Generated by compile_controllers.py from %s; do not edit. */\n\n" % source_name)
+
+    # which sections the preprocessor keeps, as a mask
+    for condition, number in compiled['chain']:
+        w(condition + "\n")
+        if number is not None:
+            w("#define SDL_COMPILED_SECTION_%d (1u << %d)\n" % (number, number))
+    mask = []
+    for number in range(compiled['sections']):
+        w("#ifndef SDL_COMPILED_SECTION_%d\n" % number)
+        # section 0 is everything outside an #if
+        w("#define SDL_COMPILED_SECTION_%d %s\n" % (number, "1u" if number == 0 else "0"))
+        w("#endif\n")
+        mask.append("SDL_COMPILED_SECTION_%d" % number)
+    w("#define SDL_COMPILED_SECTIONS (%s)\n\n" % " | ".join(mask))
+
+    w("typedef struct\n{\n"
+      "    Uint8 guid[16];\n"
+      "    const char *name;\n"
+      "    const char *mapping;            /* the bindings, as in the database */\n"
+      "    Uint32 section;                 /* SDL_COMPILED_SECTION_n bit it came from */\n"
+      "    Uint8 more;                     /* entries after this one with the same GUID */\n"
+      "} SDL_CompiledControllerMapping;\n\n")
+
+    w("static const SDL_CompiledControllerMapping s_CompiledControllerMappings[] =\n{\n")
+    for entry in entries:
+        key = guid_bytes(entry.guid) or bytes(16)
+        w("    { {%s}, \"%s\", \"%s\", 1u << %d, %d },\n" %
+          (",".join(str(b) for b in key), entry.name, entry.mapping,
+           entry.section, entry.more))
+    if len(entries) == 0:
+        w("    { {0}, \"\", \"\", 0, 0 },\n")
+    w("};\n#define SDL_COMPILED_MAPPING_COUNT %d\n\n" % len(entries))
+
+    # GUIDs SDL matches by name rather than by value
+    w("static const struct { const char *guid; Uint32 entry; } s_CompiledControllerSpecial[] =\n{\n")
+    for guid, index in compiled['special']:
+        w("    { \"%s\", %d },\n" % (guid, index))
+    w("    { NULL, 0 }\n};\n\n")
+
+    displacements = compiled['displacements']
+    slots = compiled['slots']
+    w("#define SDL_COMPILED_HASH_SEED %du\n" % compiled['seed'])
+    w("#define SDL_COMPILED_HASH_BUCKETS %du\n" % len(displacements))
+    w("#define SDL_COMPILED_HASH_SLOTS %du\n\n" % len(slots))
+    w("static const Uint16 s_CompiledControllerDisplacements[] =\n{\n%s\n};\n\n" %
+      _c_array(displacements))
+    w("/* entry index + 1 of the first entry for the GUID in each slot, or 0 */\n")
+    w("static const Uint32 s_CompiledControllerSlots[] =\n{\n%s\n};\n\n" %
+      _c_array([i + 1 for i in slots]))
+
+    w("static Uint32\nSDL_CompiledControllerFmix(Uint32 h)\n{\n"
+      "    h ^= h >> 16;\n    h *= 0x85ebca6bu;\n    h ^= h >> 13;\n"
+      "    h *= 0xc2b2ae35u;\n    h ^= h >> 16;\n    return h;\n}\n\n")
+
+    w("/*\n"
+      " * Find the mapping for a hardware GUID among the sections in mask\n"
+      " * (normally SDL_COMPILED_SECTIONS), or NULL.\n"
+      " */\n"
+      "static const SDL_CompiledControllerMapping *\n"
+      "SDL_PrivateFindCompiledMapping(const Uint8 *guid, Uint32 mask)\n{\n"
+      "    const SDL_CompiledControllerMapping *entry;\n"
+      "    const SDL_CompiledControllerMapping *found = NULL;\n"
+      "    Uint32 h = 2166136261u ^ SDL_COMPILED_HASH_SEED;\n"
+      "    Uint32 g, first, step, slot, index;\n"
+      "    int i;\n\n"
+      "    for (i = 0; i < 16; i++) {\n"
+      "        h = (h ^ guid[i]) * 16777619u;\n"
+      "    }\n"
+      "    g = SDL_CompiledControllerFmix(h);\n"
+      "    first = g % SDL_COMPILED_HASH_SLOTS;\n"
+      "    step = 1 + SDL_CompiledControllerFmix(g ^ 0x9e3779b9u) % (SDL_COMPILED_HASH_SLOTS - 1);\n"
+      "    slot = (Uint32)((first + (Uint64)s_CompiledControllerDisplacements[h % SDL_COMPILED_HASH_BUCKETS] * step)\n"
+      "                    % SDL_COMPILED_HASH_SLOTS);\n\n"
+      "    index = s_CompiledControllerSlots[slot];\n"
+      "    if (index == 0) {\n"
+      "        return NULL;\n"
+      "    }\n"
+      "    entry = &s_CompiledControllerMappings[index - 1];\n"
+      "    if (SDL_memcmp(entry->guid, guid, 16) != 0) {\n"
+      "        return NULL;\n"
+      "    }\n"
+      "    for (i = 0; i <= entry->more; i++) {\n"
+      "        if (entry[i].section & mask) {\n"
+      "            found = &entry[i];\n"
+      "        }\n"
+      "    }\n"
+      "    return found;\n}\n")
+
+
+BENCHMARK_C = r"""
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include <stdint.h>
+
+typedef uint8_t Uint8;
+typedef uint16_t Uint16;
+typedef uint32_t Uint32;
+typedef uint64_t Uint64;
+#define SDL_memcmp memcmp
+
+#define SDL_JOYSTICK_XINPUT 1
+#define SDL_JOYSTICK_DINPUT 1
+#define __MACOSX__ 1
+#define __LINUX__ 1
+#define __ANDROID__ 1
+#define SDL_JOYSTICK_MFI 1
+#define SDL_JOYSTICK_EMSCRIPTEN 1
+#define __FREEBSD__ 1
+
+#include "db.h"
+#include "compiled.h"
+
+/* what SDL_GameControllerInit() builds: a list searched front to back */
+typedef struct node { Uint8 guid[16]; const char *name; struct node *next; } node;
+
+static double now(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec / 1e9;
+}
+
+static unsigned char nibble(char c)
+{
+    if (c >= '0' && c <= '9') return c - '0';
+    if (c >= 'a' && c <= 'f') return c - 'a' + 10;
+    if (c >= 'A' && c <= 'F') return c - 'A' + 10;
+    return 0;
+}
+
+static node *find_linear(node *list, const Uint8 *guid)
+{
+    for (; list; list = list->next) {
+        if (memcmp(list->guid, guid, 16) == 0) {
+            return list;
+        }
+    }
+    return NULL;
+}
+
+int main(int argc, char **argv)
+{
+    int lookups = atoi(argv[1]);
+    int count = 0, i, j, found_linear = 0, found_hash = 0;
+    node *list = NULL;
+    Uint8 (*probes)[16];
+    double start, parse_s, linear_s, hash_s;
+    unsigned seed = 1;
+
+    start = now();
+    for (i = 0; s_ControllerMappings[i]; i++) {
+        const char *s = s_ControllerMappings[i];
+        const char *comma = strchr(s, ',');
+        node *n;
+        if (comma - s != 32) continue;
+        n = malloc(sizeof(*n));
+        for (j = 0; j < 16; j++) n->guid[j] = (nibble(s[2 * j]) << 4) | nibble(s[2 * j + 1]);
+        n->name = comma + 1;
+        if (find_linear(list, n->guid)) { free(n); continue; }
+        n->next = list;
+        list = n;
+        count++;
+    }
+    parse_s = now() - start;
+
+    /* every mapping is checked once; then random hits and misses */
+    for (i = 0; i < SDL_COMPILED_MAPPING_COUNT; i++) {
+        const SDL_CompiledControllerMapping *e = &s_CompiledControllerMappings[i];
+        if (find_linear(list, e->guid) && !SDL_PrivateFindCompiledMapping(e->guid, SDL_COMPILED_SECTIONS)) {
+            printf("FAIL: %s not found by the perfect hash\n", e->name);
+            return 1;
+        }
+    }
+
+    probes = malloc(lookups * sizeof(*probes));
+    for (i = 0; i < lookups; i++) {
+        seed = seed * 1103515245u + 12345u;
+        if (seed & 0x10000) {
+            memcpy(probes[i], s_CompiledControllerMappings[(seed >> 8) % SDL_COMPILED_MAPPING_COUNT].guid, 16);
+        } else {
+            for (j = 0; j < 16; j++) { seed = seed * 1103515245u + 12345u; probes[i][j] = seed >> 16; }
+        }
+    }
+
+    start = now();
+    for (i = 0; i < lookups; i++) found_linear += find_linear(list, probes[i]) != NULL;
+    linear_s = now() - start;
+
+    start = now();
+    for (i = 0; i < lookups; i++) found_hash += SDL_PrivateFindCompiledMapping(probes[i], SDL_COMPILED_SECTIONS) != NULL;
+    hash_s = now() - start;
+
+    if (found_linear != found_hash) {
+        printf("FAIL: linear found %d, perfect hash found %d\n", found_linear, found_hash);
+        return 1;
+    }
+    printf("%d unique GUIDs; parsing the strings at startup took %.1fms\n", count, parse_s * 1000.0);
+    printf("%d lookups (%d hits): linear %.1fns each, perfect hash %.1fns each\n",
+           lookups, found_hash, linear_s * 1e9 / lookups, hash_s * 1e9 / lookups);
+    return 0;
+}
+"""
+
+
+def benchmark(count, lookups=100000):
+    import os
+    import shutil
+    import tempfile
+    import subprocess
+    from sort_controllers import make_synthetic_db
+
+    cc = os.environ.get("CC", "cc")
+    if shutil.which(cc) is None:
+        print("benchmark needs a C compiler; set CC")
+        return 1
+
+    lines = make_synthetic_db(count)
+    start = time.perf_counter()
+    compiled = compile_db(lines, log=lambda message: None)
+    elapsed = time.perf_counter() - start
+    print("compiled %d mappings in %.1fms: %d slots, %d buckets, seed %d" %
+          (count, elapsed * 1000.0, len(compiled['slots']),
+           len(compiled['displacements']), compiled['seed']))
+
+    work_dir = tempfile.mkdtemp(suffix="_controllers")
+    try:
+        with open(os.path.join(work_dir, "db.h"), "w") as f:
+            f.writelines(lines)
+        with open(os.path.join(work_dir, "compiled.h"), "w") as f:
+            write_header(compiled, f, "synthetic database")
+        with open(os.path.join(work_dir, "bench.c"), "w") as f:
+            f.write(BENCHMARK_C)
+        exe = os.path.join(work_dir, "bench")
+        subprocess.check_call([cc, "-O2", "-o", exe, "bench.c"], cwd=work_dir)
+        return subprocess.call([exe, str(lookups)])
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="compile SDL game controller mappings to a C table")
+    parser.add_argument("filename", nargs="?", default="SDL_gamecontrollerdb.h")
+    parser.add_argument("-o", "--output", help="default: SDL_gamecontrollerdb_compiled.h")
+    parser.add_argument("--benchmark", type=int, metavar="N",
+                        help="compare lookups in a synthetic database of N mappings")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        return benchmark(args.benchmark)
+
+    import os
+    output_filename = args.output or os.path.join(os.path.dirname(args.filename),
+                                                  "SDL_gamecontrollerdb_compiled.h")
+    import io
+    with open(args.filename) as input:
+        compiled = compile_db(input)
+    output = io.StringIO()
+    write_header(compiled, output, os.path.basename(args.filename))
+
+    # left alone when unchanged, so SDL_gamecontroller.c isn't rebuilt
+    try:
+        with open(output_filename) as f:
+            unchanged = f.read() == output.getvalue()
+    except IOError:
+        unchanged = False
+    if unchanged:
+        print("%s unchanged" % output_filename)
+        return 0
+    with open(output_filename, "w") as f:
+        f.write(output.getvalue())
+    print("Finished writing %s: %d mappings, %d hash slots" %
+          (output_filename, len(compiled['entries']), len(compiled['slots'])))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
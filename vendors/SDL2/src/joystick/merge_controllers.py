@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+#
+# Script to merge SDL_GameControllerDB text files (gamecontrollerdb.txt)
+# into SDL_gamecontrollerdb.h
+#
+# The header is indexed by platform section and GUID, and the external
+# file is applied as a diff: new GUIDs are added, changed mappings are
+# updated, and anything ambiguous is reported as a conflict and left
+# alone.  Only the sections that changed are re-sorted; every other line
+# of the header is written back exactly as it was read.
+#
+# Usage:
+#   merge_controllers.py gamecontrollerdb.txt [-d SDL_gamecontrollerdb.h] [-o output]
+#   merge_controllers.py --benchmark 50000 300
+
+import sys
+import time
+import argparse
+
+from sort_controllers import Section, iter_db, split_mapping
+
+
+# platform: field -> the header section that holds its mappings
+PLATFORM_CONDITIONS = {
+    "Windows":  "#if SDL_JOYSTICK_DINPUT",
+    "Mac OS X": "#if defined(__MACOSX__)",
+    "Linux":    "#if defined(__LINUX__)",
+    "Android":  "#if defined(__ANDROID__)",
+    "iOS":      "#if defined(SDL_JOYSTICK_MFI)",
+}
+
+# GUIDs that are not hardware GUIDs have sections of their own
+SPECIAL_GUID_CONDITIONS = {
+    ("Windows", "xinput"): "#if SDL_JOYSTICK_XINPUT",
+}
+
+
+class MergeResult(object):
+    """What a merge did.  Each list holds (platform, guid, name, detail)."""
+
+    def __init__(self):
+        self.added = []
+        self.updated = []
+        self.unchanged = 0
+        self.conflicts = []
+        self.skipped = []
+        self.changed_sections = set()
+        self.sorted_sections = set()
+
+
+def read_external(lines, result):
+    """Parse SDL_GameControllerDB text lines.
+
+    Returns a list of (platform, condition, guid, line), where line is
+    the mapping as it would be written in the header, bindings sorted
+    and without the platform field.  Lines that can't be placed go in
+    result.skipped; a GUID given twice for one platform with different
+    mappings is a conflict, and the first one wins.
+    """
+    entries = []
+    seen = {}
+    for lineno, text in enumerate(lines, 1):
+        text = text.strip()
+        if len(text) == 0 or text.startswith("#"):
+            continue
+
+        fields = text.split(",")
+        platform = None
+        kept = []
+        for field in fields:
+            if field.startswith("platform:"):
+                platform = field[len("platform:"):]
+            elif field != "":
+                kept.append(field)
+
+        guid = fields[0]
+        name = fields[1] if len(fields) > 1 else ""
+        if len(kept) < 3:
+            result.skipped.append((platform, guid, name, "line %d: not a mapping" % lineno))
+            continue
+        condition = SPECIAL_GUID_CONDITIONS.get((platform, guid),
+                                                PLATFORM_CONDITIONS.get(platform))
+        if condition is None:
+            result.skipped.append((platform, guid, name,
+                                   "line %d: no section for platform '%s'" % (lineno, platform)))
+            continue
+
+        line = split_mapping('    "%s,",\n' % ",".join(kept)).line()
+        key = (condition, guid)
+        if key in seen:
+            if seen[key] != line:
+                result.conflicts.append((platform, guid, name,
+                                         "line %d: given twice with different mappings; "
+                                         "the first one is used" % lineno))
+            continue
+        seen[key] = line
+        entries.append((platform, condition, guid, line))
+    return entries
+
+
+def _guid(line):
+    return line.split(",", 1)[0].lstrip()[1:]
+
+
+def _name_key(line):
+    # the same key sort_controllers.py sorts by: the name and its comma
+    return line.split(",", 2)[1] + ","
+
+
+def _mapping_name(line):
+    return _name_key(line)[:-1]
+
+
+def merge_db(lines, external, output, keep_existing=False):
+    """Merge external mappings into the database in lines and write it
+    to output.  Returns a MergeResult.
+
+    A GUID already in the platform's section with a different mapping is
+    updated, or reported as a conflict if keep_existing is set.  A GUID
+    that is in its section more than once is always a conflict, since
+    there is no telling which entry the new mapping replaces.
+    """
+    result = MergeResult()
+    entries = read_external(external, result)
+    wanted = set(entry[1] for entry in entries)
+
+    # only the mapping list is held in memory; sections no entry targets
+    # are never split or indexed
+    items = list(iter_db(lines, log=lambda message: None, parse=False))
+
+    sections = {}
+    for item in items:
+        if isinstance(item, Section) and item.condition in wanted:
+            sections.setdefault(item.condition, []).append(item)
+
+    indexes = {}
+    def section_index(condition):
+        index = indexes.get(condition)
+        if index is None:
+            index = {}
+            for section in sections[condition]:
+                for i, line in enumerate(section.raw):
+                    index.setdefault(_guid(line), []).append((section, i))
+            indexes[condition] = index
+        return index
+
+    for platform, condition, guid, line in entries:
+        name = _mapping_name(line)
+        if condition not in sections:
+            # a platform the header has no section for yet goes last
+            section = Section(condition)
+            sections[condition] = [section]
+            close = len(items)
+            for i, item in enumerate(items):
+                if isinstance(item, str) and item.startswith("    NULL"):
+                    close = i
+            items[close:close] = [condition + "\n", section, "#endif\n"]
+
+        places = section_index(condition).get(guid, [])
+        if len(places) == 0:
+            section = sections[condition][0]
+            section.raw.append(line)
+            section_index(condition)[guid] = [(section, len(section.raw) - 1)]
+            result.added.append((platform, guid, name, ""))
+            result.changed_sections.add(section)
+            result.sorted_sections.add(section)
+            continue
+
+        if len(places) > 1:
+            result.conflicts.append((platform, guid, name,
+                                     "in the header %d times; not touched" % len(places)))
+            continue
+
+        section, i = places[0]
+        existing = section.raw[i]
+        mapping = split_mapping(existing)
+        if mapping is not None and mapping.line() == line:
+            result.unchanged += 1
+            continue
+
+        existing_name = _mapping_name(existing)
+        if existing_name == name:
+            detail = "bindings differ"
+        else:
+            detail = "named '%s'" % existing_name
+        if keep_existing:
+            result.conflicts.append((platform, guid, name, detail + "; kept"))
+            continue
+        section.raw[i] = line
+        result.updated.append((platform, guid, name, detail))
+        result.changed_sections.add(section)
+        if existing_name != name:
+            result.sorted_sections.add(section)
+
+    for item in items:
+        if not isinstance(item, Section):
+            output.write(item)
+            continue
+        if item in result.sorted_sections:
+            # stable, like sort_controllers.py: existing order breaks ties.
+            # An update that keeps the name can't move, so needs no sort.
+            item.raw.sort(key=_name_key)
+        output.write("".join(item.raw))
+    return result
+
+
+def report(result, elapsed, log=print, verbose=True):
+    for title, entries in (("add", result.added), ("update", result.updated),
+                           ("conflict", result.conflicts), ("skip", result.skipped)):
+        for platform, guid, name, detail in entries if verbose else ():
+            log("%-8s %-9s %s %s%s" % (title, platform, guid, name,
+                                       " (%s)" % detail if detail else ""))
+    log("%d added, %d updated, %d unchanged, %d conflicts, %d skipped; "
+        "%d sections changed, %d re-sorted, in %.1fms" %
+        (len(result.added), len(result.updated), result.unchanged,
+         len(result.conflicts), len(result.skipped), len(result.changed_sections),
+         len(result.sorted_sections), elapsed * 1000.0))
+
+
+def make_synthetic_external(db_lines, count, seed=0):
+    """Return count external mappings for db_lines: about a third updates
+    of existing Linux entries, the rest new GUIDs across platforms."""
+    import random
+    rng = random.Random(seed)
+
+    existing = []
+    in_linux = False
+    for line in db_lines:
+        if line.startswith("#"):
+            in_linux = line.startswith(PLATFORM_CONDITIONS["Linux"])
+        elif in_linux and '"' in line:
+            existing.append(line)
+
+    platforms = sorted(PLATFORM_CONDITIONS)
+    lines = ["# synthetic SDL_GameControllerDB file\n"]
+    for i in range(count):
+        if existing and i % 3 == 0:
+            mapping = split_mapping(rng.choice(existing))
+            guid, name = mapping.guid[:-1], mapping.name[:-1]
+            platform = "Linux"
+        else:
+            guid = "%032x" % rng.getrandbits(128)
+            name = "External Pad %d" % i
+            platform = rng.choice(platforms)
+        lines.append("%s,%s,a:b%d,b:b1,leftx:a0,lefty:a1,platform:%s,\n" %
+                     (guid, name, rng.randrange(16), platform))
+    return lines
+
+
+def benchmark(count, external_count):
+    import io
+    from sort_controllers import make_synthetic_db
+    db_lines = make_synthetic_db(count)
+    external = make_synthetic_external(db_lines, external_count)
+
+    start = time.perf_counter()
+    result = merge_db(db_lines, external, io.StringIO())
+    elapsed = time.perf_counter() - start
+
+    print("merged %d external mappings into %d mappings in %.1fms: "
+          "%d added, %d updated, %d conflicts, %d sections re-sorted" %
+          (external_count, count, elapsed * 1000.0, len(result.added),
+           len(result.updated), len(result.conflicts), len(result.sorted_sections)))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="merge SDL_GameControllerDB mappings into the header")
+    parser.add_argument("external", nargs="?", help="gamecontrollerdb.txt to merge")
+    parser.add_argument("-d", "--db", default="SDL_gamecontrollerdb.h",
+                        help="header to merge into (default: SDL_gamecontrollerdb.h)")
+    parser.add_argument("-o", "--output", help="default: <db>.new")
+    parser.add_argument("--keep-existing", action="store_true", default=False,
+                        help="report changed mappings as conflicts instead of updating them")
+    parser.add_argument("-q", "--quiet", action="store_true", default=False,
+                        help="only print the summary")
+    parser.add_argument("--benchmark", type=int, nargs=2, metavar=("N", "M"),
+                        help="time merging M mappings into a synthetic database of N")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(*args.benchmark)
+        return 0
+    if args.external is None:
+        parser.error("an external mapping file is required")
+
+    output_filename = args.output or args.db + ".new"
+    with open(args.db) as input:
+        db_lines = input.readlines()
+    with open(args.external) as input:
+        external = input.readlines()
+
+    start = time.perf_counter()
+    with open(output_filename, "w") as output:
+        result = merge_db(db_lines, external, output, args.keep_existing)
+    elapsed = time.perf_counter() - start
+
+    report(result, elapsed, verbose=not args.quiet)
+    print("Finished writing %s" % output_filename)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
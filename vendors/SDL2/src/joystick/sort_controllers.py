@@ -1,65 +1,289 @@
 #!/usr/bin/env python
 #
 # Script to sort the game controller database entries in SDL_gamecontroller.c
+#
+# Also importable: iter_db() parses a database one line at a time and
+# sort_db() writes it back out sorted, checking every GUID against an
+# index of all platform sections.
+#
+# Usage:
+#   sort_controllers.py [SDL_gamecontrollerdb.h] [-o output]
+#   sort_controllers.py --benchmark 50000
+
+import sys
+import time
+import argparse
+import operator
+from collections import namedtuple
+
+
+MAPPINGS_START = "static const char *s_ControllerMappings"
+
+
+class Mapping(namedtuple('Mapping', 'prefix guid name bindings suffix')):
+    """One mapping line, split into the pieces it is written back from:
 
-import re
+        prefix:   indent and opening quote
+        guid:     GUID and its comma
+        name:     controller name and its comma
+        bindings: bindings, sorted, each followed by a comma
+        suffix:   closing quote to the end of the line, minus the newline
+    """
+    __slots__ = ()
 
+    def line(self):
+        return "".join(self) + "\n"
 
-filename = "SDL_gamecontrollerdb.h"
-input = open(filename)
-output = open(filename + ".new", "w")
-parsing_controllers = False
-controllers = []
-controller_guids = {}
-split_pattern = re.compile(r'([^"]*")([^,]*,)([^,]*,)([^"]*)(".*)')
+    def guid_key(self):
+        return self.guid[:-1]
 
-def save_controller(line):
-    global controllers
-    match = split_pattern.match(line)
-    entry = [ match.group(1), match.group(2), match.group(3) ]
-    bindings = sorted(match.group(4).split(","))
-    if (bindings[0] == ""):
+
+class Section(object):
+    """The mappings between two flush points (#endif, #else, #elif or the
+    closing NULL).  condition is the #if line that opened it, or None.
+    raw holds the mapping lines as read, in file order."""
+    __slots__ = ('condition', 'mappings', 'raw')
+
+    def __init__(self, condition=None):
+        self.condition = condition
+        self.mappings = []
+        self.raw = []
+
+
+def split_mapping(line):
+    """Split a database line into a Mapping, or return None if it is not
+    one.  Bindings are sorted.  Finds the same pieces as the regex
+    ([^"]*")([^,]*,)([^,]*,)([^"]*)(".*) with plain string searches."""
+    prefix, quote, rest = line.partition('"')
+    guid, comma, rest = rest.partition(',')
+    name, name_comma, rest = rest.partition(',')
+    bindings, close_quote, suffix = rest.partition('"')
+    if not (quote and comma and name_comma and close_quote):
+        return None
+
+    bindings = bindings.split(",")
+    bindings.sort()
+    # only the empty string from the trailing comma is dropped
+    if bindings[0] == "":
         bindings.pop(0)
-    entry.extend(",".join(bindings) + ",")
-    entry.append(match.group(5))
-    controllers.append(entry)
-
-def write_controllers():
-    global controllers
-    global controller_guids
-    for entry in sorted(controllers, key=lambda entry: entry[2]):
-        line = "".join(entry) + "\n"
-        if not line.endswith(",\n") and not line.endswith("*/\n"):
-            print("Warning: '%s' is missing a comma at the end of the line" % (line))
-        if (entry[1] in controller_guids):
-            print("Warning: entry '%s' is duplicate of entry '%s'" % (entry[2], controller_guids[entry[1]][2]))
-        controller_guids[entry[1]] = entry
 
-        output.write(line)
-    controllers = []
-    controller_guids = {}
-
-for line in input:
-    if (parsing_controllers):
-        if (line.startswith("{")):
-            output.write(line)
-        elif (line.startswith("    NULL")):
-            parsing_controllers = False
-            write_controllers()
-            output.write(line)
-        elif (line.startswith("#if")):
-            print("Parsing " + line.strip())
-            output.write(line)
-        elif (line.startswith("#endif")):
-            write_controllers()
-            output.write(line)
+    return Mapping(prefix + '"',
+                   guid + ",",
+                   name + ",",
+                   ",".join(bindings) + ",",
+                   '"' + suffix.split("\n", 1)[0])
+
+
+def iter_db(lines, log=print, parse=True):
+    """Parse database lines one at a time.
+
+    Yields each line outside the mapping list, and each #if, #endif and
+    brace line inside it, as a str.  Mappings are collected into a
+    Section, which is yielded whole just before the line that closes
+    it.  Only one section is held at a time.
+
+    With parse=False mapping lines are only collected into section.raw,
+    not split, and any line with a quote in it counts as a mapping.
+    """
+    in_mappings = False
+    section = Section()
+
+    for line in lines:
+        if not in_mappings:
+            if line.startswith(MAPPINGS_START):
+                in_mappings = True
+            yield line
+            continue
+
+        first = line[:1]
+        # most lines are mappings, indented; only test the rest for
+        # directives
+        if first != " " or line.startswith("    NULL"):
+            if first == "{":
+                yield line
+                continue
+            elif line.startswith("    NULL"):
+                in_mappings = False
+                yield section
+                section = Section()
+                yield line
+                continue
+            elif line.startswith("#if"):
+                log("Parsing " + line.strip())
+                # anything collected before an #if sorts into its section
+                section.condition = line.strip()
+                yield line
+                continue
+            elif line.startswith("#endif"):
+                yield section
+                section = Section()
+                yield line
+                continue
+            elif line.startswith("#el"):
+                log("Parsing " + line.strip())
+                yield section
+                section = Section(line.strip())
+                yield line
+                continue
+            # anything else is taken as a mapping, indented or not
+
+        if not parse:
+            if '"' in line:
+                section.raw.append(line)
+            else:
+                yield line
+            continue
+        mapping = split_mapping(line)
+        if mapping is None:
+            log("Warning: '%s' is not a mapping; kept as is" % line.rstrip("\n"))
+            yield line
         else:
-            save_controller(line)
-    else:
-        if (line.startswith("static const char *s_ControllerMappings")):
-            parsing_controllers = True
+            section.mappings.append(mapping)
+            section.raw.append(line)
+
+    # unterminated mapping list
+    if len(section.raw) != 0:
+        yield section
+
+
+def sort_section(section):
+    """Sort a section's mappings by name, stably, in place."""
+    section.mappings.sort(key=operator.itemgetter(2))
+
 
+class DuplicateIndex(object):
+    """GUID -> [(section condition, name), ...] over every section seen."""
+
+    def __init__(self):
+        self.guids = {}
+        self._multi_section = set()
+
+    def add(self, section):
+        """Index section's mappings.  Returns a list of (mapping, earlier
+        name) for each GUID that is repeated within section itself."""
+        repeats = []
+        seen = {}
+        for mapping in section.mappings:
+            guid = mapping.guid
+            if guid in seen:
+                repeats.append((mapping, seen[guid]))
+            seen[guid] = mapping.name
+
+            places = self.guids.get(guid)
+            if places is None:
+                self.guids[guid] = [(section.condition, mapping.name)]
+            else:
+                if places[0][0] != section.condition:
+                    self._multi_section.add(guid)
+                places.append((section.condition, mapping.name))
+        return repeats
+
+    def cross_section(self):
+        """Yield (guid, [(condition, name), ...]) for every GUID found in
+        more than one section."""
+        for guid in sorted(self._multi_section):
+            yield (guid, self.guids[guid])
+
+
+def write_section(section, output, index, log=print):
+    sort_section(section)
+    for mapping, earlier_name in index.add(section):
+        log("Warning: entry '%s' is duplicate of entry '%s'" % (mapping.name, earlier_name))
+
+    for mapping in section.mappings:
+        line = mapping.line()
+        if not line.endswith(",\n") and not line.endswith("*/\n"):
+            log("Warning: '%s' is missing a comma at the end of the line" % (line))
         output.write(line)
 
-output.close()
-print("Finished writing %s.new" % filename)
+
+def sort_db(lines, output, log=print):
+    """Write the database in lines to output with every section sorted.
+    Returns the DuplicateIndex built along the way."""
+    index = DuplicateIndex()
+    for item in iter_db(lines, log):
+        if isinstance(item, Section):
+            write_section(item, output, index, log)
+        else:
+            output.write(item)
+
+    for guid, places in index.cross_section():
+        log("Note: %s is in %d sections: %s" % (guid[:-1], len(places),
+            "; ".join("%s (%s)" % (condition, name[:-1]) for condition, name in places)))
+    return index
+
+
+def make_synthetic_db(count, seed=0):
+    """Return the lines of a database with count mappings spread over
+    several platform sections, with about 1% repeated GUIDs."""
+    import random
+    rng = random.Random(seed)
+
+    buttons = ["a", "b", "x", "y", "back", "guide", "start", "leftshoulder",
+               "rightshoulder", "leftstick", "rightstick", "dpup", "dpdown",
+               "dpleft", "dpright"]
+    axes = ["leftx", "lefty", "rightx", "righty", "lefttrigger", "righttrigger"]
+    conditions = ["#if SDL_JOYSTICK_XINPUT", "#if SDL_JOYSTICK_DINPUT",
+                  "#if defined(__MACOSX__)", "#if defined(__LINUX__)",
+                  "#if defined(__ANDROID__)", "#if defined(SDL_JOYSTICK_MFI)",
+                  "#if defined(SDL_JOYSTICK_EMSCRIPTEN)", "#if defined(__FREEBSD__)"]
+
+    lines = ["/* synthetic controller database */\n",
+             MAPPINGS_START + " [] =\n", "{\n"]
+    guids = []
+    per_section = count // len(conditions)
+    for i, condition in enumerate(conditions):
+        lines.append(condition + "\n")
+        n = per_section if i != len(conditions) - 1 else count - per_section * i
+        for j in range(n):
+            if guids and rng.random() < 0.01:
+                guid = rng.choice(guids)
+            else:
+                guid = "%032x" % rng.getrandbits(128)
+                guids.append(guid)
+            name = "Gamepad %d-%d" % (rng.randrange(100000), j)
+            bindings = ["%s:b%d" % (b, k) for k, b in enumerate(buttons)]
+            bindings += ["%s:a%d" % (a, k) for k, a in enumerate(axes)]
+            rng.shuffle(bindings)
+            lines.append('    "%s,%s,%s,",\n' % (guid, name, ",".join(bindings)))
+        lines.append("#endif\n")
+    lines += ["    NULL\n", "};\n"]
+    return lines
+
+
+def benchmark(count):
+    import io
+    lines = make_synthetic_db(count)
+    messages = []
+
+    start = time.perf_counter()
+    output = io.StringIO()
+    sort_db(lines, output, messages.append)
+    elapsed = time.perf_counter() - start
+
+    print("sorted %d mappings (%d lines) in %.1fms: %.0f mappings/s, %d messages" %
+          (count, len(lines), elapsed * 1000.0, count / elapsed, len(messages)))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="sort SDL game controller mappings")
+    parser.add_argument("filename", nargs="?", default="SDL_gamecontrollerdb.h")
+    parser.add_argument("-o", "--output", help="default: <filename>.new")
+    parser.add_argument("--benchmark", type=int, metavar="N",
+                        help="time sorting a synthetic database of N mappings")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return 0
+
+    output_filename = args.output or args.filename + ".new"
+    with open(args.filename) as input:
+        with open(output_filename, "w") as output:
+            sort_db(input, output)
+    print("Finished writing %s" % output_filename)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
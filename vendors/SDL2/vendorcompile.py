@@ -9,9 +9,20 @@ from os.path import join as path_join
 xxxROOT = None
 xxxBIN  = None
 
+def compile_controller_db(builder):
+    # SDL_gamecontroller.c includes the table compiled from the
+    # mappings in SDL_gamecontrollerdb.h
+    joystick_dir = path_join('src', 'joystick')
+    builder.shell([sys.executable,
+                   path_join(joystick_dir, 'compile_controllers.py'),
+                   path_join(joystick_dir, 'SDL_gamecontrollerdb.h')],
+                  stage='compile_controllers')
+
+
 def build_windows(lib_name, builder):
     arch = builder.get_arch()
     builder.set_rootdir(path_join(xxxROOT, 'vendors', lib_name))
+    compile_controller_db(builder)
 
     sln_name = os.path.normpath("VisualC/SDL_VS2008.sln")
     builder.devenv_upgrade(sln_name)
@@ -72,6 +83,7 @@ def build_macos(libname, builder):
 def build_linux_or_macos(lib_name, builder):
     builder.verify_environment()
     builder.set_rootdir(path_join(xxxROOT, 'vendors', lib_name))
+    compile_controller_db(builder)
     builder.set_arch_environment(xxxROOT)
     builder.verify_environment()
     builder.configure(install_to_temp=True)
@@ -27,6 +27,9 @@ def compile_vendor( vendor, cli ):
     if cli.options.force_clang:
         cmd.append( '--force-clang' )
 
+    if cli.options.reproducible:
+        cmd.append( '--reproducible' )
+
     print(' '.join( cmd ))
 
     try: